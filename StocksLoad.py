@@ -1,5 +1,6 @@
-import psycopg2
-import zipfile
+import time
+import stockscopy
+import stocksdb
 '''
 @author-name:rishab katta
 @author-name: milind kamath
@@ -15,15 +16,20 @@ Dataset link: https://www.kaggle.com/ehallmar/daily-historical-stock-prices-1970
 
 class DatabaseConnection:
 
-    def __init__(self, h,db,username, pwd):
+    def __init__(self, h,db,username, pwd, pool=None):
         try:
-            self.connection = psycopg2.connect(host=str(h), database=str(db), user=str(username), password=str(pwd))
+            self.pg_params = dict(host=str(h), database=str(db), user=str(username), password=str(pwd))
+            # connections come from a stocksdb.ConnectionPool, shared with the other phases when one is passed in
+            self.pool = pool if pool is not None else stocksdb.ConnectionPool(self.pg_params)
+            self.connection = self.pool.getconn(autocommit=True)
             # self.connection = psycopg2.connect(host="localhost", database="stocks", user="user101", password="abcde")
-            self.connection.autocommit=True
             self.cursor=self.connection.cursor()
         except Exception as e:
             print(getattr(e, 'message', repr(e)))
-            print(getattr(e, 'message', str(e)))
+            raise
+
+    def close(self):
+        self.pool.putconn(self.connection)
 
     def create_tables(self):
 
@@ -34,18 +40,32 @@ class DatabaseConnection:
                             "close_price float, adj_close_price float, low_price float, high_price float, volume BIGINT, "
                             "stock_date DATE, FOREIGN KEY(ticker) REFERENCES Company(ticker))")
 
-    def insert_tables(self, path):
-
-        file=str(path) + "historical_stocks.csv"
-        self.cursor.execute("COPY company(ticker, exchange, company_name, sector,"
-                          " industry) FROM %s DELIMITER ',' CSV HEADER", (file,))
+    def insert_tables(self, path, chunk_size=stockscopy.CHUNK_SIZE, workers=1):
+        # client-side COPY FROM STDIN: no SUPERUSER needed and the prices csv is streamed out of the zip
+        # chunk_size bytes at a time instead of being extracted to disk first. With workers > 1 the prices
+        # are loaded over that many concurrent COPY streams, each on its own connection
 
-        with zipfile.ZipFile(str(path) +"historical_stock_prices.csv.zip", "r") as zip_ref:
-            zip_ref.extractall(str(path))
+        with stocksdb.session(self.cursor, stocksdb.BULK_SETTINGS):
+            rows = stockscopy.copy_file(self.cursor, str(path) + "historical_stocks.csv", "company",
+                                        stockscopy.COMPANY_COLUMNS, chunk_size)
+            print("Total number of rows inserted into company: " + str(rows))
 
-        file = str(path) + "historical_stock_prices.csv"
-        self.cursor.execute("COPY historical_stock_price(ticker, open_price, close_price, adj_close_price,"
-                            " low_price, high_price, volume, stock_date) FROM %s DELIMITER ',' CSV HEADER", (file,))
+            zip_path = str(path) + "historical_stock_prices.csv.zip"
+            if workers > 1:
+                start = time.time()
+                # the workers get connections of their own, so their number doesn't depend on how the pool was sized
+                results = stockscopy.parallel_copy_from_zip(
+                    lambda: stocksdb.connect(self.pg_params, stocksdb.BULK_SETTINGS), zip_path,
+                    "historical_stock_prices.csv", "historical_stock_price", stockscopy.PRICE_COLUMNS, workers,
+                    chunk_size)
+                for n, (rows, seconds) in enumerate(results):
+                    print("Worker", n, "inserted", rows, "rows at", round(rows / seconds if seconds else 0), "rows/sec")
+                rows = sum(rows for rows, seconds in results)
+                print("Time taken for parallel load", time.time() - start, "seconds")
+            else:
+                rows = stockscopy.copy_from_zip(self.cursor, zip_path, "historical_stock_prices.csv",
+                                                "historical_stock_price", stockscopy.PRICE_COLUMNS, chunk_size)
+            print("Total number of rows inserted into historical_stock_price: " + str(rows))
 
 if __name__ == '__main__':
     h = str(input("Enter host name"))
@@ -53,7 +73,8 @@ if __name__ == '__main__':
     username = str(input("Enter username"))
     pwd = str(input("Enter password"))
     path = str(input("Enter Path except the file name - example- C:/users/files/"))
+    workers = int(input("Enter number of parallel COPY workers for historical_stock_price") or 1)
 
     database_connection = DatabaseConnection(h, db, username, pwd)
     database_connection.create_tables()
-    database_connection.insert_tables(path)
\ No newline at end of file
+    database_connection.insert_tables(path, workers=workers)
\ No newline at end of file
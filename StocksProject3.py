@@ -10,47 +10,118 @@ NOTE: This code assumes that there's already stocks relational database with mod
 '''
 
 import psycopg2
+import psycopg2.extras
 import time
 import itertools
+import stocksdb
+import stocksmining
+
+# data quality rules of cleaning_data(): name, condition on a scanned row, whether matching rows are deleted
+QUALITY_RULES = [('null open_price', "open_price is null", True),
+                 ('null close_price', "close_price is null", True),
+                 ('invalid ticker', "ticker is null or ticker ilike 'n/a'", True),
+                 ('duplicate ticker and date', "stock_date = previous_date", True),
+                 ('null stock_date', "stock_date is null", False),
+                 ('non-positive price', "least(open_price, close_price, adj_close_price, low_price, high_price) <= 0",
+                  False),
+                 ('high below low', "high_price < low_price", False)]
+
+QUALITY_COLUMNS = ['ticker', 'open_price', 'close_price', 'adj_close_price', 'low_price', 'high_price', 'volume',
+                   'stock_date']
+
+# materialized views built by integrating_data(), in refresh order
+INTEGRATION_VIEWS = ['finance_companies', 'tech_companies', 'fin_tech_companies']
+
+# checksum of everything the integration views are built from
+SOURCE_CHECKSUM = "md5(concat((select string_agg(c::text, '|' order by ticker) from company c), '#', " \
+                  "(select string_agg(s::text, '|' order by id) from sector s), '#', " \
+                  "(select string_agg(i::text, '|' order by id) from industry i)))"
 
 
 class DatabaseConnection:
 
-    def __init__(self,h,db,username,pwd):
+    def __init__(self,h,db,username,pwd,pool=None):
         '''
         Constructor is used to connect to the database
         :param h: hostname
         :param db: database name
         :param username: Username
         :param pwd: password
+        :param pool: stocksdb.ConnectionPool to share with the other phases, None to open one
         '''
         try:
-            self.connection = psycopg2.connect(host=str(h), database=str(db), user=str(username), password=str(pwd))
+            self.pool = pool if pool is not None else stocksdb.ConnectionPool(
+                dict(host=str(h), database=str(db), user=str(username), password=str(pwd)))
+            self.connection = self.pool.getconn(autocommit=True)
             # self.connection = psycopg2.connect(host="localhost", database="stocks", user="user2", password="abcde")
-            self.connection.autocommit=True
             self.cursor=self.connection.cursor()
         except Exception as e:
             print(getattr(e, 'message', repr(e)))
-            print(getattr(e, 'message', str(e)))
+            raise
 
-    def cleaning_data(self):
-        # Deleting rows from historical_stock_price where open_price or close price is null because we're going to be performing calculations on them when we mine.
-        self.cursor.execute("Delete from historical_stock_price where open_price is null") # 0 rows deleted
-
-        self.cursor.execute("Delete from historical_stock_price where close_price is null") # 0 rows deleted
-
-        #not null constraint for future addition of rows
-        self.cursor.execute("ALTER TABLE historical_stock_price ALTER COLUMN open_price SET NOT NULL, ALTER COLUMN close_price SET NOT NULL")
-
-        # There's a foreign key condition on ticker column of historical_stock_price to ticker of Company where ticker is Primary Key in Company.
-        self.cursor.execute("Delete from historical_stock_price where ticker is null or ticker ilike 'n/a'") # 0 rows deleted
+    def close(self):
+        '''
+        Give the connection back to the pool
+        :return: None
+        '''
+        self.pool.putconn(self.connection)
 
-        #Checking if all rows have the right date format.
-        self.cursor.execute("select ( SELECT count(to_char(stock_date,'%Y-%m-%d')) AS niceDate FROM historical_stock_price "
-                            ") - (SELECT count(*) from historical_stock_price) as total_count")
-        rows = self.cursor.fetchone()
-        if rows[0] == 0:
+    def cleaning_data(self, max_gap_days=7):
+        '''
+        Check historical_stock_price against QUALITY_RULES with a single scan and delete the rows of the deleting rules
+        with a single statement. The scan reads every row once, ordered by ticker and date for the duplicate and gap
+        checks, counts the nulls of every column and the rows of every rule, and keeps the ids of the rows to delete in
+        a temporary table.
+        :param max_gap_days: consecutive dates of a ticker further apart than this are reported as a gap
+        :return: report dictionary with the rows scanned, nulls per column, rows per rule, date gaps and timings
+        '''
+        deleting = [condition for name, condition, delete in QUALITY_RULES if delete]
+        flags = ", ".join("(" + condition + ") is true as rule" + str(n) for n, (name, condition, delete)
+                          in enumerate(QUALITY_RULES))
+        counts = ", ".join(["count(*)"] + ["count(*) - count(" + column + ")" for column in QUALITY_COLUMNS] +
+                           ["count(*) filter (where rule" + str(n) + ")" for n in range(len(QUALITY_RULES))] +
+                           ["count(*) filter (where gap > %s)", "max(gap)"])
+
+        start = time.time()
+        self.cursor.execute("drop table if exists quality_deletes")
+        self.cursor.execute("create temp table quality_deletes(id bigint)")
+        self.cursor.execute("with scanned as (select id, ticker, open_price, close_price, adj_close_price, low_price, "
+                            "high_price, volume, stock_date, lag(stock_date) over (partition by ticker "
+                            "order by stock_date, id) as previous_date from historical_stock_price), "
+                            "flagged as (select *, " + flags + ", stock_date - previous_date as gap from scanned), "
+                            "deletes as (insert into quality_deletes select id from flagged where " +
+                            " or ".join("(" + condition + ") is true" for condition in deleting) + ") "
+                            "select " + counts + " from flagged", (max_gap_days,))
+        row = self.cursor.fetchone()
+        scan = time.time() - start
+
+        report = {'rows': row[0], 'nulls': dict(zip(QUALITY_COLUMNS, row[1:len(QUALITY_COLUMNS) + 1])),
+                  'rules': dict((name, row[len(QUALITY_COLUMNS) + 1 + n])
+                                for n, (name, condition, delete) in enumerate(QUALITY_RULES)),
+                  'date_gaps': row[-2], 'largest_gap_days': row[-1], 'scan_seconds': scan}
+        print("Scanned", report['rows'], "rows in", scan, "seconds")
+        for column in QUALITY_COLUMNS:
+            print("Nulls in " + column + ": " + str(report['nulls'][column]))
+        print("Date gaps longer than", max_gap_days, "days:", report['date_gaps'], "largest:", report['largest_gap_days'])
+
+        start = time.time()
+        self.cursor.execute("delete from historical_stock_price h using quality_deletes d where h.id = d.id")
+        report['deleted'] = self.cursor.rowcount
+        report['delete_seconds'] = time.time() - start
+        self.cursor.execute("drop table quality_deletes")
+        for name, condition, delete in QUALITY_RULES:
+            print("Rule " + name + ": " + str(report['rules'][name]) + " rows " + ("deleted" if delete else "reported"))
+        print("Deleted", report['deleted'], "rows in one statement in", report['delete_seconds'], "seconds")
+
+        # the scan has just shown no nulls are left, so the constraint for future rows is added NOT VALID instead of
+        # having SET NOT NULL scan the table once more
+        self.cursor.execute("ALTER TABLE historical_stock_price DROP CONSTRAINT IF EXISTS prices_not_null")
+        self.cursor.execute("ALTER TABLE historical_stock_price ADD CONSTRAINT prices_not_null "
+                            "CHECK (open_price IS NOT NULL AND close_price IS NOT NULL) NOT VALID")
+
+        if report['nulls']['stock_date'] == 0:
             print("All Dates are in right format")
+        return report
 
     def integrating_data(self):
 
@@ -72,6 +143,38 @@ class DatabaseConnection:
                             "union "
                             "select * from tech_companies")
 
+        # unique indexes are what REFRESH MATERIALIZED VIEW CONCURRENTLY needs to diff the old and new contents
+        for view in INTEGRATION_VIEWS:
+            self.cursor.execute("create unique index " + view + "_ticker_idx on " + view + " (ticker)")
+
+        self.cursor.execute("create table if not exists integration_state(checksum varchar, refreshed_at timestamp)")
+        self.cursor.execute("delete from integration_state")
+        self.cursor.execute("insert into integration_state select " + SOURCE_CHECKSUM + ", now()")
+
+    def refresh_integration(self):
+        '''
+        Bring finance_companies, tech_companies and fin_tech_companies up to date without blocking readers. The views are
+        refreshed CONCURRENTLY, and not at all when company, sector and industry have the same checksum as at the last
+        refresh. Creates the views with integrating_data() if they don't exist yet.
+        :return: True if the views were created or refreshed, False if they were already up to date
+        '''
+        self.cursor.execute("select to_regclass('fin_tech_companies'), to_regclass('integration_state')")
+        if None in self.cursor.fetchone():
+            self.cursor.execute("DROP MATERIALIZED VIEW IF EXISTS fin_tech_companies, finance_companies, tech_companies")
+            self.integrating_data()
+            return True
+
+        self.cursor.execute("select " + SOURCE_CHECKSUM + ", (select checksum from integration_state)")
+        checksum, last_checksum = self.cursor.fetchone()
+        if checksum == last_checksum:
+            print("company, sector and industry unchanged, skipping refresh")
+            return False
+
+        for view in INTEGRATION_VIEWS:
+            self.cursor.execute("REFRESH MATERIALIZED VIEW CONCURRENTLY " + view)
+        self.cursor.execute("update integration_state set checksum = %s, refreshed_at = now()", (checksum,))
+        return True
+
 
     def popular_fintech_companies(self):
         '''
@@ -97,9 +200,152 @@ class DatabaseConnection:
         print("Total number of rows inserted into l1: " + str(self.cursor.rowcount))
 
 
-    def generalize(self):
+    def generalize(self, min_support=5, write_tables=True, snapshot=None, events=None):
+        '''
+        Generate all levels of the lattice in memory. popular_fintech_companies is read once as date -> tickers
+        transactions and stocksmining.apriori() finds every frequent itemset level.
+        :param min_support: minimum number of days a set of tickers must surge together
+        :param write_tables: also store every level as table lN(ticker1, ..., tickerN, count) like generalize_sql()
+        :param snapshot: directory written by stocksphase2's export_snapshot() to take the surge days of finance and
+        technology companies from instead of popular_fintech_companies
+        :param events: surge events from stockssurge.extract() or stockssurge.read_events() to mine instead of
+        popular_fintech_companies, so the csv can be mined without loading it
+        :return: list of levels, level k at index k - 1, each a dictionary of sorted ticker tuple -> count
+        '''
+        print(" ")
+        print("Executing in-memory Apriori...")
+
+        if events is not None:
+            import stockssurge
+            transactions = stockssurge.transactions(events)
+        elif snapshot is not None:
+            # imported here so that phase 3 doesn't need pyarrow unless it reads a snapshot
+            import stockssnapshot
+            transactions = stockssnapshot.surge_transactions(stockssnapshot.read_table(
+                snapshot, ['ticker', 'sector', 'open_price', 'close_price', 'stock_date']))
+        else:
+            transactions = stocksmining.load_transactions(self.cursor)
+        levels = stocksmining.apriori(transactions, min_support)
+        for k, level in enumerate(levels, 1):
+            print("Total number of itemsets in l" + str(k) + ": " + str(len(level)))
+            if write_tables:
+                self.write_level(k, level)
+
+        if levels:
+            self.print_level_names(len(levels), levels[-1])
+        return levels
+
+    def write_level(self, k, level):
+        '''
+        Store a level of the lattice as table lk, replacing the rows of an lk left by an earlier run, such as the empty
+        last level of generalize_sql()
+        :param k: level number of the lattice
+        :param level: dictionary of ticker tuple -> count
+        :return: None
+        '''
+        columns = ", ".join("ticker" + str(i) + " varchar" for i in range(1, k + 1))
+        self.cursor.execute("create table if not exists l" + str(k) + "(" + columns + ", count bigint)")
+        self.cursor.execute("truncate l" + str(k))
+        psycopg2.extras.execute_values(self.cursor, "insert into l" + str(k) + " values %s",
+                                       [itemset + (count,) for itemset, count in level.items()], page_size=1000)
+
+    def print_level_names(self, k, level):
+        '''
+        Print the company names of the itemsets of a level
+        :param k: level number of the lattice
+        :param level: dictionary of ticker tuple -> count
+        :return: None
+        '''
+        self.cursor.execute("select ticker, company_name from company where ticker = any(%s)",
+                            (list(set(ticker for itemset in level for ticker in itemset)),))
+        names = dict(self.cursor.fetchall())
+
+        print("Final Level with non-empty rows is L" + str(k) + ". The Names of Companies in that level are")
+        for itemset in sorted(level):
+            print(tuple(value for ticker in itemset for value in (ticker, names.get(ticker))))
+
+    def update_lattice(self, start_date, end_date, min_support=5):
+        '''
+        Incrementally maintain popular_fintech_companies and the lN tables after new prices were loaded for the days
+        between start_date and end_date. Only the qualifying new rows are appended, counts of existing itemsets are
+        updated in place and only itemsets that may newly cross min_support are counted over the whole history, so the
+        cost follows the number of new days instead of the whole 1970-2018 history.
+        :param start_date: first newly loaded stock_date
+        :param end_date: last newly loaded stock_date
+        :param min_support: minimum number of days a set of tickers must surge together, as used to build the lattice
+        :return: None
+        '''
+        start = time.time()
+        self.cursor.execute("create index if not exists pfc_id_idx on popular_fintech_companies (id)")
+        self.cursor.execute("create index if not exists pfc_ticker_idx on popular_fintech_companies (ticker)")
+
+        self.cursor.execute("insert into popular_fintech_companies "
+                            "select hsp.id, hsp.ticker, open_price, close_price, stock_date from historical_stock_price hsp "
+                            "inner join fin_tech_companies fa on hsp.ticker= fa.ticker where close_price > open_price*1.2 "
+                            "and stock_date between %s and %s and not exists "
+                            "(select 1 from popular_fintech_companies p where p.id = hsp.id) returning stock_date, ticker",
+                            (start_date, end_date))
+        new_rows = self.cursor.fetchall()
+        print("Total number of rows inserted into PFC: " + str(len(new_rows)))
+        if not new_rows:
+            return
+
+        self.cursor.execute("select stock_date, ticker from popular_fintech_companies where stock_date = any(%s)",
+                            (list(set(row[0] for row in new_rows)),))
+        after = {}
+        for stock_date, ticker in self.cursor.fetchall():
+            after.setdefault(stock_date, set()).add(ticker)
+        before = dict((stock_date, set(tickers)) for stock_date, tickers in after.items())
+        for stock_date, ticker in new_rows:
+            before[stock_date].discard(ticker)
+
+        levels = self.load_levels()
+        existing = len(levels)
+        changes = stocksmining.update_levels(levels, after, before, min_support, self.count_support)
+
+        for k, (changed, added) in enumerate(changes, 1):
+            if k > existing:
+                self.write_level(k, added)
+            else:
+                self.update_level(k, changed, added)
+            print("l" + str(k) + ": " + str(len(changed)) + " counts updated, " + str(len(added)) + " itemsets added")
+
+        print("--- %s seconds for updating the lattice ---" % (time.time() - start))
+
+    def count_support(self, itemsets):
         '''
-        Generalized code for generating all levels of lattice
+        Count in how many days of popular_fintech_companies every itemset surged together, with one query
+        :param itemsets: list of ticker tuples, all of the same size
+        :return: dictionary of ticker tuple -> count, itemsets that never surged together are left out
+        '''
+        ids = [i for i, itemset in enumerate(itemsets) for ticker in itemset]
+        tickers = [ticker for itemset in itemsets for ticker in itemset]
+        self.cursor.execute("select cid, count(*) from (select c.cid from unnest(%s::int[], %s::varchar[]) as c(cid, ticker) "
+                            "join popular_fintech_companies p on p.ticker = c.ticker group by c.cid, p.stock_date "
+                            "having count(*) = %s) t group by cid", (ids, tickers, len(itemsets[0])))
+        return dict((itemsets[cid], count) for cid, count in self.cursor.fetchall())
+
+    def update_level(self, k, changed, added):
+        '''
+        Write the changed counts and the new itemsets of a level to the existing table lk
+        :param k: level number of the lattice
+        :param changed: dictionary of ticker tuple -> new count for itemsets already in lk
+        :param added: dictionary of ticker tuple -> count for itemsets to insert
+        :return: None
+        '''
+        columns = ", ".join("ticker" + str(i) for i in range(1, k + 1))
+        if changed:
+            condition = " and ".join("l.ticker" + str(i) + " = v.ticker" + str(i) for i in range(1, k + 1))
+            psycopg2.extras.execute_values(self.cursor, "update l" + str(k) + " as l set count = v.count from (values %s) "
+                                           "as v(" + columns + ", count) where " + condition,
+                                           [itemset + (count,) for itemset, count in changed.items()], page_size=1000)
+        if added:
+            psycopg2.extras.execute_values(self.cursor, "insert into l" + str(k) + " values %s",
+                                           [itemset + (count,) for itemset, count in added.items()], page_size=1000)
+
+    def generalize_sql(self):
+        '''
+        Generalized code for generating all levels of lattice with one self join of popular_fintech_companies per level
         :return: None
         '''
         print(" ")
@@ -185,7 +431,8 @@ class DatabaseConnection:
 
         for i in range(1,k):
             for j in range (i+1,k+1):
-                q_string4 += "pfc" + str(i) + ".ticker < pfc" + str(j) + ".ticker and "
+                # byte order, the order the incremental update of update_lattice() sorts itemsets in
+                q_string4 += "pfc" + str(i) + ".ticker < pfc" + str(j) + ".ticker collate \"C\" and "
         q_string4=q_string4.rstrip("and ")
 
         return q_string4
@@ -205,57 +452,128 @@ class DatabaseConnection:
                 q_string5 += "pfc" + str(i) + ".ticker, "
         return q_string5
 
-    def association_rules(self):
+    def association_rules(self, min_confidence=0.5, levels=None):
         '''
-        Discover Association rules for the Maximum frequent itemset.
+        Discover association rules for every frequent itemset of two or more tickers. All level counts are pulled into
+        memory with one query per lN table (or taken from the levels returned by generalize()), and confidence, lift and
+        leverage are computed from dictionary lookups.
+        :param min_confidence: fraction of the antecedent's days the whole itemset must surge on
+        :param levels: levels returned by generalize(), None to read them from the lN tables
+        :return: list of rules as returned by stocksmining.association_rules()
+        '''
+        if levels is None:
+            levels = self.load_levels()
+
+        self.cursor.execute("select count(distinct stock_date) from popular_fintech_companies")
+        transactions = self.cursor.fetchone()[0]
+
+        rules = stocksmining.association_rules(levels, transactions, min_confidence)
+        for rule in rules:
+            print(",".join(rule['antecedent']), "->", ",".join(rule['consequent']),
+                  "support:", rule['support'], "confidence: %.1f%%" % (rule['confidence'] * 100),
+                  "lift: %.2f" % rule['lift'], "leverage: %.4f" % rule['leverage'])
+        return rules
+
+    def load_levels(self):
+        '''
+        Read every level of the lattice out of the lN tables, one query per table. Itemsets are ticker tuples sorted the
+        way Python sorts strings; a table with rows in another order, such as one generalize_sql() wrote under the
+        database collation before it compared tickers bytewise, is written again in that order so update_level() finds
+        its rows.
+        :return: list of levels, level k at index k - 1, each a dictionary of ticker tuple -> count
+        '''
+        levels = []
+        while True:
+            self.cursor.execute("select to_regclass(%s)", ("l" + str(len(levels) + 1),))
+            if self.cursor.fetchone()[0] is None:
+                return levels
+            self.cursor.execute("select * from l" + str(len(levels) + 1))
+            rows = self.cursor.fetchall()
+            level = dict((tuple(sorted(row[:-1])), row[-1]) for row in rows)
+            if not level:
+                return levels
+            if any(list(row[:-1]) != sorted(row[:-1]) for row in rows):
+                self.write_level(len(levels) + 1, level)
+            levels.append(level)
+
+    def benchmark_association_rules(self, min_confidence=0.5):
+        '''
+        Time association_rules() against the per-permutation SQL version association_rules_sql()
+        :param min_confidence: fraction of the antecedent's days the whole itemset must surge on
+        :return: None
+        '''
+        start = time.time()
+        self.association_rules_sql(int(min_confidence * 100))
+        sql_time = time.time() - start
+
+        start = time.time()
+        self.association_rules(min_confidence)
+        memory_time = time.time() - start
+
+        print("--- %s seconds for SQL association rules, %s seconds in memory, %.1fx speedup ---"
+              % (sql_time, memory_time, sql_time / memory_time if memory_time else float('inf')))
+
+    def association_rules_sql(self, confidence=50):
+        '''
+        Discover Association rules for the Maximum frequent itemset, with up to three queries per permutation of every
+        L3 itemset. The count lookups are prepared statements, planned once per level table.
+        :param confidence: minimum confidence in percent
         :return: None
         '''
         self.cursor.execute("select ticker1, ticker2, ticker3 from L3")
         rows = self.cursor.fetchall()
-        confidence = 50
 
         for row in rows:
             for L in range(0, len(row) + 1):
                 for subset in itertools.permutations(row, L):
                     if len(subset) > 1:
                         if len(subset)<3:
-                            self.cursor.execute("select count from l" + str(len(subset))+ " where ticker1 ilike \'" + str(subset[0]) +"\' and ticker2 ilike \'" + str(subset[1])+ "\'")
-                            numer = self.cursor.fetchone()
-                            self.cursor.execute("select count from l" + str(len(subset)-1) + " where ticker1 ilike \'" + str(subset[0]) + "\'")
-                            denom = self.cursor.fetchone()
+                            numer = self.level_count(subset[:2])
+                            denom = self.level_count(subset[:1])
                             if numer is not None and denom is not None:
                                 if (numer[0]/denom[0]) * 100 > confidence:
                                         print(subset[0], "->", subset[1])
                         else:
-                            col1= str(subset[0])
-                            col2= str(subset[1])
-                            col3 = str(subset[2])
-                            self.cursor.execute("select count from l" + str(len(subset))+ " where ticker1 ilike \'" + col1 +"\' and ticker2 ilike \'" + col2 + "\' and ticker3 ilike \'" + col3 + "\'")
-                            numer = self.cursor.fetchone()
-                            self.cursor.execute("select count from l" + str(len(subset) - 2) + " where ticker1 ilike \'" + col1 + "\'")
-                            denom = self.cursor.fetchone()
+                            numer = self.level_count(subset[:3])
+                            denom = self.level_count(subset[:1])
                             if numer is not None and denom is not None:
                                 if (numer[0]/denom[0]) * 100 > confidence:
                                     print(subset[0], "->", subset[1] + "," + subset[2])
 
-                            self.cursor.execute("select count from l" + str(len(subset) - 1) + " where ticker1 ilike \'" + col1 + "\'" + " and ticker2 ilike \'" + col2 + "\'")
-                            denom = self.cursor.fetchone()
+                            denom = self.level_count(subset[:2])
                             if numer is not None and denom is not None:
                                 if (numer[0] / denom[0]) * 100 > confidence:
                                     print(subset[0] + "," + subset[1] + "->" + subset[2])
 
+    def level_count(self, itemset):
+        '''
+        Look up the count of an itemset in its level table
+        :param itemset: tuple of tickers, matched case-insensitively
+        :return: (count,) row, None if the itemset is not in the table
+        '''
+        k = len(itemset)
+        condition = " and ".join("ticker" + str(i) + " ilike %s" for i in range(1, k + 1))
+        stocksdb.execute_prepared(self.cursor, "level_count_l" + str(k),
+                                  "select count from l" + str(k) + " where " + condition, tuple(map(str, itemset)))
+        return self.cursor.fetchone()
+
     def drop_tables_with_pfc(self):
         '''
         Drop all tables if they exist including popular_fintech_companies
         :return: None
         '''
-        self.cursor.execute("DROP TABLE IF EXISTS popular_fintech_companies, l1, l2, l3,l4 CASCADE")
+        self.cursor.execute("DROP TABLE IF EXISTS popular_fintech_companies CASCADE")
+        self.drop_tables_wo_pfc()
+
     def drop_tables_wo_pfc(self):
         '''
-        Drop all tables if they exist excluding popular_fintech_companies
+        Drop all tables if they exist excluding popular_fintech_companies, that is every level lN of the lattice
         :return: None
         '''
-        self.cursor.execute("DROP TABLE IF EXISTS l1, l2, l3,l4  CASCADE")
+        self.cursor.execute("select tablename from pg_tables where schemaname = current_schema() and tablename ~ '^l[0-9]+$'")
+        levels = [row[0] for row in self.cursor.fetchall()]
+        if levels:
+            self.cursor.execute("DROP TABLE IF EXISTS " + ", ".join(levels) + " CASCADE")
 
 
 if __name__ == '__main__':
@@ -263,6 +581,7 @@ if __name__ == '__main__':
     db = str(input("Enter Database Name"))
     username = str(input("Enter username"))
     pwd = str(input("Enter password"))
+    min_support = int(input("Enter minimum support in days for the itemsets") or 5)
     db_con =DatabaseConnection(h,db,username,pwd)
 
     db_con.drop_tables_with_pfc()
@@ -272,7 +591,7 @@ if __name__ == '__main__':
     print("--- %s seconds for cleaning data ---" % (time.time() - start_time))
     #
     start_time = time.time()
-    db_con.integrating_data()
+    db_con.refresh_integration()
     print("--- %s seconds for integrating data ---" % (time.time() - start_time))
 
     db_con.drop_tables_with_pfc()
@@ -287,12 +606,12 @@ if __name__ == '__main__':
     # print("--- %s seconds for l1 ---" % (time.time() - start_time))
 
     start_time = time.time()
-    db_con.generalize()
-    print("--- %s seconds for generalized code ---" % (time.time() - start_time))
+    levels = db_con.generalize(min_support)
+    print("--- %s seconds for in-memory Apriori ---" % (time.time() - start_time))
 
     start_time = time.time()
     print("Association Rules with more than 50 percent confidence")
-    db_con.association_rules()
+    db_con.association_rules(0.5, levels)
     print("--- %s seconds for generating association rules ---" % (time.time() - start_time))
 
 
@@ -0,0 +1,65 @@
+import os
+import uuid
+import pytest
+'''
+@author-name:rishab katta
+@author-name: milind kamath
+@author-name: Bikash Roy
+@author-name: Ankit Jain
+'''
+
+'''
+Fixtures for the tests that need a running server. They are skipped when none is reachable.
+
+Postgres is reached through STOCKS_TEST_DSN, default "host=localhost dbname=stocks_test", and every test runs in a
+scratch schema of its own that is dropped afterwards. MongoDB is reached on STOCKS_TEST_MONGO_HOST and
+STOCKS_TEST_MONGO_PORT, default localhost:27017, in a scratch database.
+'''
+
+PG_DSN = os.environ.get('STOCKS_TEST_DSN', "host=localhost dbname=stocks_test")
+MONGO_HOST = os.environ.get('STOCKS_TEST_MONGO_HOST', 'localhost')
+MONGO_PORT = int(os.environ.get('STOCKS_TEST_MONGO_PORT', 27017))
+
+
+@pytest.fixture
+def pg_connection():
+    '''
+    Autocommit psycopg2 connection whose search_path is a scratch schema
+    '''
+    psycopg2 = pytest.importorskip("psycopg2")
+    try:
+        connection = psycopg2.connect(PG_DSN, connect_timeout=3)
+    except psycopg2.OperationalError as e:
+        pytest.skip("no Postgres reachable with " + PG_DSN + ": " + str(e).strip())
+    connection.autocommit = True
+    schema = "stocks_test_" + uuid.uuid4().hex[:8]
+    cursor = connection.cursor()
+    cursor.execute("create schema " + schema)
+    cursor.execute("set search_path to " + schema)
+    try:
+        yield connection
+    finally:
+        connection.rollback()
+        connection.autocommit = True
+        connection.cursor().execute("drop schema " + schema + " cascade")
+        connection.close()
+
+
+@pytest.fixture
+def mongo_database():
+    '''
+    Scratch MongoDB database, dropped afterwards
+    '''
+    pymongo = pytest.importorskip("pymongo")
+    client = pymongo.MongoClient(MONGO_HOST, MONGO_PORT, serverSelectionTimeoutMS=2000)
+    try:
+        client.admin.command('ping')
+    except pymongo.errors.PyMongoError as e:
+        client.close()
+        pytest.skip("no mongod reachable on " + MONGO_HOST + ":" + str(MONGO_PORT) + ": " + str(e))
+    name = "stocks_test_" + uuid.uuid4().hex[:8]
+    try:
+        yield client[name]
+    finally:
+        client.drop_database(name)
+        client.close()
@@ -0,0 +1,152 @@
+import datetime
+import json
+import math
+import time
+'''
+@author-name:rishab katta
+@author-name: milind kamath
+@author-name: Bikash Roy
+@author-name: Ankit Jain
+'''
+
+'''
+Repeatable benchmark for the query workload of the stocks database.
+
+Every query is run a few times to warm the cache, then measured over a number of iterations with its results fetched.
+The report holds the latency percentiles, the number of rows returned and the EXPLAIN (ANALYZE, BUFFERS) plan of every
+query and is written as JSON, so runs with and without indexes, or before and after a change, can be compared and kept
+as a regression baseline.
+'''
+
+
+def load_queries(file):
+    '''
+    Read the select statements out of a file of ;-separated SQL such as queries_indexes_PHASEII.txt
+    :param file: path of the file
+    :return: list of (name, query)
+    '''
+    with open(str(file)) as sql_file:
+        statements = [statement.strip() for statement in sql_file.read().split(';')]
+    selects = [statement for statement in statements if statement.lower().startswith('select')]
+    return [("File query " + str(i), query) for i, query in enumerate(selects, 1)]
+
+
+def percentile(latencies, p):
+    '''
+    :param latencies: list of seconds
+    :param p: percentile between 0 and 100
+    :return: nearest-rank percentile of latencies
+    '''
+    ordered = sorted(latencies)
+    return ordered[max(0, int(math.ceil(p / 100.0 * len(ordered))) - 1)]
+
+
+def run_query(cursor, query, iterations=10, warmup=2):
+    '''
+    Benchmark one query
+    :param cursor: psycopg2 cursor
+    :param query: select statement
+    :param iterations: number of measured executions
+    :param warmup: number of executions before measuring
+    :return: dictionary with the latencies, their p50, p95 and p99, rows returned and the query plan
+    '''
+    for i in range(warmup):
+        cursor.execute(query)
+        cursor.fetchall()
+
+    latencies = []
+    rows = 0
+    for i in range(iterations):
+        start = time.perf_counter()
+        cursor.execute(query)
+        rows = len(cursor.fetchall())
+        latencies.append(time.perf_counter() - start)
+
+    cursor.execute("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + query)
+    plan = cursor.fetchone()[0]
+
+    return {'query': query, 'rows': rows, 'latencies': latencies, 'mean': sum(latencies) / len(latencies),
+            'p50': percentile(latencies, 50), 'p95': percentile(latencies, 95), 'p99': percentile(latencies, 99),
+            'plan': plan}
+
+
+def run(cursor, queries, label, iterations=10, warmup=2):
+    '''
+    Benchmark a workload
+    :param cursor: psycopg2 cursor
+    :param queries: list of (name, query)
+    :param label: description of the run, example- with index
+    :param iterations: number of measured executions per query
+    :param warmup: number of executions per query before measuring
+    :return: report dictionary
+    '''
+    report = {'label': label, 'started_at': datetime.datetime.now().isoformat(), 'iterations': iterations,
+              'warmup': warmup, 'queries': {}}
+    for name, query in queries:
+        result = run_query(cursor, query, iterations, warmup)
+        report['queries'][name] = result
+        print(name, "p50:", round(result['p50'], 4), "p95:", round(result['p95'], 4), "p99:", round(result['p99'], 4),
+              "seconds,", result['rows'], "rows")
+    return report
+
+
+def write_report(report, path):
+    '''
+    Write a report as JSON
+    '''
+    with open(str(path), 'w') as report_file:
+        json.dump(report, report_file, indent=2)
+
+
+def read_report(path):
+    '''
+    Read a report written by write_report()
+    '''
+    with open(str(path)) as report_file:
+        return json.load(report_file)
+
+
+def compare(baseline, current, tolerance=0.2):
+    '''
+    Print the p50 and p95 of every query of two reports side by side, marking the regressions: queries whose p50 grew
+    by more than tolerance, or that returned a different number of rows
+    :param baseline: report of the earlier or reference run
+    :param current: report of the run to check
+    :param tolerance: fraction by which the p50 may grow before the query counts as a regression
+    :return: list of names of the queries that regressed
+    '''
+    regressions = []
+    print("Query", baseline['label'], "p50/p95(s)", current['label'], "p50/p95(s)", "speedup")
+    for name, result in current['queries'].items():
+        if name not in baseline['queries']:
+            continue
+        before = baseline['queries'][name]
+        speedup = before['p50'] / result['p50'] if result['p50'] else float('inf')
+        slower = result['p50'] > before['p50'] * (1 + tolerance)
+        rows_changed = result['rows'] != before['rows']
+        print(name, round(before['p50'], 4), round(before['p95'], 4), round(result['p50'], 4), round(result['p95'], 4),
+              str(round(speedup, 2)) + "x", "REGRESSION" if slower or rows_changed else "")
+        if rows_changed:
+            print(name, "returned", result['rows'], "rows instead of", before['rows'])
+        if slower or rows_changed:
+            regressions.append(name)
+    if regressions:
+        print(len(regressions), "of", len(current['queries']), "queries regressed beyond",
+              str(round(tolerance * 100)) + "%:", ", ".join(regressions))
+    else:
+        print("No regressions beyond", str(round(tolerance * 100)) + "%")
+    return regressions
+
+
+if __name__ == '__main__':
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description="Compare a benchmark report against a baseline report")
+    parser.add_argument('baseline', help="JSON report of the reference run")
+    parser.add_argument('current', help="JSON report of the run to check")
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help="fraction by which a query's p50 may grow before it counts as a regression")
+    options = parser.parse_args()
+    # a non-zero exit status lets a script or CI job stop on a regression
+    sys.exit(1 if compare(read_report(options.baseline), read_report(options.current), options.tolerance) else 0)
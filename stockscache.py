@@ -0,0 +1,225 @@
+import collections
+import os
+import pickle
+import re
+import stocksdb
+'''
+@author-name:rishab katta
+@author-name: milind kamath
+@author-name: Bikash Roy
+@author-name: Ankit Jain
+'''
+
+'''
+Result cache for the analytical queries on the stocks database.
+
+Results are keyed on the normalized query text, its parameters and a data version stamp. The stamp changes whenever a
+statement writes to one of the tables the workload reads, through statement level triggers that bump a counter in the
+data_version table, and whenever one of those tables is dropped and created again, so a cached result is never served
+for data it wasn't computed from.
+'''
+
+VERSIONED_TABLES = ['company', 'historical_stock_price', 'sector', 'industry', 'rollup_month', 'rollup_year']
+
+# data versions, and the oid of every versioned table together with whether its trigger is in place, so a table that was
+# dropped and created again both changes the stamp and is noticed as untracked
+STAMP_QUERY = "select (select string_agg(table_name || ':' || version, ',' order by table_name) from data_version), " + \
+              ", ".join("to_regclass('" + table + "')::oid, exists(select 1 from pg_trigger where tgrelid = "
+                        "to_regclass('" + table + "') and tgname = '" + table + "_data_version')"
+                        for table in VERSIONED_TABLES)
+
+
+def install(cursor):
+    '''
+    Create the data_version table and the triggers bumping it on the versioned tables that exist. Needs to run again
+    after a versioned table is created, which the stamp notices on its own in the meantime.
+    :param cursor: psycopg2 cursor
+    :return: None
+    '''
+    cursor.execute("create table if not exists data_version(table_name varchar primary key, version bigint not null)")
+    cursor.execute("create or replace function bump_data_version() returns trigger as $$ begin "
+                   "insert into data_version values (TG_TABLE_NAME, 1) on conflict (table_name) "
+                   "do update set version = data_version.version + 1; return null; end $$ language plpgsql")
+    for table in VERSIONED_TABLES:
+        cursor.execute("select to_regclass(%s)", (table,))
+        if cursor.fetchone()[0] is None:
+            continue
+        cursor.execute("drop trigger if exists " + table + "_data_version on " + table)
+        cursor.execute("create trigger " + table + "_data_version after insert or update or delete or truncate on " +
+                       table + " for each statement execute procedure bump_data_version()")
+
+
+def reinstall(cursor):
+    '''
+    Put the triggers back after versioned tables were dropped and created again, if the cache was ever installed in this
+    database. Run inside the transaction rebuilding the tables, so no write to them goes untracked.
+    :param cursor: psycopg2 cursor
+    :return: None
+    '''
+    cursor.execute("select to_regclass('data_version')")
+    if cursor.fetchone()[0] is not None:
+        install(cursor)
+
+
+def untracked(stamp):
+    '''
+    :param stamp: row returned by STAMP_QUERY
+    :return: True if a versioned table exists without its trigger, so writes to it wouldn't change the stamp
+    '''
+    return any(oid is not None and not has_trigger for oid, has_trigger in zip(stamp[1::2], stamp[2::2]))
+
+
+def normalize(query):
+    '''
+    :return: query with runs of whitespace outside string literals collapsed and a trailing semicolon removed
+    '''
+    parts = re.split(r"('(?:[^']|'')*')", query.strip().rstrip(';').strip())
+    return "".join(part if i % 2 else re.sub(r"\s+", " ", part) for i, part in enumerate(parts))
+
+
+class QueryCache:
+    '''
+    Size-bounded LRU cache of query results with hit and miss counters, optionally persisted to a file. The file is an
+    append-only log: a miss appends the new result and an eviction a marker for the evicted key, so a miss costs one
+    record instead of rewriting the whole cache. The log is compacted once it holds more than twice the records of the
+    cache, and on close().
+    '''
+
+    def __init__(self, max_entries=128, max_rows=1000000, path=None):
+        '''
+        :param max_entries: largest number of results kept
+        :param max_rows: largest total number of rows kept over all results
+        :param path: file the cache is loaded from and saved to, None to keep it in memory only
+        '''
+        self.max_entries = max_entries
+        self.max_rows = max_rows
+        self.path = path
+        self.entries = collections.OrderedDict()
+        self.rows = 0
+        self.hits = 0
+        self.misses = 0
+        self.records = 0
+        if path is not None and os.path.exists(str(path)):
+            self.load()
+
+    def execute(self, cursor, query, params=None):
+        '''
+        Run a query through the cache
+        :param cursor: psycopg2 cursor
+        :param query: select statement
+        :param params: query parameters
+        :return: list of result rows
+        '''
+        stocksdb.execute_prepared(cursor, "data_version_stamp", STAMP_QUERY)
+        stamp = cursor.fetchone()
+        if untracked(stamp):
+            # a versioned table was rebuilt behind the cache's back; track it again before caching anything for it
+            install(cursor)
+            stocksdb.execute_prepared(cursor, "data_version_stamp", STAMP_QUERY)
+            stamp = cursor.fetchone()
+        key = (normalize(query), repr(params), stamp)
+
+        if key in self.entries:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+        self.misses += 1
+        cursor.execute(query, params)
+        result = cursor.fetchall()
+        self.store(key, result)
+        return result
+
+    def store(self, key, result):
+        '''
+        Add a result, evicting the least recently used ones beyond the bounds
+        '''
+        if len(result) > self.max_rows:
+            return
+        self.entries[key] = result
+        self.rows += len(result)
+        evicted_keys = []
+        while len(self.entries) > self.max_entries or self.rows > self.max_rows:
+            evicted_key, evicted = self.entries.popitem(last=False)
+            self.rows -= len(evicted)
+            evicted_keys.append(evicted_key)
+        if self.path is not None:
+            self.append([(key, result)] + [(evicted_key, None) for evicted_key in evicted_keys])
+
+    def load(self):
+        '''
+        Replay the log file: (key, result) records add a result and (key, None) records drop it. A record cut short by a
+        crash ends the replay, and the file is rewritten without it.
+        '''
+        damaged = False
+        with open(str(self.path), 'rb') as cache_file:
+            while True:
+                position = cache_file.tell()
+                try:
+                    key, result = pickle.load(cache_file)
+                except EOFError:
+                    damaged = cache_file.tell() != position or bool(cache_file.read(1))
+                    break
+                except pickle.UnpicklingError:
+                    damaged = True
+                    break
+                self.records += 1
+                if key in self.entries:
+                    self.rows -= len(self.entries.pop(key))
+                if result is not None:
+                    self.entries[key] = result
+                    self.rows += len(result)
+        while len(self.entries) > self.max_entries or self.rows > self.max_rows:
+            evicted_key, evicted = self.entries.popitem(last=False)
+            self.rows -= len(evicted)
+        if damaged:
+            self.save()
+
+    def append(self, records):
+        '''
+        Append records to the log file, compacting it when it has grown well past the cache
+        :param records: list of (key, result) tuples, result None for an evicted key
+        '''
+        if self.records + len(records) > 2 * max(len(self.entries), self.max_entries // 2, 1):
+            self.save()
+            return
+        with open(str(self.path), 'ab') as cache_file:
+            for record in records:
+                pickle.dump(record, cache_file)
+        self.records += len(records)
+
+    def save(self):
+        '''
+        Write the cache to its file as one record per result, replacing the old file only once the new one is complete
+        '''
+        with open(str(self.path) + ".tmp", 'wb') as cache_file:
+            for record in self.entries.items():
+                pickle.dump(record, cache_file)
+        os.replace(str(self.path) + ".tmp", str(self.path))
+        self.records = len(self.entries)
+
+    def close(self):
+        '''
+        Compact the file of a persisted cache
+        '''
+        if self.path is not None:
+            self.save()
+
+    def clear(self):
+        '''
+        Drop every cached result and reset the counters
+        '''
+        self.entries.clear()
+        self.rows = 0
+        self.hits = 0
+        self.misses = 0
+        if self.path is not None:
+            self.save()
+
+    def stats(self):
+        '''
+        :return: dictionary with hits, misses, hit ratio, entries and rows cached
+        '''
+        lookups = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'hit_ratio': self.hits / lookups if lookups else 0.0,
+                'entries': len(self.entries), 'rows': self.rows}
@@ -0,0 +1,374 @@
+import datetime
+import time
+import numpy as np
+'''
+@author-name:rishab katta
+@author-name: milind kamath
+@author-name: Bikash Roy
+@author-name: Ankit Jain
+'''
+
+'''
+In-process column store for historical_stock_price and the five queries of runquery().
+
+Every column is one contiguous numpy array, sorted by ticker and stock_date. offsets[i]:offsets[i + 1] are the rows of
+the i-th ticker, and a date range of every ticker at once is found with one binary search over the (ticker, date) keys,
+so any ticker and date range slice is a view. The company, exchange, sector and industry of a row are looked up through
+its ticker. The queries are vectorized kernels over those slices and return the same rows as their SQL versions.
+'''
+
+# day number standing for a null stock_date, sorting after every real date like NULLS LAST
+NULL_DAY = 2 ** 31 - 1
+
+PRICE_COLUMNS = ['open_price', 'close_price', 'adj_close_price', 'low_price', 'high_price', 'volume']
+
+PRICE_QUERY = "select ticker, open_price, close_price, adj_close_price, low_price, high_price, volume, stock_date " \
+              "from historical_stock_price where ticker is not null"
+
+# company columns after change_structure(), with sector and industry resolved to their names
+COMPANY_QUERY = "select c.ticker, c.exchange, c.company_name, s.name, i.name from company c " \
+                "left join sector s on s.id = c.sector left join industry i on i.id = c.industry order by c.ticker"
+
+EPOCH = datetime.date(1970, 1, 1)
+
+
+def day(date):
+    '''
+    :return: number of days from 1970-01-01 to date, NULL_DAY for None
+    '''
+    return NULL_DAY if date is None else (date - EPOCH).days
+
+
+def row_keys(codes, days):
+    '''
+    :return: int64 keys ordered like (ticker, stock_date), days shifted to be non-negative
+    '''
+    return (np.asarray(codes, dtype=np.int64) << 32) + (np.asarray(days, dtype=np.int64) + 2 ** 31)
+
+
+def segment_reduce(ufunc, values, starts, ends, empty):
+    '''
+    Reduce every segment values[starts[i]:ends[i]] with a numpy ufunc in one vectorized call
+    :param ufunc: np.fmax, np.add, ...
+    :param values: float array
+    :param starts: int array of segment starts, ascending
+    :param ends: int array of segment ends, ascending
+    :param empty: result for an empty segment
+    :return: float array with one result per segment
+    '''
+    result = np.full(len(starts), empty, dtype=np.float64)
+    filled = ends > starts
+    if filled.any():
+        bounds = np.column_stack([starts[filled], ends[filled]]).ravel()
+        result[filled] = ufunc.reduceat(np.append(values, empty), bounds)[::2]
+    return result
+
+
+def segment_rows(starts, ends):
+    '''
+    :return: int array with the row numbers of all segments starts[i]:ends[i], in order
+    '''
+    lengths = np.maximum(ends - starts, 0)
+    if not lengths.sum():
+        return np.zeros(0, dtype=np.int64)
+    shift = np.cumsum(lengths) - lengths
+    return np.repeat(starts - shift, lengths) + np.arange(lengths.sum())
+
+
+def group_max(groups, values, count):
+    '''
+    :return: float array with the largest non-NaN value of every group number below count, NaN for none
+    '''
+    result = np.full(count, np.nan)
+    np.fmax.at(result, groups, values)
+    return result
+
+
+class ColumnStore:
+    '''
+    historical_stock_price as numpy columns sorted by ticker and stock_date, with a ticker offset index
+    '''
+
+    def __init__(self, tickers, codes, days, columns, companies):
+        '''
+        :param tickers: list of tickers
+        :param codes: int array with the position in tickers of the ticker of every row
+        :param days: int array with the day number of the stock_date of every row, see day()
+        :param columns: dictionary of PRICE_COLUMNS name -> float array, NaN for null
+        :param companies: dictionary of ticker -> (exchange, company_name, sector, industry) of every company
+        '''
+        order = np.argsort(np.array(tickers, dtype=object))
+        rank = np.empty(len(tickers), dtype=np.int64)
+        rank[order] = np.arange(len(tickers))
+        self.tickers = [tickers[i] for i in order]
+        codes = rank[np.asarray(codes, dtype=np.int64)]
+        days = np.asarray(days, dtype=np.int64)
+
+        self.keys = row_keys(codes, days)
+        sort = np.argsort(self.keys, kind='stable')
+        self.keys = self.keys[sort]
+        self.codes = codes[sort]
+        self.days = days[sort]
+        self.columns = dict((name, np.asarray(column, dtype=np.float64)[sort]) for name, column in columns.items())
+        self.offsets = np.searchsorted(self.codes, np.arange(len(self.tickers) + 1))
+        self.index = dict((ticker, i) for i, ticker in enumerate(self.tickers))
+
+        # per ticker company attributes; a ticker missing from company has known False and drops out of every join
+        self.known = np.array([ticker in companies for ticker in self.tickers], dtype=bool)
+        attributes = [companies.get(ticker, (None, None, None, None)) for ticker in self.tickers]
+        self.exchange, self.company_name, self.sector, self.industry = \
+            [np.array([row[n] for row in attributes], dtype=object) for n in range(4)]
+        # company number of every ticker, equal for tickers sharing a company_name, for GROUP BY company_name
+        names = sorted(set(name for name, known in zip(self.company_name, self.known) if known), key=str)
+        number = dict((name, i) for i, name in enumerate(names))
+        self.names = names
+        self.company = np.array([number[name] if known else -1
+                                 for name, known in zip(self.company_name, self.known)], dtype=np.int64)
+
+    @classmethod
+    def from_rows(cls, rows, companies):
+        '''
+        :param rows: iterable of (ticker, open, close, adj close, low, high, volume, stock_date), ticker not null
+        :param companies: dictionary of ticker -> (exchange, company_name, sector, industry)
+        '''
+        position = {}
+        codes = []
+        days = []
+        values = [[] for column in PRICE_COLUMNS]
+        for row in rows:
+            codes.append(position.setdefault(row[0], len(position)))
+            days.append(day(row[7]))
+            for n in range(len(PRICE_COLUMNS)):
+                values[n].append(row[n + 1])
+        return cls(list(position), codes, days,
+                   dict((name, np.array(column, dtype=np.float64)) for name, column in zip(PRICE_COLUMNS, values)),
+                   companies)
+
+    @classmethod
+    def from_postgres(cls, connection, batch_size=100000):
+        '''
+        Load historical_stock_price and company through a server-side cursor; sorting is done in numpy afterwards
+        :param connection: psycopg2 connection not in autocommit mode, needed for the named cursor
+        :param batch_size: number of rows fetched at a time
+        '''
+        cursor = connection.cursor()
+        cursor.execute(COMPANY_QUERY)
+        companies = dict((row[0], row[1:]) for row in cursor.fetchall())
+        cursor.close()
+
+        cursor = connection.cursor(name="column_store")
+        cursor.itersize = batch_size
+        cursor.execute(PRICE_QUERY)
+        try:
+            return cls.from_rows(cursor, companies)
+        finally:
+            cursor.close()
+            connection.commit()
+
+    @classmethod
+    def from_snapshot(cls, path):
+        '''
+        Load from a snapshot written by stockssnapshot.export(), without Postgres
+        :param path: snapshot directory
+        '''
+        # imported here so that a store loaded from Postgres doesn't need pyarrow
+        import stockssnapshot
+
+        table = stockssnapshot.read_table(path)
+        codes, tickers = stockssnapshot.codes(table.column('ticker'))
+        known = codes >= 0
+        codes = codes[known]
+
+        # every row of a ticker carries the same company columns, so the first one is enough
+        tickers_found, first = np.unique(codes, return_index=True)
+        companies = dict((tickers[code], ()) for code in tickers_found)
+        for name in ['exchange', 'company_name', 'sector', 'industry']:
+            values, dictionary = stockssnapshot.codes(table.column(name))
+            values = values[known][first]
+            for code, value in zip(tickers_found, values):
+                companies[tickers[code]] += (dictionary[value] if value >= 0 else None,)
+
+        days = table.column('stock_date').cast('int32').fill_null(NULL_DAY).to_numpy()[known]
+        columns = dict((name, stockssnapshot.to_numpy(table.column(name).cast('float64').fill_null(np.nan))[known])
+                       for name in PRICE_COLUMNS)
+        return cls(tickers, codes, days, columns, companies)
+
+    def __len__(self):
+        return len(self.codes)
+
+    def ticker_range(self, ticker):
+        '''
+        :return: (start, end) rows of ticker, (0, 0) for an unknown ticker
+        '''
+        if ticker not in self.index:
+            return 0, 0
+        i = self.index[ticker]
+        return int(self.offsets[i]), int(self.offsets[i + 1])
+
+    def date_ranges(self, after=None, before=None):
+        '''
+        Rows of every ticker with after < stock_date < before, found by binary search
+        :param after: exclusive lower bound date, None for none
+        :param before: exclusive upper bound date, None for none; rows with a null stock_date are kept only when both
+        bounds are None
+        :return: (starts, ends) int arrays indexed like tickers
+        '''
+        codes = np.arange(len(self.tickers))
+        if after is None:
+            starts = self.offsets[:-1]
+        else:
+            starts = np.searchsorted(self.keys, row_keys(codes, day(after) + 1))
+        if before is None:
+            ends = self.offsets[1:] if after is None else np.searchsorted(self.keys, row_keys(codes, NULL_DAY))
+        else:
+            ends = np.searchsorted(self.keys, row_keys(codes, day(before)))
+        return np.asarray(starts), np.asarray(ends)
+
+    def slice(self, ticker, after=None, before=None):
+        '''
+        :return: dictionary of column name -> view on the rows of ticker with after < stock_date < before, stock_date
+        being numpy datetime64 days
+        '''
+        start, end = self.ticker_range(ticker)
+        days = self.days[start:end]
+        if after is not None:
+            start += int(np.searchsorted(days, day(after) + 1))
+        if before is not None:
+            end = self.ticker_range(ticker)[0] + int(np.searchsorted(days, day(before)))
+        view = dict((name, column[start:end]) for name, column in self.columns.items())
+        view['stock_date'] = self.days[start:end].astype('datetime64[D]')
+        return view
+
+    def adj_ratio(self, rows=None):
+        '''
+        :param rows: int array of row numbers, None for all rows
+        :return: ((close - adj close) / close) * 100 of the rows
+        '''
+        rows = Ellipsis if rows is None else rows
+        with np.errstate(divide='ignore', invalid='ignore'):
+            close = self.columns['close_price'][rows]
+            # a zero close gives NaN like nullif(close_price, 0) gives null in SQL
+            close = np.where(close == 0, np.nan, close)
+            return (close - self.columns['adj_close_price'][rows]) / close * 100
+
+    def matching(self, attribute, value):
+        '''
+        :return: boolean array over tickers whose attribute matches value case-insensitively, like ilike without wildcards
+        '''
+        return np.array([known and text is not None and text.lower() == value.lower()
+                         for text, known in zip(attribute, self.known)], dtype=bool)
+
+    def query1(self):
+        '''
+        Largest adjusted close gap of at least 15% per company between 2000-01-01 and 2018-12-31
+        :return: list of (company_name, MaxPercentageChange) ordered by MaxPercentageChange
+        '''
+        starts, ends = self.date_ranges(datetime.date(2000, 1, 1), datetime.date(2018, 12, 31))
+        ratio = self.adj_ratio()
+        largest = segment_reduce(np.fmax, np.where(ratio >= 15, ratio, np.nan), starts, ends, np.nan)
+        keep = self.known & ~np.isnan(largest)
+        companies = group_max(self.company[keep], largest[keep], len(self.names))
+        found = np.flatnonzero(~np.isnan(companies))
+        return sorted(((self.names[i], float(companies[i])) for i in found), key=lambda row: row[1])
+
+    def query2(self):
+        '''
+        Average open price above 30 per company, for '%Limited' companies between 1980-01-01 and 2018-12-31 and for
+        '%inc' companies over all dates, following the and/or precedence of the SQL version
+        :return: list of (company_name, AvgOpenPrice)
+        '''
+        name = [str(text).lower() if text is not None else "" for text in self.company_name]
+        limited = self.known & np.array([text.endswith('limited') for text in name], dtype=bool)
+        inc = self.known & np.array([text.endswith('inc') for text in name], dtype=bool)
+
+        starts, ends = self.date_ranges(datetime.date(1980, 1, 1), datetime.date(2018, 12, 31))
+        starts = np.where(inc, self.offsets[:-1], starts)
+        ends = np.where(inc, self.offsets[1:], ends)
+        chosen = limited | inc
+
+        open_price = self.columns['open_price']
+        sums = segment_reduce(np.add, np.nan_to_num(open_price), starts, ends, 0.0)
+        counts = segment_reduce(np.add, (~np.isnan(open_price)).astype(np.float64), starts, ends, 0.0)
+
+        total = np.bincount(self.company[chosen], sums[chosen], len(self.names))
+        number = np.bincount(self.company[chosen], counts[chosen], len(self.names))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            average = total / number
+        found = np.flatnonzero((number > 0) & (average > 30))
+        return [(self.names[i], float(average[i])) for i in found]
+
+    def query3(self):
+        '''
+        Days of Technology companies with a high - low spread below 0.02
+        :return: list of (company_name, sector, diffInPrediction) ordered by company_name
+        '''
+        technology = self.matching(self.sector, 'Technology')
+        rows = segment_rows(self.offsets[:-1][technology], self.offsets[1:][technology])
+        spread = self.columns['high_price'][rows] - self.columns['low_price'][rows]
+        rows = rows[spread < 0.02]
+        spread = spread[spread < 0.02]
+        result = [(self.company_name[code], self.sector[code], float(value)) for code, value in
+                  zip(self.codes[rows], spread)]
+        return sorted(result, key=lambda row: (row[0] is None, str(row[0])))
+
+    def query4(self):
+        '''
+        Volume of the days a NASDAQ Health Care company had an adjusted close gap of at least 50%
+        :return: list of (company_name, volume) ordered by volume descending
+        '''
+        chosen = self.matching(self.exchange, 'NASDAQ') & self.matching(self.sector, 'Health Care')
+        rows = segment_rows(self.offsets[:-1][chosen], self.offsets[1:][chosen])
+        rows = rows[self.adj_ratio(rows) >= 50]
+        volume = self.columns['volume'][rows]
+        result = [(self.company_name[code], None if np.isnan(value) else int(value)) for code, value in
+                  zip(self.codes[rows], volume)]
+        return sorted(result, key=lambda row: (row[1] is not None, row[1] or 0), reverse=True)
+
+    def query5(self):
+        '''
+        Largest close - open per company and volume of Integrated Oil Companies between 2015-01-01 and 2018-01-01
+        :return: list of (company_name, MaxLoss, MaxAmountLoss) ordered by MaxLoss descending
+        '''
+        chosen = self.matching(self.industry, 'Integrated Oil Companies')
+        starts, ends = self.date_ranges(datetime.date(2015, 1, 1), datetime.date(2018, 1, 1))
+        rows = segment_rows(starts[chosen], ends[chosen])
+        if not len(rows):
+            return []
+        change = self.columns['close_price'][rows] - self.columns['open_price'][rows]
+        volume = self.columns['volume'][rows]
+        keys = np.column_stack([self.company[self.codes[rows]], np.where(np.isnan(volume), -1, volume)])
+        groups, inverse = np.unique(keys, axis=0, return_inverse=True)
+        largest = group_max(inverse.ravel(), change, len(groups))
+
+        result = []
+        for (company, volume), loss in zip(groups, largest):
+            loss = None if np.isnan(loss) else float(loss)
+            amount = None if loss is None or volume < 0 else loss * volume
+            result.append((self.names[int(company)], loss, amount))
+        return sorted(result, key=lambda row: (row[1] is not None, row[1] or 0), reverse=True)
+
+    def runquery(self):
+        '''
+        Run the five queries
+        :return: (dictionary of query name -> seconds taken, dictionary of query name -> result rows)
+        '''
+        timings = {}
+        results = {}
+        for n, kernel in enumerate([self.query1, self.query2, self.query3, self.query4, self.query5], 1):
+            start = time.time()
+            results["Query " + str(n)] = kernel()
+            end = time.time()
+            print("Time taken for column store query" + str(n), end - start, "seconds")
+            timings["Query " + str(n)] = end - start
+        return timings, results
+
+
+def same_rows(expected, actual, digits=6):
+    '''
+    Compare two results as multisets of rows, rounding floats
+    :return: True if they hold the same rows
+    '''
+    def normalize(rows):
+        return sorted((tuple(round(value, digits) if isinstance(value, float) else value for value in row)
+                       for row in rows), key=repr)
+    return normalize(expected) == normalize(actual)
@@ -0,0 +1,252 @@
+import queue
+import threading
+import time
+import zipfile
+'''
+@author-name:rishab katta
+@author-name: milind kamath
+@author-name: Bikash Roy
+@author-name: Ankit Jain
+'''
+
+'''
+Helpers for loading the stocks dataset into Postgresql with client-side COPY ... FROM STDIN.
+
+The CSV files are streamed straight out of the downloaded zip archive in fixed-size chunks, so nothing is
+extracted to disk and the loading user does not need SUPERUSER priviliges or access to the server's filesystem.
+'''
+
+COMPANY_COLUMNS = ['ticker', 'exchange', 'company_name', 'sector', 'industry']
+
+PRICE_COLUMNS = ['ticker', 'open_price', 'close_price', 'adj_close_price', 'low_price', 'high_price', 'volume',
+                 'stock_date']
+
+# bytes handed to the server per read; this is the whole client-side memory budget of a load
+CHUNK_SIZE = 1024 * 1024
+
+
+def copy_sql(table, columns, header=True):
+    '''
+    Build a COPY ... FROM STDIN statement for a CSV stream
+    :param table: table name
+    :param columns: list of column names in CSV order
+    :param header: True if the stream starts with a header line
+    :return: string
+    '''
+    return "COPY " + table + "(" + ", ".join(columns) + ") FROM STDIN WITH (FORMAT csv" + \
+           (", HEADER true)" if header else ")")
+
+
+def find_member(zip_ref, file_name):
+    '''
+    Find a file inside the zip archive by its base name, whatever folder it was zipped under
+    :param zip_ref: open ZipFile
+    :param file_name: base name of the file, example- historical_stock_prices.csv
+    :return: member name inside the archive
+    '''
+    for name in zip_ref.namelist():
+        if name.rsplit('/', 1)[-1] == file_name:
+            return name
+    raise KeyError(file_name + " not found in " + str(zip_ref.filename))
+
+
+def copy_stream(cursor, stream, table, columns, chunk_size=CHUNK_SIZE, header=True):
+    '''
+    COPY a CSV file-like object into table, reading it chunk_size bytes at a time
+    :param cursor: psycopg2 cursor
+    :param stream: binary or text file-like object with a read(size) method
+    :param table: table name
+    :param columns: list of column names in CSV order
+    :param chunk_size: number of bytes read from the stream per round trip
+    :param header: True if the stream starts with a header line
+    :return: number of rows copied
+    '''
+    cursor.copy_expert(copy_sql(table, columns, header), stream, size=chunk_size)
+    return cursor.rowcount
+
+
+def copy_file(cursor, file, table, columns, chunk_size=CHUNK_SIZE):
+    '''
+    COPY a plain CSV file from the client machine into table
+    :return: number of rows copied
+    '''
+    with open(str(file), "rb") as stream:
+        return copy_stream(cursor, stream, table, columns, chunk_size)
+
+
+def copy_from_zip(cursor, zip_path, file_name, table, columns, chunk_size=CHUNK_SIZE):
+    '''
+    COPY a CSV file stored inside a zip archive into table without extracting it
+    :param cursor: psycopg2 cursor
+    :param zip_path: path of the zip archive
+    :param file_name: base name of the CSV inside the archive
+    :param table: table name
+    :param columns: list of column names in CSV order
+    :param chunk_size: number of bytes decompressed and sent per round trip
+    :return: number of rows copied
+    '''
+    with zipfile.ZipFile(str(zip_path), "r") as zip_ref:
+        with zip_ref.open(find_member(zip_ref, file_name)) as stream:
+            return copy_stream(cursor, stream, table, columns, chunk_size)
+
+
+class BlockReader:
+    '''
+    File-like object that feeds one COPY stream with the line-aligned blocks put on a shared queue. A None block ends the
+    stream. Reading raises once another worker has failed so that every open COPY is aborted.
+    '''
+
+    def __init__(self, blocks, failed):
+        self.blocks = blocks
+        self.failed = failed
+
+    def read(self, size=-1):
+        while True:
+            if self.failed.is_set():
+                raise IOError("parallel load aborted by another worker")
+            try:
+                block = self.blocks.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            return block if block is not None else b''
+
+
+def line_blocks(stream, chunk_size=CHUNK_SIZE):
+    '''
+    Cut a binary stream into blocks of about chunk_size bytes, each ending with a complete line
+    :param stream: binary file-like object
+    :param chunk_size: number of bytes read at a time
+    :return: generator of bytes blocks, the last one given a trailing newline if the stream had none
+    '''
+    tail = b''
+    while True:
+        data = stream.read(chunk_size)
+        if not data:
+            break
+        data = tail + data
+        cut = data.rfind(b'\n') + 1
+        tail = data[cut:]
+        if cut:
+            yield data[:cut]
+    if tail:
+        yield tail if tail.endswith(b'\n') else tail + b'\n'
+
+
+def parallel_copy_from_zip(connect, zip_path, file_name, table, columns, workers, chunk_size=CHUNK_SIZE, release=None):
+    '''
+    COPY a CSV file stored inside a zip archive into table over several connections at once. The decompressed stream is
+    cut into byte ranges of about chunk_size bytes that end on a line boundary, and every range is handed to whichever
+    worker is free, each worker running its own COPY FROM STDIN. The CSV must not contain quoted newlines, which holds
+    for historical_stock_prices.csv.
+    The workers COPY into an unlogged staging table, and the rows reach table only once every worker has finished, with
+    one INSERT ... SELECT committed together with dropping the staging table. A failed worker, or a failed publish,
+    leaves table as it was.
+    :param connect: callable returning a new psycopg2 connection
+    :param zip_path: path of the zip archive
+    :param file_name: base name of the CSV inside the archive
+    :param table: table name
+    :param columns: list of column names in CSV order
+    :param workers: number of concurrent COPY streams
+    :param chunk_size: size of the byte ranges; at most 2 * workers ranges are held in memory
+    :param release: callable taking every connection opened once the load is over, committed or not; None to close it
+    :return: list with one (rows copied, seconds) tuple per worker
+    '''
+    staging = table + "_staging"
+    select = "SELECT " + ", ".join(columns) + " FROM "
+    connections = []
+    try:
+        for n in range(workers):
+            connections.append(connect())
+        # the first worker's connection also creates and publishes the staging table
+        cursor = connections[0].cursor()
+        cursor.execute("DROP TABLE IF EXISTS " + staging)
+        cursor.execute("CREATE UNLOGGED TABLE " + staging + " AS " + select + table + " WITH NO DATA")
+        connections[0].commit()
+        try:
+            results = copy_blocks(connections, zip_path, file_name, staging, columns, chunk_size)
+            cursor.execute("INSERT INTO " + table + "(" + ", ".join(columns) + ") " + select + staging)
+            cursor.execute("DROP TABLE " + staging)
+            connections[0].commit()
+        except Exception:
+            drop_staging(connections[0], staging)
+            raise
+        return results
+    finally:
+        for connection in connections:
+            if release is None:
+                connection.close()
+            else:
+                release(connection)
+
+
+def drop_staging(connection, staging):
+    '''
+    Roll back and drop the staging table of a failed parallel load, keeping quiet about errors so the load's own error
+    is the one raised
+    '''
+    try:
+        connection.rollback()
+        connection.cursor().execute("DROP TABLE IF EXISTS " + staging)
+        connection.commit()
+    except Exception:
+        pass
+
+
+def copy_blocks(connections, zip_path, file_name, table, columns, chunk_size):
+    '''
+    Run one COPY per connection fed from the shared queue of line-aligned blocks, and commit them all if every one
+    succeeded; otherwise roll them all back and raise the first error
+    :return: list with one (rows copied, seconds) tuple per connection
+    '''
+    workers = len(connections)
+    blocks = queue.Queue(maxsize=2 * workers)
+    failed = threading.Event()
+    results = [(0, 0.0)] * workers
+    errors = []
+
+    def work(n):
+        try:
+            cursor = connections[n].cursor()
+            start = time.time()
+            rows = copy_stream(cursor, BlockReader(blocks, failed), table, columns, chunk_size, header=False)
+            results[n] = (rows, time.time() - start)
+        except Exception as e:
+            errors.append(e)
+            failed.set()
+
+    threads = [threading.Thread(target=work, args=(n,)) for n in range(workers)]
+    for thread in threads:
+        thread.start()
+
+    def put(block):
+        while not failed.is_set():
+            try:
+                blocks.put(block, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    try:
+        with zipfile.ZipFile(str(zip_path), "r") as zip_ref:
+            with zip_ref.open(find_member(zip_ref, file_name)) as stream:
+                stream.readline()  # header
+                for block in line_blocks(stream, chunk_size):
+                    if not put(block):
+                        break
+        for thread in threads:
+            put(None)
+    except Exception as e:
+        errors.append(e)
+        failed.set()
+
+    for thread in threads:
+        thread.join()
+
+    if errors:
+        for connection in connections:
+            connection.rollback()
+        raise errors[0]
+    for connection in connections:
+        connection.commit()
+    return results
@@ -0,0 +1,193 @@
+import contextlib
+import os
+import re
+import weakref
+import psycopg2.pool
+'''
+@author-name:rishab katta
+@author-name: milind kamath
+@author-name: Bikash Roy
+@author-name: Ankit Jain
+'''
+
+'''
+Connections shared by the phases of the stocks pipeline.
+
+Postgres connections come out of a thread-safe pool with the session settings of the pool applied, and go back into it
+with the settings of the borrower reset, so parallel stages can hold several connections at once without opening a new
+one each time. MongoDB clients are shared per host, port and process, MongoClient keeping its own pool of sockets.
+Statements run over and over are prepared once per connection and executed by name afterwards.
+'''
+
+# session settings for phases that write or index a lot of rows: larger sort and index build memory, and commits that
+# don't wait for the WAL flush. A crash can lose the last commits, which a bulk load starting from the csv can redo.
+BULK_SETTINGS = {'work_mem': '256MB', 'maintenance_work_mem': '1GB', 'synchronous_commit': 'off'}
+
+# connections a pool holds beyond the requested workers: the one of a DatabaseConnection and a read connection
+SPARE_CONNECTIONS = 2
+
+# connection -> names of the statements prepared on it
+prepared = weakref.WeakKeyDictionary()
+
+# (host, port, process id) -> MongoClient
+mongo_clients = {}
+
+
+def apply_settings(cursor, settings):
+    '''
+    Set configuration parameters for the rest of the session
+    :param cursor: psycopg2 cursor
+    :param settings: dictionary of parameter name -> value
+    :return: None
+    '''
+    for name, value in sorted(settings.items()):
+        cursor.execute("select set_config(%s, %s, false)", (name, str(value)))
+
+
+@contextlib.contextmanager
+def session(cursor, settings):
+    '''
+    Apply settings for the statements run inside the with block and reset them afterwards
+    :param cursor: psycopg2 cursor of an autocommit connection
+    :param settings: dictionary of parameter name -> value, example- BULK_SETTINGS
+    '''
+    apply_settings(cursor, settings)
+    try:
+        yield cursor
+    finally:
+        for name in sorted(settings):
+            cursor.execute("RESET " + name)
+
+
+def numbered(query):
+    '''
+    :return: query with its %s placeholders turned into $1, $2, ... and %% into %, as PREPARE expects
+    '''
+    count = [0]
+
+    def replace(match):
+        if match.group(0) == '%%':
+            return '%'
+        count[0] += 1
+        return '$' + str(count[0])
+    return re.sub(r"%%|%s", replace, query)
+
+
+def execute_prepared(cursor, name, query, params=()):
+    '''
+    Execute a statement prepared on the cursor's connection, preparing it the first time it is run there. Planning is
+    done once per connection instead of once per execution.
+    :param cursor: psycopg2 cursor
+    :param name: statement name, unique for every distinct query
+    :param query: statement with %s placeholders
+    :param params: tuple of parameters
+    :return: None; results are read from the cursor
+    '''
+    names = prepared.setdefault(cursor.connection, set())
+    if name not in names:
+        cursor.execute("PREPARE " + name + " AS " + numbered(query))
+        names.add(name)
+    if params:
+        cursor.execute("EXECUTE " + name + "(" + ", ".join(["%s"] * len(params)) + ")", tuple(params))
+    else:
+        cursor.execute("EXECUTE " + name)
+
+
+def connect(pg_params, settings=None):
+    '''
+    Open a connection outside the pool, for work holding a fixed number of connections for a while, example- the
+    workers of a parallel COPY. The caller closes it.
+    :param pg_params: keyword arguments of psycopg2.connect
+    :param settings: dictionary of parameter name -> value applied for the session
+    :return: psycopg2 connection with autocommit off
+    '''
+    connection = psycopg2.connect(**pg_params)
+    connection.autocommit = True
+    apply_settings(connection.cursor(), settings or {})
+    connection.autocommit = False
+    return connection
+
+
+def mongo_client(host, port, max_pool_size=100):
+    '''
+    :return: MongoClient for host and port shared within this process; worker processes get one of their own since a
+    client must not be used across fork
+    '''
+    # imported here so that the Postgres-only phases don't need pymongo
+    from pymongo import MongoClient
+
+    key = (host, port, os.getpid())
+    if key not in mongo_clients:
+        mongo_clients[key] = MongoClient(host, port, maxPoolSize=max_pool_size)
+    return mongo_clients[key]
+
+
+class ConnectionPool:
+    '''
+    Thread-safe pool of Postgres connections with session settings applied on checkout
+    '''
+
+    def __init__(self, pg_params, minconn=1, maxconn=None, settings=None, workers=1):
+        '''
+        :param pg_params: keyword arguments of psycopg2.connect
+        :param minconn: connections opened up front
+        :param maxconn: largest number of connections checked out at once, None for workers + SPARE_CONNECTIONS
+        :param settings: dictionary of parameter name -> value applied to every connection handed out
+        :param workers: number of connections expected to be used concurrently
+        '''
+        self.pg_params = pg_params
+        self.settings = dict(settings or {})
+        maxconn = maxconn or workers + SPARE_CONNECTIONS
+        self.pool = psycopg2.pool.ThreadedConnectionPool(min(minconn, maxconn), maxconn, **pg_params)
+
+    def getconn(self, autocommit=False, settings=None):
+        '''
+        Check out a connection
+        :param autocommit: autocommit mode of the connection; named cursors need it off
+        :param settings: dictionary of parameter name -> value applied on top of the pool's settings, example-
+        BULK_SETTINGS, reset when the connection is put back
+        :return: psycopg2 connection
+        '''
+        connection = self.pool.getconn()
+        connection.autocommit = True
+        apply_settings(connection.cursor(), dict(self.settings, **(settings or {})))
+        connection.autocommit = autocommit
+        return connection
+
+    def putconn(self, connection, close=False):
+        '''
+        Return a connection to the pool, rolling back whatever it left open and resetting its settings. Prepared
+        statements are kept for the next borrower.
+        :param connection: connection from getconn()
+        :param close: close the connection instead of keeping it
+        :return: None
+        '''
+        if not connection.closed and not close:
+            try:
+                connection.rollback()
+                connection.autocommit = True
+                connection.cursor().execute("RESET ALL")
+            except psycopg2.Error:
+                close = True
+        self.pool.putconn(connection, close=close or connection.closed)
+
+    @contextlib.contextmanager
+    def connection(self, autocommit=False, settings=None):
+        '''
+        Check out a connection for the with block, committing on success when not in autocommit mode
+        :param autocommit: autocommit mode of the connection
+        :param settings: dictionary of parameter name -> value for the block
+        '''
+        connection = self.getconn(autocommit, settings)
+        try:
+            yield connection
+            if not autocommit:
+                connection.commit()
+        finally:
+            self.putconn(connection)
+
+    def closeall(self):
+        '''
+        Close every connection of the pool
+        '''
+        self.pool.closeall()
@@ -0,0 +1,257 @@
+import array
+from itertools import combinations
+import numpy as np
+'''
+@author-name:rishab katta
+@author-name: milind kamath
+@author-name: Bikash Roy
+@author-name: Ankit Jain
+'''
+
+'''
+Functional dependency discovery for the tables of the stocks database, based on TANE (Huhtala et al.).
+
+A table is fetched once and every column is encoded as integers. An attribute set X is represented by its stripped
+partition: the groups of rows that agree on X, leaving out groups of a single row. X --> A holds exactly when X and
+X + A have the same error e(X) = (rows in groups - number of groups) / rows, and the partition of a union of attribute
+sets is the product of their partitions. The lattice of attribute sets is searched level by level, so left hand sides
+of any size are found, and only minimal dependencies are reported.
+'''
+
+
+class Partition:
+    '''
+    Stripped partition of the rows of a table: rows holds the row numbers that share their value with another row and
+    labels the group of each of them
+    '''
+
+    def __init__(self, rows, labels, groups, size):
+        self.rows = rows
+        self.labels = labels
+        self.groups = groups
+        self.size = size
+
+    @classmethod
+    def from_codes(cls, codes):
+        '''
+        :param codes: numpy integer array holding the encoded value of one column for every row
+        :return: stripped partition of the column
+        '''
+        counts = np.bincount(codes)
+        rows = np.nonzero(counts[codes] > 1)[0].astype(np.int32)
+        return cls(rows, codes[rows].astype(np.int32), int((counts > 1).sum()), len(codes))
+
+    def error(self):
+        '''
+        :return: e(X) times the number of rows, that is the number of rows to remove for X to become a key
+        '''
+        return len(self.rows) - self.groups
+
+    def product(self, other):
+        '''
+        :param other: stripped partition of another attribute set of the same table
+        :return: stripped partition of the union of both attribute sets
+        '''
+        other_labels = np.full(self.size, -1, dtype=np.int64)
+        other_labels[other.rows] = other.labels
+        paired = other_labels[self.rows]
+        keep = paired >= 0
+        rows = self.rows[keep]
+        keys = self.labels[keep].astype(np.int64) * (int(other.labels.max()) + 1 if len(other.labels) else 1) + \
+            paired[keep]
+        unique, inverse, counts = np.unique(keys, return_inverse=True, return_counts=True)
+        shared = counts[inverse] > 1
+        return Partition(rows[shared], inverse[shared].astype(np.int32), int((counts > 1).sum()), self.size)
+
+
+def table_columns(cursor, table):
+    '''
+    :return: column names of table in their declared order
+    '''
+    cursor.execute("select column_name from information_schema.columns where table_name = %s "
+                   "and table_schema = current_schema() order by ordinal_position", (table,))
+    return [row[0] for row in cursor.fetchall()]
+
+
+def encode_rows(rows, width):
+    '''
+    Encode the values of every column as consecutive integers, null being a value of its own like in GROUP BY
+    :param rows: iterable of row tuples
+    :param width: number of columns
+    :return: list with one numpy int32 array of codes per column
+    '''
+    codes = [array.array('i') for i in range(width)]
+    dictionaries = [{} for i in range(width)]
+    for row in rows:
+        for i, value in enumerate(row):
+            codes[i].append(dictionaries[i].setdefault(value, len(dictionaries[i])))
+    return [np.frombuffer(column, dtype=np.int32) for column in codes]
+
+
+def fetch_columns(connection, table, columns=None, itersize=100000):
+    '''
+    Read a table once through a server-side cursor and encode it column by column
+    :param connection: psycopg2 connection not in autocommit mode, needed for the named cursor
+    :param table: table name
+    :param columns: columns to read, None for all of them
+    :param itersize: number of rows fetched per round trip
+    :return: (list of column names, list with one numpy int32 array of codes per column)
+    '''
+    if columns is None:
+        columns = table_columns(connection.cursor(), table)
+    cursor = connection.cursor(name="fd_" + table)
+    cursor.itersize = itersize
+    cursor.execute("select " + ", ".join(columns) + " from " + table)
+    codes = encode_rows(cursor, len(columns))
+    cursor.close()
+    connection.commit()
+    return columns, codes
+
+
+def discover(columns, codes):
+    '''
+    Find all minimal non-trivial functional dependencies holding on the encoded table
+    :param columns: list of column names
+    :param codes: list with one numpy integer array of codes per column
+    :return: list of (tuple of left hand side columns, right hand side column), an empty left hand side meaning the
+    column is constant
+    '''
+    attributes = frozenset(range(len(columns)))
+    singles = dict((frozenset([i]), Partition.from_codes(np.asarray(codes[i]))) for i in attributes)
+    errors = dict((x, partition.error()) for x, partition in singles.items())
+    errors[frozenset()] = len(codes[0]) - 1 if codes and len(codes[0]) else 0
+    rhs_candidates = {frozenset(): attributes}
+    found = []
+
+    def holds(lhs, a, partitions):
+        # lhs --> a, with the partition of lhs in partitions when it has two or more columns
+        x = lhs | {a}
+        if x not in errors:
+            errors[x] = partitions[lhs].product(singles[frozenset([a])]).error()
+        return errors[lhs] == errors[x]
+
+    previous = {}
+    partitions = dict(singles)
+    level = sorted(partitions, key=sorted)
+    while level:
+        # compute dependencies
+        for x in level:
+            candidates = attributes
+            for a in x:
+                candidates = candidates & rhs_candidates.get(x - {a}, frozenset())
+            for a in sorted(x & candidates):
+                if errors[x - {a}] == errors[x]:
+                    found.append((x - {a}, a))
+                    candidates = candidates - {a} - (attributes - x)
+            rhs_candidates[x] = candidates
+
+        # prune; a key X determines every other column, and X --> A is minimal when no X - B does
+        kept = []
+        for x in level:
+            if not rhs_candidates[x]:
+                continue
+            if errors[x] == 0:
+                for a in sorted(rhs_candidates[x] - x):
+                    if not any(holds(x - {b}, a, previous) for b in x):
+                        found.append((x, a))
+                continue
+            kept.append(x)
+
+        # generate next level from sets sharing all but their last attribute
+        kept_set = set(kept)
+        ordered = sorted(kept, key=sorted)
+        next_level = {}
+        for i, y in enumerate(ordered):
+            prefix = sorted(y)[:-1]
+            for z in ordered[i + 1:]:
+                if sorted(z)[:-1] != prefix:
+                    break
+                x = y | z
+                if all(x - {a} in kept_set for a in x):
+                    next_level[x] = partitions[y].product(partitions[z])
+                    errors[x] = next_level[x].error()
+        previous = partitions
+        partitions = next_level
+        level = sorted(next_level, key=sorted)
+
+    return sorted(((tuple(columns[i] for i in sorted(lhs)), columns[rhs]) for lhs, rhs in found),
+                  key=lambda fd: (len(fd[0]), fd))
+
+
+def group_ids(codes, lhs):
+    '''
+    :param codes: list with one numpy integer array of codes per column
+    :param lhs: tuple of column numbers
+    :return: numpy array numbering the distinct lhs values of every row
+    '''
+    if len(lhs) == 1:
+        return np.asarray(codes[lhs[0]])
+    return np.unique(np.stack([codes[i] for i in lhs], axis=1), axis=0, return_inverse=True)[1].ravel()
+
+
+def g3(groups, rhs):
+    '''
+    g3 error of lhs --> rhs: the fraction of rows to remove for the dependency to hold exactly
+    :param groups: group number of the lhs value of every row, as returned by group_ids()
+    :param rhs: numpy integer array of codes of the right hand side column
+    :return: float between 0 and 1, 0 when the dependency holds
+    '''
+    if not len(rhs):
+        return 0.0
+    pairs, counts = np.unique(groups.astype(np.int64) * (int(rhs.max()) + 1) + rhs, return_counts=True)
+    largest = np.zeros(int(groups.max()) + 1, dtype=np.int64)
+    np.maximum.at(largest, pairs // (int(rhs.max()) + 1), counts)
+    return (len(rhs) - int(largest.sum())) / len(rhs)
+
+
+def approximate(connection, table, columns=None, max_lhs=2, percent=1.0, g3_threshold=0.01):
+    '''
+    Find functional dependencies of a large table by checking candidates on a sample first. A dependency that doesn't
+    hold on the sample can't hold on the table, so only candidates surviving the sample are confirmed exactly, inside
+    Postgres, as COUNT(DISTINCT lhs) = COUNT(DISTINCT lhs, rhs), with one scan of the table per left hand side size.
+    :param connection: psycopg2 connection
+    :param table: table name
+    :param columns: columns to consider, None for all of them
+    :param max_lhs: largest left hand side size to check
+    :param percent: percentage of the table's pages sampled with TABLESAMPLE SYSTEM
+    :param g3_threshold: refuted candidates with a sample g3 error up to this are reported as near dependencies
+    :return: (list of minimal (lhs tuple, rhs) dependencies holding on the whole table, list of (lhs tuple, rhs, g3 on
+    the sample) near dependencies)
+    '''
+    cursor = connection.cursor()
+    if columns is None:
+        columns = table_columns(cursor, table)
+    cursor.execute("select " + ", ".join(columns) + " from " + table + " tablesample system (%s)", (percent,))
+    codes = encode_rows(cursor.fetchall(), len(columns))
+
+    found = []
+    near = []
+    for size in range(1, max_lhs + 1):
+        survivors = []
+        for lhs in combinations(range(len(columns)), size):
+            groups = None
+            for rhs in range(len(columns)):
+                if rhs in lhs or any(r == rhs and set(l) <= set(lhs) for l, r in found):
+                    continue
+                if groups is None:
+                    groups = group_ids(codes, lhs)
+                error = g3(groups, codes[rhs])
+                if error == 0:
+                    survivors.append((lhs, rhs))
+                elif error <= g3_threshold:
+                    near.append((lhs, rhs, error))
+
+        if not survivors:
+            continue
+        lhs_sets = sorted(set(lhs for lhs, rhs in survivors))
+        select = ["count(distinct row(" + ", ".join(columns[i] for i in lhs) + "))" for lhs in lhs_sets] + \
+                 ["count(distinct row(" + ", ".join(columns[i] for i in lhs + (rhs,)) + "))" for lhs, rhs in survivors]
+        cursor.execute("select " + ", ".join(select) + " from " + table)
+        counts = cursor.fetchone()
+        distinct = dict(zip(lhs_sets, counts))
+        for (lhs, rhs), count in zip(survivors, counts[len(lhs_sets):]):
+            if distinct[lhs] == count:
+                found.append((lhs, rhs))
+
+    return ([(tuple(columns[i] for i in lhs), columns[rhs]) for lhs, rhs in found],
+            [(tuple(columns[i] for i in lhs), columns[rhs], error) for lhs, rhs, error in near])
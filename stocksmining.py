@@ -0,0 +1,297 @@
+'''
+@author-name: Rishab Katta
+@author-name: Milind Kamath
+@author-name: Bikash Roy
+@author-name: Ankit Jain
+
+In-memory frequent itemset mining for the lattice of popular_fintech_companies.
+
+Every trading day is a transaction holding the tickers that closed more than 20% above their open on that day. The
+transactions are encoded once as a days x tickers boolean matrix and Apriori finds every level of frequent itemsets in
+a single pass over the lattice, instead of one k-way self join of popular_fintech_companies per level. By default
+support is counted on bit vectors: each ticker's surge days are packed 64 to a word, the support of an itemset is the
+popcount of the AND of its vectors, and the vector of every frequent itemset is kept so that level k + 1 only ANDs one
+more vector onto an intersection computed at level k.
+'''
+
+from itertools import combinations
+
+import numpy as np
+
+
+def load_transactions(cursor, table="popular_fintech_companies"):
+    '''
+    Read the transactions out of the database with one query
+    :param cursor: psycopg2 cursor
+    :param table: table with a ticker and a stock_date column
+    :return: dictionary of stock_date -> set of tickers
+    '''
+    cursor.execute("select stock_date, ticker from " + table)
+    transactions = {}
+    for stock_date, ticker in cursor.fetchall():
+        transactions.setdefault(stock_date, set()).add(ticker)
+    return transactions
+
+
+def encode(transactions):
+    '''
+    Encode transactions as a boolean matrix
+    :param transactions: dictionary of transaction key -> set of items
+    :return: (sorted list of items, list of transaction keys, boolean matrix with one row per transaction and one
+    column per item)
+    '''
+    items = sorted(set(item for itemset in transactions.values() for item in itemset))
+    column = dict((item, i) for i, item in enumerate(items))
+    keys = sorted(transactions)
+    matrix = np.zeros((len(keys), len(items)), dtype=bool)
+    for row, key in enumerate(keys):
+        matrix[row, [column[item] for item in transactions[key]]] = True
+    return items, keys, matrix
+
+
+class MatrixSupport:
+    '''
+    Support counter that ANDs the boolean columns of a candidate and counts the rows left
+    '''
+
+    def __init__(self, matrix):
+        self.matrix = matrix
+
+    def singles(self):
+        '''
+        :return: support of every single item, indexed by column
+        '''
+        return self.matrix.sum(axis=0)
+
+    def count(self, candidates):
+        '''
+        :param candidates: list of itemsets, each a sorted tuple of column numbers
+        :return: list with the support of every candidate
+        '''
+        return [int(self.matrix[:, list(candidate)].all(axis=1).sum()) for candidate in candidates]
+
+    def keep(self, frequent):
+        '''
+        Called with the frequent itemsets of a level once it is counted; nothing to remember here
+        '''
+        pass
+
+
+# number of set bits of every byte value, for numpy versions without bitwise_count
+BYTE_BITS = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+def pack(matrix):
+    '''
+    Pack the columns of a boolean matrix into bit vectors
+    :param matrix: boolean matrix with one row per transaction and one column per item
+    :return: uint64 array with one row of words per item
+    '''
+    packed = np.packbits(matrix.T, axis=1)
+    padding = -packed.shape[1] % 8
+    if padding:
+        packed = np.hstack([packed, np.zeros((packed.shape[0], padding), dtype=np.uint8)])
+    return np.ascontiguousarray(packed).view(np.uint64)
+
+
+def popcount(words):
+    '''
+    :param words: uint64 array
+    :return: number of set bits along the last axis
+    '''
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(words).sum(axis=-1)
+    return BYTE_BITS[words.view(np.uint8)].sum(axis=-1)
+
+
+class BitmapSupport:
+    '''
+    Support counter on packed bit vectors. The vectors of the frequent itemsets of the last level are cached, so the
+    support of a candidate is the popcount of its prefix's cached vector ANDed with the vector of its last item, and all
+    candidates sharing a prefix are counted in one vectorized AND.
+    '''
+
+    def __init__(self, matrix):
+        self.bits = pack(matrix)
+        self.cache = {}
+        self.counted = {}
+
+    def singles(self):
+        '''
+        :return: support of every single item, indexed by column
+        '''
+        return popcount(self.bits)
+
+    def prefix_vector(self, prefix):
+        '''
+        :param prefix: itemset of the previous level
+        :return: bit vector of the days holding all items of prefix
+        '''
+        return self.bits[prefix[0]] if len(prefix) == 1 else self.cache[prefix]
+
+    def count(self, candidates):
+        '''
+        :param candidates: sorted list of itemsets, each a sorted tuple of column numbers
+        :return: list with the support of every candidate
+        '''
+        self.counted = {}
+        counts = []
+        start = 0
+        while start < len(candidates):
+            prefix = candidates[start][:-1]
+            end = start
+            while end < len(candidates) and candidates[end][:-1] == prefix:
+                end += 1
+            group = candidates[start:end]
+            vectors = self.prefix_vector(prefix) & self.bits[[candidate[-1] for candidate in group]]
+            for candidate, vector in zip(group, vectors):
+                self.counted[candidate] = vector
+            counts.extend(int(count) for count in popcount(vectors))
+            start = end
+        return counts
+
+    def keep(self, frequent):
+        '''
+        Keep the vectors of the frequent itemsets of the level just counted and drop everything else
+        :param frequent: frequent itemsets of the level
+        :return: None
+        '''
+        self.cache = dict((itemset, self.counted[itemset]) for itemset in frequent if itemset in self.counted)
+        self.counted = {}
+
+
+def candidates(frequent):
+    '''
+    Generate the candidates of the next level from the frequent itemsets of a level. Two itemsets sharing everything but
+    their last item are joined, and a candidate is kept only if all of its subsets one item smaller are frequent.
+    :param frequent: set of frequent itemsets of level k, each a sorted tuple
+    :return: sorted list of candidate itemsets of level k + 1
+    '''
+    ordered = sorted(frequent)
+    result = []
+    for i, left in enumerate(ordered):
+        for right in ordered[i + 1:]:
+            if left[:-1] != right[:-1]:
+                break
+            candidate = left + right[-1:]
+            if all(candidate[:j] + candidate[j + 1:] in frequent for j in range(len(candidate) - 2)):
+                result.append(candidate)
+    return result
+
+
+def apriori(transactions, min_support=5, max_level=None, counter=BitmapSupport):
+    '''
+    Find all frequent itemsets of the transactions
+    :param transactions: dictionary of transaction key -> set of items
+    :param min_support: minimum number of transactions an itemset must appear in
+    :param max_level: largest itemset size to look for, None for no limit
+    :param counter: support counting class built from the encoded boolean matrix, BitmapSupport or MatrixSupport
+    :return: list of levels, level k at index k - 1, each a dictionary of sorted item tuple -> support
+    '''
+    items, keys, matrix = encode(transactions)
+    support = counter(matrix)
+
+    singles = support.singles()
+    level = dict(((i,), int(singles[i])) for i in range(len(items)) if singles[i] >= min_support)
+    levels = []
+    while level:
+        levels.append(level)
+        if max_level is not None and len(levels) >= max_level:
+            break
+        support.keep(level)
+        next_candidates = candidates(set(level))
+        level = dict((candidate, count) for candidate, count in zip(next_candidates, support.count(next_candidates))
+                     if count >= min_support)
+
+    return [dict((tuple(items[i] for i in itemset), count) for itemset, count in level.items()) for level in levels]
+
+
+def association_rules(levels, transactions, min_confidence=0.5):
+    '''
+    Generate the association rules of every frequent itemset with two or more items. Every non-empty proper subset of
+    an itemset is tried as the antecedent, and all supports are dictionary lookups into the levels.
+    :param levels: list of levels as returned by apriori(), level k at index k - 1
+    :param transactions: total number of transactions, used for lift and leverage
+    :param min_confidence: rules with confidence not above this fraction are left out
+    :return: list of dictionaries with antecedent, consequent, support, confidence, lift and leverage, ordered by
+    confidence descending
+    '''
+    support = {}
+    for level in levels:
+        support.update(level)
+
+    rules = []
+    for level in levels[1:]:
+        for itemset, count in level.items():
+            for size in range(1, len(itemset)):
+                for antecedent in combinations(itemset, size):
+                    consequent = tuple(item for item in itemset if item not in antecedent)
+                    confidence = count / support[antecedent]
+                    if confidence <= min_confidence:
+                        continue
+                    consequent_share = support[consequent] / transactions
+                    rules.append({'antecedent': antecedent, 'consequent': consequent, 'support': count,
+                                  'confidence': confidence, 'lift': confidence / consequent_share,
+                                  'leverage': count / transactions -
+                                              support[antecedent] / transactions * consequent_share})
+    rules.sort(key=lambda rule: (-rule['confidence'], rule['antecedent'], rule['consequent']))
+    return rules
+
+
+def update_levels(levels, after, before, min_support, count_support):
+    '''
+    Bring the levels of the lattice up to date after rows were added to some transactions, without mining the old
+    transactions again. Supports only grow, and the support of an itemset only changes through a touched transaction
+    that holds it now but didn't before, that is one holding it together with at least one of its new items. Those
+    itemsets are found level by level inside every touched transaction, joining only the frequent itemsets that
+    transaction holds, so the existing levels are never scanned or regenerated. Itemsets already frequent get the
+    number of such transactions added to their count; the others can only become frequent through them, and only they
+    are counted over all transactions, with count_support.
+    :param levels: levels as returned by apriori(), updated in place
+    :param after: dictionary of transaction key -> set of items of every transaction that got new rows, new items included
+    :param before: dictionary of transaction key -> set of items those transactions held before, missing for new ones
+    :param min_support: minimum number of transactions an itemset must appear in
+    :param count_support: function taking a list of itemsets of one size and returning a dictionary of itemset ->
+    support over all transactions, the new rows included
+    :return: list with a (changed, added) tuple per level: itemsets already frequent whose count changed and newly
+    frequent itemsets, each a dictionary of itemset -> count
+    '''
+    new_items = dict((key, after[key] - before.get(key, set())) for key in after)
+    # transaction key -> frequent itemsets of the current level that the transaction holds after the update
+    held = dict((key, [(item,) for item in sorted(after[key])]) for key in after)
+
+    changes = []
+    k = 1
+    while True:
+        level = levels[k - 1] if k <= len(levels) else {}
+
+        # number of touched transactions every itemset of this level was newly added to
+        delta = {}
+        for key, itemsets in held.items():
+            for itemset in itemsets:
+                if not new_items[key].isdisjoint(itemset):
+                    delta[itemset] = delta.get(itemset, 0) + 1
+
+        changed = {}
+        for itemset, count in delta.items():
+            if itemset in level:
+                level[itemset] += count
+                changed[itemset] = level[itemset]
+
+        added = {}
+        pending = sorted(itemset for itemset in delta if itemset not in level)
+        if pending:
+            added = dict((itemset, count) for itemset, count in count_support(pending).items() if count >= min_support)
+            level.update(added)
+
+        if not level:
+            return changes
+        if k > len(levels):
+            levels.append(level)
+        changes.append((changed, added))
+
+        # next level: frequent itemsets every transaction holds, joined within the transaction only
+        held = dict((key, candidates(set(itemset for itemset in itemsets if itemset in level)))
+                    for key, itemsets in held.items())
+        held = dict((key, itemsets) for key, itemsets in held.items() if itemsets)
+        k += 1
@@ -1,10 +1,18 @@
 import psycopg2
-import zipfile
+import stocksbench
+import stockscache
+import stockscolumns
+import stockscopy
+import stocksdb
+import stocksfd
+import stocksrollup
 import time
-from itertools import combinations
-from  builtins import any as b_any
-from pymongo import MongoClient
+from pymongo.errors import BulkWriteError
+import multiprocessing
+import functools
+import itertools
 import datetime
+import re
 
 '''
 @author-name:rishab katta
@@ -20,20 +28,287 @@ determine funtional dependencies, load data from relational model to MongoDB for
 Dataset link: https://www.kaggle.com/ehallmar/daily-historical-stock-prices-1970-2018#historical_stocks.csv
 
 
-NOTE: This program needs an empty Relational Database named "stocks" and that database needs to have user with 
-SUPERUSER priviliges. You can do that by running the first query from any existing database on PGADMIN and then running
-the 2nd and 3rd on newly created 'stocks' database
+NOTE: This program needs an empty Relational Database named "stocks" and a user who can create tables in it. The data
+is loaded with client-side COPY FROM STDIN so the user doesn't need SUPERUSER priviliges. You can do that by running the
+first query from any existing database on PGADMIN and then running the 2nd on newly created 'stocks' database
 
 1: CREATE DATABASE stocks;
 2: CREATE USER user101 WITH PASSWORD 'abcde' CREATEDB;
-3: ALTER USER user101 WITH SUPERUSER;
 
  
 '''
 
+FIRST_YEAR = 1970
+LAST_YEAR = 2018
+
+PRICE_TABLE_COLUMNS = "ticker VARCHAR, open_price float, close_price float, adj_close_price float, low_price float, " \
+                      "high_price float, volume BIGINT, stock_date DATE"
+
+# Queries for the questions we came up with on the stocks database. The date filters compare stock_date as a date, so
+# Postgres can prune partitions and use indexes on it.
+QUERIES = [("Query 1", "select distinct company_name, max((((close_price - "
+                       "adj_close_price) / nullif(close_price, 0)) * 100)) as MaxPercentageChange "
+                       "from company "
+                       "join historical_stock_price on  historical_stock_price.ticker = company.ticker "
+                       "where stock_date > date '2000-01-01' "
+                       "and stock_date < date '2018-12-31' "
+                       "and (((close_price - adj_close_price) / nullif(close_price, 0)) * 100) >= 15 "
+                       "group by company_name order by MaxPercentageChange"),
+           ("Query 2", "select distinct company_name, avg(open_price) as AvgOpenPrice from company "
+                       "join historical_stock_price on  historical_stock_price.ticker = company.ticker "
+                       "where stock_date > date '1980-01-01' "
+                       "and stock_date < date '2018-12-31' "
+                       "and company_name ilike '%Limited' or company_name ilike '%inc' group by company_name "
+                       "having avg(open_price) > 30"),
+           ("Query 3", "select company_name, sec.name, hist.high_price - hist.low_price "
+                       "as diffInPrediction from company as comp join sector as sec on comp.sector = sec.id "
+                       "join historical_stock_price as hist on comp.ticker = hist.ticker "
+                       "where sec.name ilike 'Technology' and hist.high_price - hist.low_price < 0.02 "
+                       "order by company_name"),
+           ("Query 4", "select company_name, volume from company as comp join sector as sec "
+                       "on comp.sector = sec.id "
+                       "join historical_stock_price as hist on comp.ticker = hist.ticker "
+                       "where comp.exchange ilike 'NASDAQ' and sec.name ilike 'Health Care' "
+                       "and (((close_price - adj_close_price) / nullif(close_price, 0)) * 100) >= 50 "
+                       "order by volume desc"),
+           ("Query 5", "select distinct comp.company_name, Max(hist.close_price - hist.open_price) as MaxLoss , "
+                       "((Max(hist.close_price - hist.open_price))*hist.volume) as MaxAmountLoss  "
+                       "from industry as ind "
+                       "join company as comp on ind.id = comp.industry "
+                       "join historical_stock_price as hist on hist.ticker = comp.ticker "
+                       "where hist.stock_date > date '2015-01-01' "
+                       "and hist.stock_date < date '2018-01-01' "
+                       "and ind.name ilike 'Integrated Oil Companies' "
+                       "group by comp.company_name, hist.volume order by MaxLoss desc")]
+
+# smallest correlation between the physical row order and stock_date for which createindex() builds a BRIN index
+BRIN_MIN_CORRELATION = 0.9
+
+# table and statement of every index built by createindex()
+INDEXES = [('company', "CREATE INDEX IF NOT EXISTS ticker_idx ON company (ticker)"),
+           ('historical_stock_price', "CREATE INDEX IF NOT EXISTS ticker_hist_idx ON historical_stock_price (ticker)"),
+           ('historical_stock_price',
+            "CREATE INDEX IF NOT EXISTS ticker_date_hist_idx ON historical_stock_price (ticker, stock_date)"),
+           ('historical_stock_price',
+            "CREATE INDEX IF NOT EXISTS date_brin_hist_idx ON historical_stock_price USING BRIN (stock_date)"),
+           # same expression as the adj-close gap filter in query 1 and query 4, so the planner can match it; nullif
+           # keeps a zero close from failing the whole build with division by zero
+           ('historical_stock_price', "CREATE INDEX IF NOT EXISTS adj_close_gap_hist_idx ON historical_stock_price "
+                                      "(((((close_price - adj_close_price) / nullif(close_price, 0)) * 100)))"),
+           ('company', "CREATE INDEX IF NOT EXISTS company_name_idx ON company USING GIN (company_name gin_trgm_ops)"),
+           ('sector', "CREATE INDEX IF NOT EXISTS sector_name_idx ON sector USING GIN (name gin_trgm_ops)"),
+           ('company', "CREATE INDEX IF NOT EXISTS company_exchange_idx ON company USING GIN (exchange gin_trgm_ops)"),
+           ('industry', "CREATE INDEX IF NOT EXISTS industry_name_idx ON industry USING GIN (name gin_trgm_ops)")]
+
+
+def print_speedup(before, after, before_label, after_label):
+    '''
+    Print the time taken by every query in two runs of runquery() side by side
+    :param before: timings returned by the first run
+    :param after: timings returned by the second run
+    :param before_label: description of the first run
+    :param after_label: description of the second run
+    :return: None
+    '''
+    print("Query", before_label + "(s)", after_label + "(s)", "speedup")
+    for name, _ in QUERIES:
+        speedup = before[name] / after[name] if after[name] else float('inf')
+        print(name, round(before[name], 3), round(after[name], 3), str(round(speedup, 2)) + "x")
+
+
+def price_document(hsp):
+    '''
+    Build the MongoDB document for a historical_stock_price row, leaving out null columns
+    :param hsp: (id, ticker, open_price, close_price, adj_close_price, low_price, high_price, volume, stock_date)
+    :return: dictionary
+    '''
+    hspdoc = {}
+    hspdoc['_id'] = hsp[0]
+    hspdoc['ticker'] = hsp[1]
+    if hsp[2] is not None:
+        hspdoc['open_price'] = hsp[2]
+    if hsp[3] is not None:
+        hspdoc['close_price'] = hsp[3]
+    if hsp[4] is not None:
+        hspdoc['adj_close_price'] = hsp[4]
+    if hsp[5] is not None:
+        hspdoc['low_price'] = hsp[5]
+    if hsp[6] is not None:
+        hspdoc['high_price'] = hsp[6]
+    if hsp[7] is not None:
+        hspdoc['volume'] = hsp[7]
+    if hsp[8] is not None:
+        hspdoc['stock_date'] = datetime.datetime.combine(hsp[8], datetime.time.min)
+    return hspdoc
+
+
+def name_document(row):
+    '''
+    Build the MongoDB document for a sector or industry row
+    :param row: (id, name)
+    :return: dictionary
+    '''
+    return {'_id': row[0], 'name': row[1]}
+
+
+def company_document(company):
+    '''
+    Build the MongoDB document for a company row, leaving out null columns
+    :param company: (ticker, exchange, company_name, sector, industry)
+    :return: dictionary
+    '''
+    companydoc = {}
+    companydoc['ticker'] = company[0]
+    companydoc['exchange'] = company[1]
+    if company[2] is not None:
+        companydoc['company_name'] = company[2]
+    if company[3] is not None:
+        companydoc['sector'] = company[3]
+    if company[4] is not None:
+        companydoc['industry'] = company[4]
+    return companydoc
+
+
+# collection name, query and document builder for every table copied to MongoDB
+MONGO_COLLECTIONS = [('historical_stock_price', "select id, ticker, open_price, close_price, adj_close_price, low_price, "
+                                                "high_price, volume, stock_date from historical_stock_price ",
+                      price_document),
+                     ('sector', "select id, name from sector ", name_document),
+                     ('industry', "select id, name from industry ", name_document),
+                     ('company', "select ticker, exchange, company_name, sector, industry from company ",
+                      company_document)]
+
+
+CHECKPOINT_COLLECTION = 'migration_checkpoints'
+
+# connections of a parallel migration worker process, opened once by init_migration_worker()
+worker_pg_params = None
+worker_connection = None
+worker_database = None
+
+
+def insert_idempotent(collection, documents):
+    '''
+    insert_many that treats documents already present with the same _id as inserted, so a shard can be re-run after a
+    crash without failing on the rows it had already written
+    :param collection: MongoDB collection
+    :param documents: list of documents with an _id
+    :return: number of documents inserted, leaving out those already present
+    '''
+    try:
+        collection.insert_many(documents, ordered=False)
+    except BulkWriteError as e:
+        if any(error['code'] != 11000 for error in e.details['writeErrors']) or e.details.get('writeConcernErrors'):
+            raise
+        return e.details['nInserted']
+    return len(documents)
+
+
+def shard_id(table, ticker):
+    '''
+    :return: checkpoint id of the shard of table holding ticker's rows
+    '''
+    return table + ":" + ("<null>" if ticker is None else ticker)
+
+
+def init_migration_worker(pg_params, mongo_params):
+    '''
+    Process pool initializer giving every worker its own Postgres and MongoDB connection
+    '''
+    global worker_pg_params, worker_connection, worker_database
+    worker_pg_params = pg_params
+    worker_connection = psycopg2.connect(**pg_params)
+    worker_database = stocksdb.mongo_client(*mongo_params)['stocks']
+
+
+def migrate_ticker(ticker, batch_size=10000):
+    '''
+    Copy the historical_stock_price rows of one ticker to MongoDB and record the finished shard in the checkpoint
+    collection. Runs inside a worker process started with init_migration_worker().
+    :param ticker: ticker of the shard, None for rows without a ticker
+    :param batch_size: number of rows per fetch and per insert_many
+    :return: (ticker, number of documents written)
+    '''
+    global worker_connection
+    if worker_connection.closed:
+        worker_connection = psycopg2.connect(**worker_pg_params)
+    cursor = worker_connection.cursor(name="mongo_shard")
+    cursor.itersize = batch_size
+    collection = worker_database['historical_stock_price']
+
+    count = 0
+    try:
+        if ticker is None:
+            cursor.execute(MONGO_COLLECTIONS[0][1] + "where ticker is null")
+        else:
+            cursor.execute(MONGO_COLLECTIONS[0][1] + "where ticker = %s", (ticker,))
+        batch = []
+        for row in cursor:
+            batch.append(price_document(row))
+            if len(batch) == batch_size:
+                insert_idempotent(collection, batch)
+                count += len(batch)
+                batch = []
+        if batch:
+            insert_idempotent(collection, batch)
+            count += len(batch)
+        cursor.close()
+        worker_connection.commit()
+    except Exception:
+        # leave no aborted transaction behind; the next shard of this worker reconnects
+        try:
+            worker_connection.rollback()
+        finally:
+            worker_connection.close()
+        raise
+
+    worker_database[CHECKPOINT_COLLECTION].replace_one(
+        {'_id': shard_id('historical_stock_price', ticker)},
+        {'_id': shard_id('historical_stock_price', ticker), 'collection': 'historical_stock_price', 'rows': count,
+         'finished_at': datetime.datetime.utcnow()}, upsert=True)
+    return ticker, count
+
+
+BUCKET_COLLECTION = 'historical_stock_price_buckets'
+TIMESERIES_COLLECTION = 'historical_stock_price_ts'
+
+# bucket array name -> position of the column in a MONGO_COLLECTIONS historical_stock_price row
+BUCKET_FIELDS = [('ids', 0), ('open', 2), ('close', 3), ('adj_close', 4), ('low', 5), ('high', 6), ('volume', 7)]
+
+
+def bucket_key(stock_date, period):
+    '''
+    :param stock_date: date of a price row
+    :param period: 'year' or 'month'
+    :return: name of the bucket period holding stock_date, example- 2015 or 2015-03
+    '''
+    if period == 'year':
+        return str(stock_date.year)
+    if period == 'month':
+        return "%04d-%02d" % (stock_date.year, stock_date.month)
+    raise ValueError("period must be 'year' or 'month', not " + repr(period))
+
+
+def new_bucket(ticker, period):
+    '''
+    :return: empty bucket document for the prices of ticker in period
+    '''
+    bucket = {'_id': ticker + ":" + period, 'ticker': ticker, 'period': period, 'count': 0, 'dates': []}
+    for field, _ in BUCKET_FIELDS:
+        bucket[field] = []
+    return bucket
+
+
+def to_datetime(date):
+    '''
+    :return: date as the datetime MongoDB stores
+    '''
+    return datetime.datetime.combine(date, datetime.time.min)
+
+
 class DatabaseConnection:
 
-    def __init__(self, host,port,pdb,pusername, ppwd):
+    def __init__(self, host,port,pdb,pusername, ppwd, pool=None):
         '''
         Constructor used for initializing MongoDB and Postgres database.
         :param host: hostname
@@ -41,56 +316,270 @@ class DatabaseConnection:
         :param pdb: postgres database name
         :param pusername: postgres username for above database with SUPERUSER priviliges
         :param ppwd: postgres user password
+        :param pool: stocksdb.ConnectionPool to share with the other phases, None to open one
         '''
         try:
-            self.client = MongoClient(host, port)
+            self.mongo_params = (host, port)
+            self.client = stocksdb.mongo_client(host, port)
             self.database = self.client['stocks']
-            self.connection = psycopg2.connect(host=str(host), database=str(pdb), user=str(pusername), password=str(ppwd))
+            self.pg_params = dict(host=str(host), database=str(pdb), user=str(pusername), password=str(ppwd))
+            self.pool = pool if pool is not None else stocksdb.ConnectionPool(self.pg_params)
+            self.connection = self.pool.getconn(autocommit=True)
             # self.connection = psycopg2.connect(host="localhost", database="stocks", user="user101", password="abcde")
-            self.connection.autocommit=True
             self.cursor=self.connection.cursor()
+            self.cache = None
+            # query name -> number of rows returned by the last runquery()
+            self.query_rows = {}
         except Exception as e:
             print(getattr(e, 'message', repr(e)))
-            print(getattr(e, 'message', str(e)))
+            raise
+
+    def close(self):
+        '''
+        Give the connection back to the pool and compact the file of a persisted result cache
+        :return: None
+        '''
+        if self.cache is not None:
+            self.cache.close()
+        self.pool.putconn(self.connection)
 
-    def create_tables(self):
+    def create_tables(self, fast_load=False, partition=None):
         '''
         create tables for relational database
+        :param fast_load: if True historical_stock_price is created UNLOGGED and without its primary key and foreign key,
+        which are added by finish_fast_load() once the data is in
+        :param partition: None for a single heap, 'year' or 'decade' to range partition historical_stock_price by
+        stock_date. COPY routes every row into its partition.
         :return: None
         '''
 
         self.cursor.execute("CREATE TABLE company(ticker VARCHAR NOT NULL, exchange VARCHAR, "
                             "company_name VARCHAR, sector VARCHAR, industry VARCHAR, PRIMARY KEY(ticker))")
 
+        if partition:
+            constraints = "" if fast_load else \
+                ", PRIMARY KEY(id, stock_date), FOREIGN KEY(ticker) REFERENCES Company(ticker)"
+            self.cursor.execute("Create table historical_stock_price(id BIGSERIAL, " + PRICE_TABLE_COLUMNS + constraints
+                                + ") PARTITION BY RANGE (stock_date)")
+            self.create_price_partitions("historical_stock_price", partition, unlogged=fast_load)
+            return
+
+        if fast_load:
+            self.cursor.execute("Create unlogged table historical_stock_price(id BIGSERIAL, ticker VARCHAR, open_price float, "
+                                "close_price float, adj_close_price float, low_price float, high_price float, volume BIGINT, "
+                                "stock_date DATE)")
+            return
+
         self.cursor.execute("Create table historical_stock_price(id BIGSERIAL PRIMARY KEY, ticker VARCHAR, open_price float, "
                             "close_price float, adj_close_price float, low_price float, high_price float, volume BIGINT, "
                             "stock_date DATE, FOREIGN KEY(ticker) REFERENCES Company(ticker))")
 
-    def insert_tables(self, path):
+    def create_price_partitions(self, table, partition, unlogged=False):
         '''
-        Insert data from downloaded dataset to the relational database
+        Create the stock_date range partitions of a partitioned price table, one per year or per decade between
+        FIRST_YEAR and LAST_YEAR, plus a default partition for anything outside that range
+        :param table: name of the partitioned table
+        :param partition: 'year' or 'decade'
+        :param unlogged: create the partitions UNLOGGED
+        :return: None
+        '''
+        if partition not in ('year', 'decade'):
+            raise ValueError("partition must be 'year' or 'decade', not " + repr(partition))
+
+        step = 1 if partition == 'year' else 10
+        first = FIRST_YEAR - FIRST_YEAR % step
+        create = "create unlogged table " if unlogged else "create table "
+
+        for year in range(first, LAST_YEAR + 1, step):
+            self.cursor.execute(create + "historical_stock_price_" + partition[0] + str(year) + " partition of " + table +
+                                " for values from ('" + str(year) + "-01-01') to ('" + str(year + step) + "-01-01')")
+
+        self.cursor.execute(create + "historical_stock_price_default partition of " + table + " default")
+
+    def partition_prices(self, partition):
+        '''
+        Rebuild an existing, loaded historical_stock_price as a table range partitioned by stock_date. The rows keep
+        their ids and the id sequence moves over to the new table.
+        :param partition: 'year' or 'decade'
+        :return: None
+        '''
+        start = time.time()
+        self.cursor.execute("BEGIN")
+        try:
+            self.cursor.execute("select indexname from pg_indexes where tablename = 'historical_stock_price' "
+                                "and schemaname = current_schema()")
+            indexed = set(row[0] for row in self.cursor.fetchall())
+            self.cursor.execute("create table historical_stock_price_part(id bigint NOT NULL DEFAULT "
+                                "nextval('historical_stock_price_id_seq'), " + PRICE_TABLE_COLUMNS +
+                                ") PARTITION BY RANGE (stock_date)")
+            self.create_price_partitions("historical_stock_price_part", partition)
+            self.cursor.execute("insert into historical_stock_price_part select id, ticker, open_price, close_price, "
+                                "adj_close_price, low_price, high_price, volume, stock_date from historical_stock_price")
+            self.cursor.execute("ALTER SEQUENCE historical_stock_price_id_seq OWNED BY NONE")
+            self.cursor.execute("DROP TABLE historical_stock_price CASCADE")
+            self.cursor.execute("ALTER TABLE historical_stock_price_part RENAME TO historical_stock_price")
+            self.cursor.execute("ALTER SEQUENCE historical_stock_price_id_seq OWNED BY historical_stock_price.id")
+            self.cursor.execute("ALTER TABLE historical_stock_price ADD CONSTRAINT historical_stock_price_pkey "
+                                "PRIMARY KEY (id, stock_date)")
+            self.cursor.execute("ALTER TABLE historical_stock_price ADD CONSTRAINT historical_stock_price_ticker_fkey "
+                                "FOREIGN KEY (ticker) REFERENCES company (ticker)")
+            # the indexes createindex() built went with the old table too; build the same ones on the partitioned one
+            for table, statement in INDEXES:
+                if table == 'historical_stock_price' and statement.split()[5] in indexed:
+                    self.cursor.execute(statement)
+            # the result cache and rollup triggers went with the old table
+            stockscache.reinstall(self.cursor)
+            stocksrollup.reinstall(self.cursor)
+            self.cursor.execute("COMMIT")
+        except Exception:
+            self.cursor.execute("ROLLBACK")
+            raise
+        self.cursor.execute("ANALYZE historical_stock_price")
+        end = time.time()
+        print("Time taken for partitioning historical_stock_price by " + partition, end - start, "seconds")
+
+    def price_partitions(self):
+        '''
+        :return: list of partition names of historical_stock_price, empty if it is a plain table
+        '''
+        self.cursor.execute("select inhrelid::regclass::text from pg_inherits "
+                            "where inhparent = 'historical_stock_price'::regclass order by 1")
+        return [row[0] for row in self.cursor.fetchall()]
+
+    def benchmark_partitioning(self, partition='year', iterations=10, warmup=2):
+        '''
+        Benchmark the runquery workload on the plain historical_stock_price, partition it by stock_date with the same
+        indexes and benchmark it again
+        :param partition: 'year' or 'decade'
+        :param iterations: number of measured executions per query
+        :param warmup: number of executions per query before measuring
+        :return: list of names of the queries that are slower partitioned, see stocksbench.compare()
+        '''
+        before = stocksbench.run(self.cursor, QUERIES, "single table", iterations, warmup)
+        self.partition_prices(partition)
+        after = stocksbench.run(self.cursor, QUERIES, "partitioned by " + partition, iterations, warmup)
+        return stocksbench.compare(before, after)
+
+    def fast_initial_load(self, path, chunk_size=stockscopy.CHUNK_SIZE, workers=1, partition=None):
+        '''
+        Create and load the tables with historical_stock_price UNLOGGED and free of constraints and indexes, so COPY
+        doesn't pay for a btree insert and a foreign key check per row, then build all of them in bulk.
         :param path: Pathname for the downloaded zip file
+        :param chunk_size: number of bytes read from the zip and sent to the server at a time
+        :param workers: number of concurrent COPY streams used for historical_stock_price
+        :param partition: None, 'year' or 'decade', see create_tables()
         :return: None
         '''
+        start = time.time()
+        self.create_tables(fast_load=True, partition=partition)
+        end = time.time()
+        print("Time taken for creating tables", end - start, "seconds")
 
-        with zipfile.ZipFile(str(path) +"daily-historical-stock-prices-1970-2018.zip", "r") as zip_ref:
-            zip_ref.extractall(str(path))
+        start = time.time()
+        self.insert_tables(path, chunk_size, workers)
+        end = time.time()
+        print("Time taken for loading data", end - start, "seconds")
 
+        self.finish_fast_load()
 
-        file=str(path) + "daily-historical-stock-prices-1970-2018/" + "historical_stocks.csv"
-        self.cursor.execute("COPY company(ticker, exchange, company_name, sector,"
-                          " industry) FROM %s DELIMITER ',' CSV HEADER", (file,))
+    def finish_fast_load(self):
+        '''
+        Turn the UNLOGGED, constraint-free historical_stock_price left by create_tables(fast_load=True) into the regular
+        table. It is switched to LOGGED first so that the rewrite doesn't have to copy indexes as well. A partitioned
+        table gets every partition switched to LOGGED, and its foreign key is validated when it is added because
+        Postgres doesn't allow NOT VALID foreign keys on partitioned tables.
+        :return: None
+        '''
+        partitions = self.price_partitions()
+
+        if partitions:
+            phases = [("switching historical_stock_price to LOGGED",
+                       ["ALTER TABLE " + name + " SET LOGGED" for name in partitions]),
+                      ("adding primary key",
+                       ["ALTER TABLE historical_stock_price ADD CONSTRAINT historical_stock_price_pkey "
+                        "PRIMARY KEY (id, stock_date)"]),
+                      ("adding foreign key",
+                       ["ALTER TABLE historical_stock_price ADD CONSTRAINT historical_stock_price_ticker_fkey "
+                        "FOREIGN KEY (ticker) REFERENCES company (ticker)"])]
+        else:
+            phases = [("switching historical_stock_price to LOGGED",
+                       ["ALTER TABLE historical_stock_price SET LOGGED"]),
+                      ("adding primary key",
+                       ["ALTER TABLE historical_stock_price ADD CONSTRAINT historical_stock_price_pkey PRIMARY KEY (id)"]),
+                      ("adding foreign key",
+                       ["ALTER TABLE historical_stock_price ADD CONSTRAINT historical_stock_price_ticker_fkey "
+                        "FOREIGN KEY (ticker) REFERENCES company (ticker) NOT VALID",
+                        "ALTER TABLE historical_stock_price VALIDATE CONSTRAINT historical_stock_price_ticker_fkey"])]
+
+        with stocksdb.session(self.cursor, stocksdb.BULK_SETTINGS):
+            for phase, statements in phases:
+                start = time.time()
+                for statement in statements:
+                    self.cursor.execute(statement)
+                end = time.time()
+                print("Time taken for " + phase, end - start, "seconds")
+
+            # the indexes of createindex(), those of sector and industry only once change_structure() created them
+            start = time.time()
+            self.createindex(skip_missing=True)
+            end = time.time()
+            print("Time taken for building indexes", end - start, "seconds")
+
+    def insert_tables(self, path, chunk_size=stockscopy.CHUNK_SIZE, workers=1):
+        '''
+        Insert data from downloaded dataset to the relational database. Both csv files are streamed out of the zip
+        through client-side COPY FROM STDIN, so nothing is extracted to disk and SUPERUSER is not needed.
+        :param path: Pathname for the downloaded zip file
+        :param chunk_size: number of bytes read from the zip and sent to the server at a time
+        :param workers: number of concurrent COPY streams (and connections) used for historical_stock_price
+        :return: None
+        '''
+
+        zip_path = str(path) + "daily-historical-stock-prices-1970-2018.zip"
+
+        with stocksdb.session(self.cursor, stocksdb.BULK_SETTINGS):
+            rows = stockscopy.copy_from_zip(self.cursor, zip_path, "historical_stocks.csv", "company",
+                                            stockscopy.COMPANY_COLUMNS, chunk_size)
+            print("Total number of rows inserted into company: " + str(rows))
 
+            if workers > 1:
+                self.parallel_insert_prices(zip_path, workers, chunk_size)
+                return
 
+            rows = stockscopy.copy_from_zip(self.cursor, zip_path, "historical_stock_prices.csv",
+                                            "historical_stock_price", stockscopy.PRICE_COLUMNS, chunk_size)
+            print("Total number of rows inserted into historical_stock_price: " + str(rows))
 
-        file = str(path) + "daily-historical-stock-prices-1970-2018/" + "historical_stock_prices.csv"
-        self.cursor.execute("COPY historical_stock_price(ticker, open_price, close_price, adj_close_price,"
-                            " low_price, high_price, volume, stock_date) FROM %s DELIMITER ',' CSV HEADER", (file,))
-    def change_structure(self):
+    def parallel_insert_prices(self, zip_path, workers, chunk_size=stockscopy.CHUNK_SIZE):
+        '''
+        Load historical_stock_price with several concurrent COPY streams, each on its own connection, and report rows/sec
+        for every worker
+        :param zip_path: path of the zip file holding historical_stock_prices.csv
+        :param workers: number of concurrent COPY streams
+        :param chunk_size: size of the line-aligned byte ranges handed to the workers
+        :return: None
+        '''
+        start = time.time()
+        # the workers get connections of their own, so their number doesn't depend on how the pool was sized
+        results = stockscopy.parallel_copy_from_zip(lambda: stocksdb.connect(self.pg_params, stocksdb.BULK_SETTINGS),
+                                                    zip_path, "historical_stock_prices.csv", "historical_stock_price",
+                                                    stockscopy.PRICE_COLUMNS, workers, chunk_size)
+        end = time.time()
+
+        for n, (rows, seconds) in enumerate(results):
+            print("Worker", n, "inserted", rows, "rows at", round(rows / seconds if seconds else 0), "rows/sec")
+        total = sum(rows for rows, seconds in results)
+        print("Total number of rows inserted into historical_stock_price: " + str(total) + " in " + str(end - start)
+              + " seconds")
+
+    def change_structure(self, partition=None):
         '''
         Change structure based on Instructions from Prof. Mior
+        :param partition: None to leave historical_stock_price alone, 'year' or 'decade' to also rebuild it as a table
+        range partitioned by stock_date
         :return: None
         '''
+        start = time.time()
 
         self.cursor.execute("create table sector(id bigserial, name VARCHAR)")
 
@@ -122,240 +611,669 @@ class DatabaseConnection:
 
         self.cursor.execute("ALTER TABLE company ADD CONSTRAINT fk_industry FOREIGN KEY (industry) REFERENCES industry (id)")
 
-    def func_depd_pruning(self):
-        '''
-        function for determining functional dependencies using the pruning approach. This function determines functional dps
-        for company as a sample. We have run the same code for other tables in our model and the results are documented in the write-up
-        :return: None
-        '''
-        input = ['ticker', 'exchange', 'company_name', 'sector', 'industry']
-
-        output = sum([list(map(list, combinations(input, i))) for i in range(3)], [])
-
-        output.pop(0)  # deleting the empty set
+        end = time.time()
+        print("Time taken for changing structure", end - start, "seconds")
 
-        concat_list = [', '.join(sub_list) for sub_list in output]
+        if partition:
+            self.partition_prices(partition)
 
-        table_list = []
-        table_dict = {}
+        return end - start
 
-        for column in concat_list:
-            column_list = []
-            query = "SELECT array_agg(ticker) FROM company GROUP BY " + column + " order by " + column
-            self.cursor.execute(query)
-            arrays = self.cursor.fetchall()
-            for array in arrays:
-                array = str(array)
-                array = array.strip('()[],')
-                column_list.append(array.translate('()[]').split(', '))
-            table_list.append(column_list)
-
-        table_dict.clear()
-
-        for i in range(0, len(concat_list)):
-            table_dict[concat_list[i]] = table_list[i]
-
-        func_depd = []
-
-        for left_col in table_dict.keys():
-            for right_col in input:
-                count = 0
-                lolleft = table_dict[left_col]
-                lolright = table_dict[right_col]
-                for left_list in lolleft:
-                    for right_list in lolright:
-                        if set(left_list) <= set(right_list):
-                            count += 1
-                            break
-                        else:
-                            continue
-                if count == len(lolleft):
-                    leftcollist = left_col.split(", ")
-                    someflag = True
-                    for col in leftcollist:
-                        if col.strip(" ") != right_col.strip(" "):
-                            continue
-                        else:
-                            someflag = False
-                    if someflag:
-                        word = "-->" + str(right_col)
-                        if not b_any(word in x for x in func_depd):
-                            func_depd.append(left_col + "-->" + right_col)
-
-        print(func_depd)
-
-    def insert_mongodb(self):
-        '''
-        Insert data from relational database to MongoDB
+    def change_structure_ctas(self, partition=None):
+        '''
+        Same restructuring as change_structure(), but set based: sector, industry and the new company are each built by
+        one CREATE TABLE AS inside a transaction, and the new company is swapped in for the old one atomically. The
+        foreign key from historical_stock_price is added back NOT VALID inside the transaction and validated after it,
+        so the price table is scanned once without blocking writers.
+        :param partition: None to leave historical_stock_price alone, 'year' or 'decade' to also rebuild it as a table
+        range partitioned by stock_date
+        :return: seconds taken
+        '''
+        self.cursor.execute("select count(*) from pg_constraint where conname = 'historical_stock_price_ticker_fkey'")
+        has_price_fkey = self.cursor.fetchone()[0] > 0
+        partitioned = bool(self.price_partitions())
+
+        phases = []
+        for table in ('sector', 'industry'):
+            phases.append(("building " + table,
+                           ["create table " + table + " as select (row_number() over (order by name))::bigint as id, "
+                            "name::varchar as name from (select distinct " + table + " as name from company) names",
+                            "create sequence " + table + "_id_seq owned by " + table + ".id",
+                            "select setval('" + table + "_id_seq', (select coalesce(max(id), 0) + 1 from " + table + "), "
+                            "false)",
+                            "ALTER TABLE " + table + " ALTER COLUMN id SET DEFAULT nextval('" + table + "_id_seq')",
+                            "ALTER TABLE " + table + " ADD CONSTRAINT pk_" + table + " PRIMARY KEY (id)"]))
+        phases.append(("building company",
+                       ["create table company_new as select c.ticker, c.exchange, c.company_name, s.id as sector, "
+                        "i.id as industry from company c left join sector s on s.name = c.sector "
+                        "left join industry i on i.name = c.industry"]))
+        swap = ["DROP TABLE company CASCADE",
+                "ALTER TABLE company_new RENAME TO company",
+                "ALTER TABLE company ADD CONSTRAINT company_pkey PRIMARY KEY (ticker)",
+                "ALTER TABLE company ADD CONSTRAINT fk_sector FOREIGN KEY (sector) REFERENCES sector (id)",
+                "ALTER TABLE company ADD CONSTRAINT fk_industry FOREIGN KEY (industry) REFERENCES industry (id)"]
+        if has_price_fkey:
+            swap.append("ALTER TABLE historical_stock_price ADD CONSTRAINT historical_stock_price_ticker_fkey "
+                        "FOREIGN KEY (ticker) REFERENCES company (ticker)" + ("" if partitioned else " NOT VALID"))
+        phases.append(("swapping company", swap))
+
+        total = time.time()
+        self.cursor.execute("BEGIN")
+        try:
+            for phase, statements in phases:
+                start = time.time()
+                for statement in statements:
+                    self.cursor.execute(statement)
+                end = time.time()
+                print("Time taken for " + phase, end - start, "seconds")
+            # the result cache trigger went with the old company, and sector and industry are new
+            stockscache.reinstall(self.cursor)
+            self.cursor.execute("COMMIT")
+        except Exception:
+            self.cursor.execute("ROLLBACK")
+            raise
+
+        if has_price_fkey and not partitioned:
+            start = time.time()
+            self.cursor.execute("ALTER TABLE historical_stock_price VALIDATE CONSTRAINT historical_stock_price_ticker_fkey")
+            end = time.time()
+            print("Time taken for validating historical_stock_price foreign key", end - start, "seconds")
+
+        total = time.time() - total
+        print("Time taken for changing structure", total, "seconds")
+
+        if partition:
+            self.partition_prices(partition)
+
+        return total
+
+    def benchmark_change_structure(self):
+        '''
+        Time change_structure() inside a transaction that is rolled back, then restructure for real with
+        change_structure_ctas() and print both totals
         :return: None
         '''
+        self.cursor.execute("BEGIN")
+        try:
+            current = self.change_structure()
+        finally:
+            self.cursor.execute("ROLLBACK")
+        ctas = self.change_structure_ctas()
+        print("change_structure", current, "seconds, change_structure_ctas", ctas, "seconds,",
+              str(round(current / ctas, 2) if ctas else float('inf')) + "x speedup")
+
+    def export_snapshot(self, path, partition='year', file_format='arrow'):
+        '''
+        Write historical_stock_price with the exchange, name, sector and industry of its company to a columnar snapshot,
+        sorted by ticker and stock_date, which stockssnapshot.read_table() memory-maps for analytics without Postgres.
+        Needs the structure of change_structure().
+        :param path: directory of the snapshot, example- C:/users/files/snapshot
+        :param partition: None, 'year' or 'decade' for one file per year or decade of stock_date
+        :param file_format: 'arrow' or 'parquet'
+        :return: dictionary of partition -> number of rows
+        '''
+        # imported here so that the rest of phase 2 doesn't need pyarrow
+        import stockssnapshot
 
-        self.cursor.execute("select id, ticker, open_price, close_price, adj_close_price, low_price, high_price, volume, stock_date from historical_stock_price ")
-        historical_stock_prices = self.cursor.fetchall()
-        self.collection = self.database['historical_stock_price']
-
-        for hsp in historical_stock_prices:
-            self.hspdoc = {}
-            self.hspdoc['_id'] = hsp[0]
-            self.hspdoc['ticker'] = hsp[1]
-            if hsp[2] is not None:
-                self.hspdoc['open_price'] = hsp[2]
-            if hsp[3] is not None:
-                self.hspdoc['close_price'] = hsp[3]
-            if hsp[4] is not None:
-                self.hspdoc['adj_close_price'] = hsp[4]
-            if hsp[5] is not None:
-                self.hspdoc['low_price'] = hsp[5]
-            if hsp[6] is not None:
-                self.hspdoc['high_price'] = hsp[6]
-            if hsp[7] is not None:
-                self.hspdoc['volume'] = hsp[7]
-            if hsp[8] is not None:
-                self.hspdoc['stock_date'] = datetime.datetime.combine(hsp[8], datetime.time.min)
-
-
-
-            self.collection.insert_one(self.hspdoc)
-
-#############################################################################################
-
-        self.cursor.execute("select id, name from sector ")
-        sectors = self.cursor.fetchall()
-        self.collection = self.database['sector']
-
-        for sector in sectors:
-            self.sectordoc = {}
-            self.sectordoc['_id'] = sector[0]
-            self.sectordoc['name'] = sector[1]
-
-            self.collection.insert_one(self.sectordoc)
-
-#############################################################################################
-
-        self.cursor.execute("select id, name from industry ")
-        industries = self.cursor.fetchall()
-        self.collection = self.database['industry']
-
-        for industry in industries:
-            self.industrydoc = {}
-            self.industrydoc['_id'] = industry[0]
-            self.industrydoc['name'] = industry[1]
-
-            self.collection.insert_one(self.industrydoc)
+        start = time.time()
+        read_connection = self.pool.getconn()
+        try:
+            counts = stockssnapshot.export(read_connection, path, partition, file_format)
+        finally:
+            self.pool.putconn(read_connection)
+        end = time.time()
+        print("Exported", sum(counts.values()), "rows in", len(counts), "partitions to", path, "in", end - start,
+              "seconds")
+        return counts
 
-#############################################################################################
+    def func_depd_pruning(self, table='company', columns=None, snapshot=None):
+        '''
+        function for determining functional dependencies using the pruning approach. The table is read once, encoded
+        column by column and searched with stocksfd.discover(), which finds every minimal functional dependency with a
+        left hand side of any size. Works for any table of the model, historical_stock_price included.
+        :param table: table to determine functional dependencies for
+        :param columns: columns to consider, None for all of them
+        :param snapshot: directory written by export_snapshot() to read historical_stock_price and its company columns
+        from instead of Postgres; table is ignored then
+        :return: list of (tuple of left hand side columns, right hand side column)
+        '''
+        start = time.time()
+        if snapshot is not None:
+            import stockssnapshot
+            table = "snapshot " + str(snapshot)
+            columns, codes = stockssnapshot.column_codes(stockssnapshot.read_table(snapshot, columns), columns)
+        else:
+            read_connection = self.pool.getconn()
+            try:
+                columns, codes = stocksfd.fetch_columns(read_connection, table, columns)
+            finally:
+                self.pool.putconn(read_connection)
+        func_depd = stocksfd.discover(columns, codes)
+        end = time.time()
 
-        self.cursor.execute("select ticker, exchange, company_name, sector, industry from company ")
-        companies = self.cursor.fetchall()
-        self.collection = self.database['company']
+        print([", ".join(lhs) + "-->" + rhs for lhs, rhs in func_depd])
+        print("Time taken for functional dependencies of " + table, end - start, "seconds")
+        return func_depd
 
-        for company in companies:
-            self.companydoc = {}
-            self.companydoc['ticker'] = company[0]
-            self.companydoc['exchange'] = company[1]
-            if company[2] is not None:
-                self.companydoc['company_name'] = company[2]
-            if company[3] is not None:
-                self.companydoc['sector'] = company[3]
-            if company[4] is not None:
-                self.companydoc['industry'] = company[4]
+    def approximate_func_depd(self, table='historical_stock_price', max_lhs=2, percent=1.0, g3_threshold=0.01):
+        '''
+        Functional dependencies for tables too large for func_depd_pruning(). Candidates are checked on a TABLESAMPLE of
+        the table and only those the sample doesn't refute are confirmed with COUNT(DISTINCT ...) inside Postgres.
+        Dependencies that almost hold on the sample are printed with their g3 error.
+        :param table: table to determine functional dependencies for
+        :param max_lhs: largest left hand side size to check
+        :param percent: percentage of the table sampled
+        :param g3_threshold: largest g3 error of a near dependency worth reporting
+        :return: (list of dependencies, list of near dependencies with their g3 error)
+        '''
+        start = time.time()
+        func_depd, near = stocksfd.approximate(self.connection, table, max_lhs=max_lhs, percent=percent,
+                                               g3_threshold=g3_threshold)
+        end = time.time()
 
+        print([", ".join(lhs) + "-->" + rhs for lhs, rhs in func_depd])
+        for lhs, rhs, error in near:
+            print("Near dependency " + ", ".join(lhs) + "-->" + rhs + " with g3 error", error)
+        print("Time taken for approximate functional dependencies of " + table, end - start, "seconds")
+        return func_depd, near
 
-            self.collection.insert_one(self.companydoc)
+    def insert_mongodb(self, batch_size=10000):
+        '''
+        Insert data from relational database to MongoDB. Every table is read through a server-side cursor on a separate
+        connection and written with unordered insert_many calls, so memory use stays at one batch whatever the table
+        size.
+        :param batch_size: number of rows fetched from Postgres and documents sent to MongoDB at a time
+        :return: None
+        '''
+        read_connection = self.pool.getconn()
+        try:
+            for collection, query, to_document in MONGO_COLLECTIONS:
+                start = time.time()
+                count = self.stream_to_mongodb(read_connection, query, to_document, collection, batch_size)
+                end = time.time()
+                rate = round(count / (end - start)) if end > start else count
+                print("Inserted", count, "documents into", collection, "in", end - start, "seconds,", rate, "docs/sec")
+        finally:
+            self.pool.putconn(read_connection)
+
+    def parallel_insert_mongodb(self, processes=4, batch_size=10000, restart=False):
+        '''
+        Resumable version of insert_mongodb(). historical_stock_price is split into one shard per ticker and the shards
+        are copied by a pool of processes, each with its own Postgres and MongoDB connection. Every finished shard is
+        recorded in the migration_checkpoints collection and skipped when the migration is started again; documents
+        already written by an interrupted shard are ignored on the retry. The small tables are copied afterwards, each
+        replaced as a whole and checkpointed the same way.
+        :param processes: number of worker processes
+        :param batch_size: number of rows per fetch and per insert_many
+        :param restart: forget all checkpoints and migrate every shard again
+        :return: None
+        '''
+        checkpoints = self.database[CHECKPOINT_COLLECTION]
+        if restart:
+            checkpoints.drop()
+        done = set(checkpoint['_id'] for checkpoint in checkpoints.find({}, {'_id': 1}))
+
+        # every shard reads its rows by ticker, which without this index is one full scan of the table per ticker
+        self.cursor.execute("CREATE INDEX IF NOT EXISTS ticker_hist_idx ON historical_stock_price (ticker)")
+        self.cursor.execute("select distinct ticker from historical_stock_price")
+        tickers = [row[0] for row in self.cursor.fetchall()]
+        pending = [ticker for ticker in tickers if shard_id('historical_stock_price', ticker) not in done]
+        print(len(tickers) - len(pending), "of", len(tickers), "ticker shards already migrated")
 
+        start = time.time()
+        total = 0
+        migrate = functools.partial(migrate_ticker, batch_size=batch_size)
+        with multiprocessing.Pool(processes, init_migration_worker, (self.pg_params, self.mongo_params)) as pool:
+            for n, (ticker, count) in enumerate(pool.imap_unordered(migrate, pending)):
+                total += count
+                if (n + 1) % 500 == 0:
+                    print(n + 1, "of", len(pending), "shards migrated,", total, "documents")
+        end = time.time()
+        print("Inserted", total, "documents into historical_stock_price in", end - start, "seconds")
 
-    def runquery(self):
+        read_connection = self.pool.getconn()
+        try:
+            for collection, query, to_document in MONGO_COLLECTIONS[1:]:
+                if collection in done:
+                    continue
+                self.database[collection].delete_many({})
+                count = self.stream_to_mongodb(read_connection, query, to_document, collection, batch_size)
+                checkpoints.replace_one({'_id': collection}, {'_id': collection, 'collection': collection,
+                                                              'rows': count, 'finished_at': datetime.datetime.utcnow()},
+                                        upsert=True)
+                print("Inserted", count, "documents into", collection)
+        finally:
+            self.pool.putconn(read_connection)
+
+    def stream_to_mongodb(self, read_connection, query, to_document, collection, batch_size=10000):
+        '''
+        Copy the result of a query into a MongoDB collection batch by batch. Documents whose _id is already in the
+        collection, left by an earlier run, are skipped without failing the rest of their batch.
+        :param read_connection: psycopg2 connection not in autocommit mode, needed for the named cursor
+        :param query: select statement to copy
+        :param to_document: function turning a result row into a document
+        :param collection: name of the MongoDB collection
+        :param batch_size: number of rows per fetch and per insert_many
+        :return: number of documents inserted
+        '''
+        cursor = read_connection.cursor(name="mongo_" + collection)
+        cursor.itersize = batch_size
+        cursor.execute(query)
+        self.collection = self.database[collection]
+
+        count = 0
+        batch = []
+        for row in cursor:
+            batch.append(to_document(row))
+            if len(batch) == batch_size:
+                count += insert_idempotent(self.collection, batch)
+                batch = []
+        if batch:
+            count += insert_idempotent(self.collection, batch)
+
+        cursor.close()
+        read_connection.commit()
+        return count
+
+    def insert_mongodb_buckets(self, period='year', batch_size=1000):
         '''
-        execute queries for the questions we came up with on the stocks database
+        Alternative layout for historical_stock_price in MongoDB: one document per (ticker, year or month) holding the
+        dates and the ids, open, close, adj_close, low, high and volume of that period as parallel arrays. This needs a
+        few thousand times fewer documents and _id index entries than one document per day, and a per-ticker date range
+        is read from a handful of buckets. Rows without a ticker or a date are left out.
+        :param period: 'year' or 'month'
+        :param batch_size: number of bucket documents per insert_many
         :return: None
         '''
-        print("Executing queries without index")
-        print("Query 1")
         start = time.time()
-        self.cursor.execute("select distinct company_name, max((((close_price - "
-                            "adj_close_price) / close_price) * 100)) as MaxPercentageChange "
-                            "from company "
-                            "join historical_stock_price on  historical_stock_price.ticker = company.ticker "
-                            "where cast(stock_date as varchar) > '2000-01-01' "
-                            "and cast(stock_date as varchar) < '2018-12-31' "
-                            "and (((close_price - adj_close_price) / close_price) * 100) >= 15 "
-                            "group by company_name order by MaxPercentageChange")
-
+        read_connection = self.pool.getconn()
+        cursor = read_connection.cursor(name="mongo_buckets")
+        cursor.itersize = 10000
+        cursor.execute(MONGO_COLLECTIONS[0][1] + "where ticker is not null and stock_date is not null "
+                                                 "order by ticker, stock_date")
+        self.collection = self.database[BUCKET_COLLECTION]
+        self.collection.drop()
+
+        buckets = 0
+        batch = []
+        bucket = None
+        for row in cursor:
+            key = bucket_key(row[8], period)
+            if bucket is None or bucket['ticker'] != row[1] or bucket['period'] != key:
+                if bucket is not None:
+                    batch.append(bucket)
+                bucket = new_bucket(row[1], key)
+                bucket['start'] = to_datetime(row[8])
+                if len(batch) == batch_size:
+                    self.collection.insert_many(batch, ordered=False)
+                    buckets += len(batch)
+                    batch = []
+            bucket['end'] = to_datetime(row[8])
+            bucket['dates'].append(bucket['end'])
+            for field, column in BUCKET_FIELDS:
+                bucket[field].append(row[column])
+            bucket['count'] += 1
+        if bucket is not None:
+            batch.append(bucket)
+        if batch:
+            self.collection.insert_many(batch, ordered=False)
+            buckets += len(batch)
+
+        cursor.close()
+        self.pool.putconn(read_connection)
+        self.collection.create_index([('ticker', 1), ('start', 1)])
         end = time.time()
-        print("Time taken for query1", end-start, "seconds")
+        print("Inserted", buckets, "bucket documents into", BUCKET_COLLECTION, "in", end - start, "seconds")
 
-        print("Query 2")
+    def insert_mongodb_timeseries(self, batch_size=10000):
+        '''
+        Alternative layout for historical_stock_price in MongoDB using a native time-series collection with ticker as
+        the meta field, which buckets and compresses the daily documents on the server (MongoDB 5.0 or newer)
+        :param batch_size: number of rows per fetch and per insert_many
+        :return: None
+        '''
+        self.database.drop_collection(TIMESERIES_COLLECTION)
+        self.database.create_collection(TIMESERIES_COLLECTION, timeseries={'timeField': 'stock_date',
+                                                                           'metaField': 'ticker',
+                                                                           'granularity': 'hours'})
+        read_connection = self.pool.getconn()
+        try:
+            start = time.time()
+            count = self.stream_to_mongodb(read_connection, MONGO_COLLECTIONS[0][1] + "where stock_date is not null",
+                                           price_document, TIMESERIES_COLLECTION, batch_size)
+            end = time.time()
+            print("Inserted", count, "documents into", TIMESERIES_COLLECTION, "in", end - start, "seconds")
+        finally:
+            self.pool.putconn(read_connection)
+
+    def bucket_rows(self, tickers=None, start=None, end=None):
+        '''
+        Read daily prices back out of the bucket collection. Only buckets overlapping the date range are fetched.
+        :param tickers: list of tickers, None for all of them
+        :param start: exclusive lower bound on stock_date, None for no bound
+        :param end: exclusive upper bound on stock_date, None for no bound
+        :return: generator of dictionaries with ticker, stock_date, id, open, close, adj_close, low, high and volume
+        '''
+        condition = {}
+        if tickers is not None:
+            condition['ticker'] = {'$in': list(tickers)}
+        if end is not None:
+            condition['start'] = {'$lt': to_datetime(end)}
+        if start is not None:
+            condition['end'] = {'$gt': to_datetime(start)}
+
+        for bucket in self.database[BUCKET_COLLECTION].find(condition):
+            for i, stock_date in enumerate(bucket['dates']):
+                if start is not None and stock_date <= to_datetime(start):
+                    continue
+                if end is not None and stock_date >= to_datetime(end):
+                    break
+                row = {'ticker': bucket['ticker'], 'stock_date': stock_date}
+                for field, _ in BUCKET_FIELDS:
+                    row[field] = bucket[field][i]
+                yield row
+
+    def mongo_companies(self, sector=None, industry=None, exchange=None):
+        '''
+        :return: dictionary of ticker -> company_name for the companies in the given sector, industry and exchange,
+        matched case-insensitively like the ilike filters of runquery()
+        '''
+        condition = {}
+        if exchange is not None:
+            condition['exchange'] = {'$regex': '^' + re.escape(exchange) + '$', '$options': 'i'}
+        for field, name in (('sector', sector), ('industry', industry)):
+            if name is not None:
+                ids = [doc['_id'] for doc in self.database[field].find({'name': {'$regex': '^' + re.escape(name) + '$',
+                                                                                  '$options': 'i'}})]
+                condition[field] = {'$in': ids}
+        return dict((doc['ticker'], doc.get('company_name')) for doc in self.database['company'].find(condition))
+
+    def mongo_query1(self, start=datetime.date(2000, 1, 1), end=datetime.date(2018, 12, 31), min_change=15):
+        '''
+        Query 1 on the bucket layout: largest percentage gap between close and adjusted close per company
+        :return: list of (company_name, MaxPercentageChange) ordered by the change
+        '''
+        names = self.mongo_companies()
+        result = {}
+        for row in self.bucket_rows(start=start, end=end):
+            if row['close'] and row['adj_close'] is not None and row['ticker'] in names:
+                change = (row['close'] - row['adj_close']) / row['close'] * 100
+                name = names[row['ticker']]
+                if change >= min_change and change > result.get(name, float('-inf')):
+                    result[name] = change
+        return sorted(result.items(), key=lambda item: item[1])
+
+    def mongo_query2(self, start=datetime.date(1980, 1, 1), end=datetime.date(2018, 12, 31), min_average=30):
+        '''
+        Query 2 on the bucket layout: average open price of companies whose name ends in Limited or Inc. Like the and/or
+        precedence of the SQL version, (date range and '%Limited') or '%inc', the date range only applies to the Limited
+        companies; Inc companies are averaged over all their days.
+        :return: list of (company_name, AvgOpenPrice)
+        '''
+        companies = self.mongo_companies()
+        limited = [ticker for ticker, name in companies.items() if name and name.lower().endswith('limited')]
+        inc = [ticker for ticker, name in companies.items() if name and name.lower().endswith('inc')]
+        sums = {}
+        for row in itertools.chain(self.bucket_rows(limited, start, end), self.bucket_rows(inc)):
+            if row['open'] is not None:
+                total, count = sums.get(companies[row['ticker']], (0.0, 0))
+                sums[companies[row['ticker']]] = (total + row['open'], count + 1)
+        return [(name, total / count) for name, (total, count) in sums.items() if total / count > min_average]
+
+    def mongo_query3(self, sector='Technology', max_difference=0.02):
+        '''
+        Query 3 on the bucket layout: days where a company of the sector traded in a range narrower than max_difference
+        :return: list of (company_name, sector, diffInPrediction) ordered by company name
+        '''
+        names = self.mongo_companies(sector=sector)
+        result = []
+        for row in self.bucket_rows(names.keys()):
+            if row['high'] is not None and row['low'] is not None and row['high'] - row['low'] < max_difference:
+                result.append((names[row['ticker']], sector, row['high'] - row['low']))
+        return sorted(result, key=lambda item: item[0] or '')
+
+    def mongo_query4(self, exchange='NASDAQ', sector='Health Care', min_change=50):
+        '''
+        Query 4 on the bucket layout: volume on the days a company's close and adjusted close differ by min_change percent
+        :return: list of (company_name, volume) ordered by volume descending
+        '''
+        names = self.mongo_companies(sector=sector, exchange=exchange)
+        result = []
+        for row in self.bucket_rows(names.keys()):
+            if row['close'] and row['adj_close'] is not None and \
+                    (row['close'] - row['adj_close']) / row['close'] * 100 >= min_change:
+                result.append((names[row['ticker']], row['volume']))
+        return sorted(result, key=lambda item: item[1] or 0, reverse=True)
+
+    def mongo_query5(self, industry='Integrated Oil Companies', start=datetime.date(2015, 1, 1),
+                     end=datetime.date(2018, 1, 1)):
+        '''
+        Query 5 on the bucket layout: largest close minus open per company and volume, and that amount times the volume
+        :return: list of (company_name, MaxLoss, MaxAmountLoss) ordered by MaxLoss descending
+        '''
+        names = self.mongo_companies(industry=industry)
+        result = {}
+        for row in self.bucket_rows(names.keys(), start, end):
+            if row['close'] is not None and row['open'] is not None:
+                key = (names[row['ticker']], row['volume'])
+                result[key] = max(result.get(key, float('-inf')), row['close'] - row['open'])
+        return sorted(((name, loss, loss * volume if volume is not None else None)
+                       for (name, volume), loss in result.items()), key=lambda item: item[1], reverse=True)
+
+    def runquery(self, use_rollups=False):
+        '''
+        execute queries for the questions we came up with on the stocks database, through the result cache when
+        enable_cache() was called
+        :param use_rollups: answer the queries stocksrollup can route from rollup_month and rollup_year, built by
+        create_rollups(), instead of historical_stock_price, after bringing the months loaded since up to date
+        :return: dictionary of query name -> seconds taken
+        '''
+        if use_rollups:
+            self.refresh_pending_rollups()
+        print("Executing queries")
+        timings = {}
+        for name, query in QUERIES:
+            print(name)
+            params = None
+            if use_rollups and name in stocksrollup.ROUTES:
+                query, params = stocksrollup.ROUTES[name]()
+            start = time.time()
+            # the rows are fetched so that the timing includes sending the result to the client
+            if self.cache is not None:
+                rows = self.cached_query(query, params)
+            else:
+                self.cursor.execute(query, params)
+                rows = self.cursor.fetchall()
+
+            end = time.time()
+            print("Time taken for " + name.lower().replace(" ", ""), end - start, "seconds,", len(rows), "rows")
+            timings[name] = end - start
+            self.query_rows[name] = len(rows)
+
+        if self.cache is not None:
+            print("Result cache", self.cache.stats())
+        return timings
+
+    def create_rollups(self):
+        '''
+        Build the per ticker month and year rollups of historical_stock_price used by runquery(use_rollups=True)
+        :return: None
+        '''
+        print("Creating rollup tables")
         start = time.time()
-        self.cursor.execute("select distinct company_name, avg(open_price) as AvgOpenPrice from company "
-                            "join historical_stock_price on  historical_stock_price.ticker = company.ticker "
-                            "where cast(stock_date as varchar) > '1980-01-01' "
-                            "and cast(stock_date as varchar) < '2018-12-31' "
-                            "and company_name ilike '%Limited' or company_name ilike '%inc' group by company_name "
-                            "having avg(open_price) > 30")
-
+        stocksrollup.create(self.cursor)
         end = time.time()
-        print("Time taken for query2", end - start, "seconds")
+        print("Time taken for creating rollup tables", end - start, "seconds")
 
-        print("Query 3")
+    def refresh_rollups(self, start_date, end_date):
+        '''
+        Recompute only the rollup rows of the months and years holding start_date to end_date, after prices for those
+        dates were loaded or changed
+        :param start_date: first date affected
+        :param end_date: last date affected
+        :return: None
+        '''
         start = time.time()
-        self.cursor.execute("select company_name, sec.name, hist.high_price - hist.low_price "
-                            "as diffInPrediction from company as comp join sector as sec on comp.sector = sec.id "
-                            "join historical_stock_price as hist on comp.ticker = hist.ticker "
-                            "where sec.name ilike 'Technology' and hist.high_price - hist.low_price < 0.02 "
-                            "order by company_name")
-
+        stocksrollup.refresh(self.cursor, start_date, end_date)
         end = time.time()
-        print("Time taken for query3", end - start, "seconds")
+        print("Time taken for refreshing rollups from", start_date, "to", end_date, end - start, "seconds")
 
-        print("Query 4")
+    def refresh_pending_rollups(self):
+        '''
+        Recompute the rollup rows of the months prices were inserted, changed or deleted in since the rollups were last
+        brought up to date
+        :return: None
+        '''
         start = time.time()
-        self.cursor.execute("select company_name, volume from company as comp join sector as sec "
-                            "on comp.sector = sec.id "
-                            "join historical_stock_price as hist on comp.ticker = hist.ticker "
-                            "where comp.exchange ilike 'NASDAQ' and sec.name ilike 'Health Care' "
-                            "and (((close_price - adj_close_price) / close_price) * 100) >= 50 "
-                            "order by volume desc")
-
+        refreshed = stocksrollup.refresh_pending(self.cursor)
         end = time.time()
-        print("Time taken for query4", end - start, "seconds")
+        if refreshed is not None:
+            print("Time taken for refreshing rollups from", refreshed[0], "to", refreshed[1], end - start, "seconds")
 
-        print("Query 5")
-        start = time.time()
-        self.cursor.execute("select distinct comp.company_name, Max(hist.close_price - hist.open_price) as MaxLoss , "
-                            "((Max(hist.close_price - hist.open_price))*hist.volume) as MaxAmountLoss  "
-                            "from industry as ind "
-                            "join company as comp on ind.id = comp.industry "
-                            "join historical_stock_price as hist on hist.ticker = comp.ticker "
-                            "where cast(hist.stock_date as varchar) > '2015-01-01' "
-                            "and cast(hist.stock_date as varchar) < '2018-01-01' "
-                            "and ind.name ilike 'Integrated Oil Companies' "
-                            "group by comp.company_name, hist.volume order by MaxLoss desc")
+    def benchmark_rollups(self):
+        '''
+        Time the runquery workload on historical_stock_price and on the rollups, and check that the routed queries
+        return the same rows
+        :return: None
+        '''
+        before = self.runquery()
+        after = self.runquery(use_rollups=True)
+        print_speedup(before, after, "base tables", "rollups")
+        for name, query in QUERIES:
+            if name not in stocksrollup.ROUTES:
+                continue
+            self.cursor.execute(query)
+            expected = sorted((row[0], round(row[1], 6)) for row in self.cursor.fetchall())
+            self.cursor.execute(*stocksrollup.ROUTES[name]())
+            routed = sorted((row[0], round(row[1], 6)) for row in self.cursor.fetchall())
+            print(name, "rollup result matches" if expected == routed else "rollup result differs")
 
+    def column_store(self, snapshot=None):
+        '''
+        Load historical_stock_price into an in-process stockscolumns.ColumnStore
+        :param snapshot: directory written by export_snapshot() to load from, None to read Postgres
+        :return: ColumnStore
+        '''
+        start = time.time()
+        if snapshot is not None:
+            store = stockscolumns.ColumnStore.from_snapshot(snapshot)
+        else:
+            read_connection = self.pool.getconn()
+            try:
+                store = stockscolumns.ColumnStore.from_postgres(read_connection)
+            finally:
+                self.pool.putconn(read_connection)
         end = time.time()
-        print("Time taken for query5", end - start, "seconds")
+        print("Loaded", len(store), "rows into the column store in", end - start, "seconds")
+        return store
+
+    def benchmark_column_store(self, snapshot=None):
+        '''
+        Time the runquery workload in Postgres and on the column store, and check that both return the same rows
+        :param snapshot: directory written by export_snapshot() to load the column store from, None to read Postgres
+        :return: None
+        '''
+        store = self.column_store(snapshot)
+        before = self.runquery()
+        after, results = store.runquery()
+        print_speedup(before, after, "postgres", "column store")
+        for name, query in QUERIES:
+            self.cursor.execute(query)
+            same = stockscolumns.same_rows(self.cursor.fetchall(), results[name])
+            print(name, "column store result matches" if same else "column store result differs")
+
+    def enable_cache(self, max_entries=128, max_rows=1000000, path=None):
+        '''
+        Put a result cache in front of runquery() and cached_query(). Results are reused until a statement writes to
+        company, historical_stock_price, sector or industry.
+        :param max_entries: largest number of results kept
+        :param max_rows: largest total number of rows kept
+        :param path: file to persist the cache to, None to keep it in memory only
+        :return: None
+        '''
+        stockscache.install(self.cursor)
+        self.cache = stockscache.QueryCache(max_entries, max_rows, path)
+
+    def cached_query(self, query, params=None):
+        '''
+        Run a select statement, answering it from the result cache when the data hasn't changed since it was cached
+        :param query: select statement
+        :param params: query parameters
+        :return: list of result rows
+        '''
+        if self.cache is None:
+            self.enable_cache()
+        return self.cache.execute(self.cursor, query, params)
 
         ###################################################################################################
 
-    def createindex(self):
+    def benchmark(self, label, report_path, iterations=10, warmup=2, query_file=None):
+        '''
+        Benchmark the runquery workload with warm-up runs, measured iterations and query plans, and write the report as
+        JSON
+        :param label: description of the run, example- with index
+        :param report_path: file to write the JSON report to
+        :param iterations: number of measured executions per query
+        :param warmup: number of executions per query before measuring
+        :param query_file: also benchmark the queries in this file, example- queries_indexes_PHASEII.txt
+        :return: report dictionary
+        '''
+        queries = list(QUERIES)
+        if query_file is not None:
+            queries += stocksbench.load_queries(query_file)
+        print("Benchmarking queries " + label)
+        report = stocksbench.run(self.cursor, queries, label, iterations, warmup)
+        stocksbench.write_report(report, report_path)
+        return report
+
+    def benchmark_indexes(self, path="", iterations=10, warmup=2, query_file=None):
+        '''
+        Benchmark the workload without and with the indexes of createindex(), write both reports and compare them
+        :param path: directory for without_index.json and with_index.json, example- C:/users/files/
+        :param iterations: number of measured executions per query
+        :param warmup: number of executions per query before measuring
+        :param query_file: also benchmark the queries in this file
+        :return: list of names of the queries that are slower with the indexes, see stocksbench.compare()
+        '''
+        self.dropindex()
+        without_index = self.benchmark("without index", str(path) + "without_index.json", iterations, warmup, query_file)
+        self.createindex()
+        with_index = self.benchmark("with index", str(path) + "with_index.json", iterations, warmup, query_file)
+        return stocksbench.compare(without_index, with_index)
+
+    def createindex(self, skip_missing=False):
         '''
         Create indexes on columns of tables in the stocks database to speed up query execution.
+        :param skip_missing: leave out the indexes of tables that don't exist yet, such as sector and industry before
+        change_structure(), instead of failing
         :return: None
         '''
         print("Creating indexes")
 
         self.cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
 
-        self.cursor.execute("CREATE INDEX ticker_idx ON company (ticker);")
-        self.cursor.execute("CREATE INDEX ticker_hist_idx ON historical_stock_price (ticker);")
-        self.cursor.execute("CREATE INDEX company_name_idx ON company USING GIN (company_name gin_trgm_ops)")
-        self.cursor.execute("CREATE INDEX sector_name_idx ON sector USING GIN (name gin_trgm_ops)")
-        self.cursor.execute("CREATE INDEX company_exchange_idx ON company USING GIN (exchange gin_trgm_ops)")
-        self.cursor.execute("CREATE INDEX industry_name_idx ON industry USING GIN (name gin_trgm_ops)")
+        # BRIN only pays off when the heap is stored in date order; a table loaded ticker by ticker has every date in
+        # every block range, so the index is only built when the planner statistics show that order
+        self.cursor.execute("ANALYZE historical_stock_price (stock_date)")
+        self.cursor.execute("select abs(correlation) from pg_stats where tablename = 'historical_stock_price' "
+                            "and attname = 'stock_date' and schemaname = current_schema()")
+        correlation = self.cursor.fetchone()
+        date_ordered = correlation is not None and correlation[0] is not None and \
+            correlation[0] >= BRIN_MIN_CORRELATION
+        if not date_ordered:
+            print("Skipping BRIN index on stock_date, heap not in date order")
+
+        for table, statement in INDEXES:
+            if 'USING BRIN' in statement and not date_ordered:
+                continue
+            if skip_missing:
+                self.cursor.execute("select to_regclass(%s)", (table,))
+                if self.cursor.fetchone()[0] is None:
+                    continue
+            self.cursor.execute(statement)
 
         print("Indexes created")
 
-
-
     def dropindex(self):
         '''
         Drop indexes if they already exist
@@ -363,14 +1281,16 @@ class DatabaseConnection:
         '''
 
         self.cursor.execute("DROP INDEX IF EXISTS ticker_idx, ticker_hist_idx, company_name_idx, sector_name_idx, "
-                            "company_exchange_idx, industry_name_idx")
+                            "company_exchange_idx, industry_name_idx, ticker_date_hist_idx, date_brin_hist_idx, "
+                            "adj_close_gap_hist_idx")
 
     def droptables(self):
         '''
         Drop tables from stocks database if they exist
         :return:
         '''
-        self.cursor.execute("DROP TABLE IF EXISTS company, historical_stock_price, sector, industry CASCADE")
+        self.cursor.execute("DROP TABLE IF EXISTS company, historical_stock_price, sector, industry, rollup_month, "
+                            "rollup_year, rollup_pending CASCADE")
 
 if __name__ == '__main__':
     port = int(input("Enter port MongoDB's running on"))
@@ -379,15 +1299,29 @@ if __name__ == '__main__':
     pun = input("Enter postgres username")
     ppwd = input("Enter postgres password")
     path = str(input("Enter Path except the file name - example- C:/users/files/"))
+    workers = int(input("Enter number of parallel COPY workers for historical_stock_price") or 1)
+    fast_load = input("Use fast initial load (y/n)").strip().lower() == 'y'
+    partition = input("Partition historical_stock_price by 'year', 'decade' or leave empty for none").strip() or None
+    snapshot = input("Enter directory for a columnar snapshot of the prices or leave empty for none").strip() or None
 
     database_connection = DatabaseConnection(host,port, pdb, pun, ppwd)
     database_connection.droptables()
-    database_connection.create_tables()
-    database_connection.insert_tables(path)
-    database_connection.change_structure()
+    if fast_load:
+        database_connection.fast_initial_load(path, workers=workers, partition=partition)
+    else:
+        database_connection.create_tables(partition=partition)
+        database_connection.insert_tables(path, workers=workers)
+    database_connection.change_structure_ctas()
+    if snapshot:
+        database_connection.export_snapshot(snapshot)
     database_connection.func_depd_pruning()
     database_connection.insert_mongodb()
     database_connection.dropindex()
-    database_connection.runquery()
+    without_index = database_connection.runquery()
     database_connection.createindex()
-    database_connection.runquery()
\ No newline at end of file
+    with_index = database_connection.runquery()
+    print_speedup(without_index, with_index, "without index", "with index")
+    database_connection.create_rollups()
+    database_connection.benchmark_rollups()
+    if snapshot:
+        database_connection.benchmark_column_store(snapshot)
\ No newline at end of file
@@ -0,0 +1,351 @@
+import argparse
+import concurrent.futures
+import cProfile
+import datetime
+import io
+import json
+import os
+import pstats
+import threading
+import time
+import stocksdb
+import stocksphase2
+import StocksProject3
+try:
+    import resource
+except ImportError:
+    # not available on Windows; peak RSS is reported as null there
+    resource = None
+'''
+@author-name:rishab katta
+@author-name: milind kamath
+@author-name: Bikash Roy
+@author-name: Ankit Jain
+'''
+
+'''
+Non-interactive runner for the stages of phase 2 and phase 3 of the stocks project.
+
+The stages form a DAG: a stage starts as soon as every stage it depends on has finished, so independent ones, such as
+the MongoDB migration, the index build and functional dependency discovery after change_structure, run concurrently on
+connections from one shared pool. Every stage gets its own DatabaseConnection. The run report records, for every stage,
+its status, start offset, wall time, rows processed, the cumulative peak RSS of the process when it finished, how much
+the stage raised that peak and, when asked for, a cProfile dump and its top functions, and is written as JSON.
+
+Usage: python stockspipeline.py --config pipeline.json [--stages runquery generalize] [--profile] [--report run.json]
+'''
+
+# settings of a run; a config file and the command line override them
+DEFAULT_CONFIG = {'host': 'localhost', 'port': 27017, 'database': 'stocks', 'user': None, 'password': None,
+                  'path': '', 'workers': 1, 'fast_load': False, 'partition': None, 'min_support': 5,
+                  'min_confidence': 0.5, 'max_parallel': 3, 'stages': None, 'with_dependencies': True, 'profile': False,
+                  'profile_dir': 'profiles', 'report': 'pipeline_report.json'}
+
+
+def phase2(pipeline):
+    '''
+    :return: stocksphase2.DatabaseConnection on the shared pool
+    '''
+    config = pipeline.config
+    return stocksphase2.DatabaseConnection(config['host'], config['port'], config['database'], config['user'],
+                                           config['password'], pool=pipeline.pool)
+
+
+def phase3(pipeline):
+    '''
+    :return: StocksProject3.DatabaseConnection on the shared pool
+    '''
+    config = pipeline.config
+    return StocksProject3.DatabaseConnection(config['host'], config['database'], config['user'], config['password'],
+                                             pool=pipeline.pool)
+
+
+def count_rows(connection, table):
+    '''
+    :return: number of rows of table
+    '''
+    connection.cursor.execute("select count(*) from " + table)
+    return connection.cursor.fetchone()[0]
+
+
+# stage functions: run the stage on its connection and return the number of rows it processed, None where that
+# doesn't apply
+
+
+def create_tables(pipeline, connection):
+    connection.droptables()
+    connection.create_tables(fast_load=pipeline.config['fast_load'], partition=pipeline.config['partition'])
+    return None
+
+
+def insert_tables(pipeline, connection):
+    connection.insert_tables(pipeline.config['path'], workers=pipeline.config['workers'])
+    if pipeline.config['fast_load']:
+        connection.finish_fast_load()
+    return count_rows(connection, "historical_stock_price")
+
+
+def change_structure(pipeline, connection):
+    connection.change_structure_ctas()
+    return count_rows(connection, "company")
+
+
+def func_depd_pruning(pipeline, connection):
+    return len(connection.func_depd_pruning())
+
+
+def insert_mongodb(pipeline, connection):
+    connection.insert_mongodb()
+    return sum(connection.database[collection].estimated_document_count()
+               for collection, query, to_document in stocksphase2.MONGO_COLLECTIONS)
+
+
+def createindex(pipeline, connection):
+    connection.dropindex()
+    connection.createindex()
+    return None
+
+
+def runquery(pipeline, connection):
+    pipeline.results['query_timings'] = connection.runquery()
+    pipeline.results['query_rows'] = dict(connection.query_rows)
+    return sum(connection.query_rows.values())
+
+
+def cleaning_data(pipeline, connection):
+    return connection.cleaning_data()['rows']
+
+
+def integrating_data(pipeline, connection):
+    connection.refresh_integration()
+    return count_rows(connection, "fin_tech_companies")
+
+
+def popular_fintech_companies(pipeline, connection):
+    connection.drop_tables_with_pfc()
+    connection.popular_fintech_companies()
+    return count_rows(connection, "popular_fintech_companies")
+
+
+def generalize(pipeline, connection):
+    pipeline.results['levels'] = connection.generalize(pipeline.config['min_support'])
+    return sum(len(level) for level in pipeline.results['levels'])
+
+
+def association_rules(pipeline, connection):
+    return len(connection.association_rules(pipeline.config['min_confidence'], pipeline.results.get('levels')))
+
+
+# stage name -> (stages it depends on, connection factory, function returning the number of rows processed or None)
+STAGES = {'create_tables': ([], phase2, create_tables),
+          'insert_tables': (['create_tables'], phase2, insert_tables),
+          'change_structure': (['insert_tables'], phase2, change_structure),
+          'func_depd_pruning': (['change_structure'], phase2, func_depd_pruning),
+          'insert_mongodb': (['change_structure'], phase2, insert_mongodb),
+          'createindex': (['change_structure'], phase2, createindex),
+          'runquery': (['createindex'], phase2, runquery),
+          # phase 3 cleans historical_stock_price, so it waits for everything reading it in phase 2
+          'cleaning_data': (['func_depd_pruning', 'insert_mongodb', 'runquery'], phase3, cleaning_data),
+          'integrating_data': (['cleaning_data'], phase3, integrating_data),
+          'popular_fintech_companies': (['integrating_data'], phase3, popular_fintech_companies),
+          'generalize': (['popular_fintech_companies'], phase3, generalize),
+          'association_rules': (['generalize'], phase3, association_rules)}
+
+
+def peak_rss_kb():
+    '''
+    :return: peak resident set size of the process so far in kilobytes, None where it can't be read. This is a
+    high-water mark of the whole process that never goes down.
+    '''
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kilobytes on Linux
+    return peak // 1024 if os.uname().sysname == 'Darwin' else peak
+
+
+class Pipeline:
+    '''
+    Run a set of STAGES in dependency order, concurrently where the DAG allows, and record a report
+    '''
+
+    def __init__(self, config, stages=STAGES):
+        '''
+        :param config: dictionary with the keys of DEFAULT_CONFIG
+        :param stages: dictionary of stage name -> (dependencies, connection factory, function)
+        '''
+        self.config = config
+        self.stages = stages
+        self.pool = None
+        self.results = {}
+        self.report = {}
+        self.profile_lock = threading.Lock()
+
+    def selected(self):
+        '''
+        :return: names of the stages to run: the configured ones, with everything they depend on unless
+        with_dependencies is off, all by default
+        '''
+        if not self.config['stages']:
+            return list(self.stages)
+        if not self.config['with_dependencies']:
+            return [name for name in self.stages if name in self.config['stages']]
+        wanted = set()
+        pending = list(self.config['stages'])
+        while pending:
+            name = pending.pop()
+            if name not in self.stages:
+                raise KeyError("unknown stage " + name)
+            if name not in wanted:
+                wanted.add(name)
+                pending.extend(self.stages[name][0])
+        return [name for name in self.stages if name in wanted]
+
+    def profiled(self, name):
+        '''
+        :return: True if the stage is to be run under cProfile
+        '''
+        profile = self.config['profile']
+        return profile is True or (isinstance(profile, list) and name in profile)
+
+    def run_stage(self, name, started):
+        '''
+        Run one stage on a connection of its own
+        :param name: stage name
+        :param started: time.time() of the start of the run
+        :return: report entry of the stage
+        '''
+        dependencies, factory, function = self.stages[name]
+        entry = {'depends_on': dependencies, 'start_offset': time.time() - started}
+        start_rss = peak_rss_kb()
+        start = time.time()
+        connection = factory(self)
+        profiler = None
+        # only one profiler can be active at a time, so a stage overlapping a profiled one runs unprofiled
+        if self.profiled(name) and self.profile_lock.acquire(blocking=False):
+            profiler = cProfile.Profile()
+        try:
+            if profiler is not None:
+                profiler.enable()
+            entry['rows'] = function(self, connection)
+            entry['status'] = 'succeeded'
+        finally:
+            if profiler is not None:
+                profiler.disable()
+                self.profile_lock.release()
+            connection.close()
+            entry['wall_seconds'] = time.time() - start
+            entry['cumulative_peak_rss_kb'] = peak_rss_kb()
+            # how far the stage pushed the process high-water mark; stages running at the same time share the growth
+            entry['peak_rss_growth_kb'] = None if start_rss is None else \
+                entry['cumulative_peak_rss_kb'] - start_rss
+
+        if profiler is not None:
+            os.makedirs(self.config['profile_dir'], exist_ok=True)
+            entry['profile'] = os.path.join(self.config['profile_dir'], name + ".prof")
+            profiler.dump_stats(entry['profile'])
+            text = io.StringIO()
+            pstats.Stats(profiler, stream=text).sort_stats('cumulative').print_stats(15)
+            entry['profile_top'] = text.getvalue()
+        elif self.profiled(name):
+            entry['profile'] = None
+            entry['profile_skipped'] = "another stage was being profiled at the same time"
+        return entry
+
+    def run(self):
+        '''
+        Run the selected stages; a failed stage skips everything depending on it and lets the rest go on
+        :return: report dictionary
+        '''
+        names = self.selected()
+        pg_params = dict(host=str(self.config['host']), database=str(self.config['database']),
+                         user=str(self.config['user']), password=str(self.config['password']))
+        # every running stage holds a connection; the COPY workers of the load stage open their own
+        self.pool = stocksdb.ConnectionPool(pg_params, workers=self.config['max_parallel'])
+        config = dict(self.config, password='***' if self.config['password'] else None)
+        self.report = {'started_at': datetime.datetime.now().isoformat(), 'config': config, 'stages': {}}
+        stages = self.report['stages']
+
+        started = time.time()
+        done = set()
+        running = {}
+        with concurrent.futures.ThreadPoolExecutor(self.config['max_parallel']) as executor:
+            while len(stages) < len(names):
+                for name in names:
+                    if name in stages or name in running.values():
+                        continue
+                    dependencies = [dependency for dependency in self.stages[name][0] if dependency in names]
+                    if any(stages.get(dependency, {}).get('status') in ('failed', 'skipped')
+                           for dependency in dependencies):
+                        stages[name] = {'depends_on': self.stages[name][0], 'status': 'skipped'}
+                        print("Skipping " + name)
+                    elif all(dependency in done for dependency in dependencies):
+                        print("Starting " + name)
+                        running[executor.submit(self.run_stage, name, started)] = name
+                if not running:
+                    continue
+                finished, waiting = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    try:
+                        stages[name] = future.result()
+                        done.add(name)
+                        print("Time taken for " + name, stages[name]['wall_seconds'], "seconds")
+                    except Exception as e:
+                        stages[name] = {'depends_on': self.stages[name][0], 'status': 'failed', 'error': repr(e)}
+                        print(name + " failed: " + repr(e))
+
+        self.pool.closeall()
+        self.report['total_seconds'] = time.time() - started
+        self.report['cumulative_peak_rss_kb'] = peak_rss_kb()
+        return self.report
+
+
+def load_config(arguments=None):
+    '''
+    Build the configuration from DEFAULT_CONFIG, the JSON config file and the command line, in that order
+    :param arguments: list of command line arguments, None for sys.argv
+    :return: configuration dictionary
+    '''
+    parser = argparse.ArgumentParser(description="Run the stocks pipeline stages as a DAG")
+    parser.add_argument('--config', help="JSON file with any of the keys " + ", ".join(DEFAULT_CONFIG))
+    parser.add_argument('--host')
+    parser.add_argument('--port', type=int)
+    parser.add_argument('--database')
+    parser.add_argument('--user')
+    parser.add_argument('--password')
+    parser.add_argument('--path', help="directory of the downloaded zip, example- C:/users/files/")
+    parser.add_argument('--workers', type=int, help="parallel COPY workers for historical_stock_price")
+    parser.add_argument('--fast-load', dest='fast_load', action='store_true', default=None)
+    parser.add_argument('--partition', choices=['year', 'decade'])
+    parser.add_argument('--min-support', dest='min_support', type=int)
+    parser.add_argument('--min-confidence', dest='min_confidence', type=float)
+    parser.add_argument('--max-parallel', dest='max_parallel', type=int, help="stages run at the same time")
+    parser.add_argument('--stages', nargs='+', choices=list(STAGES),
+                        help="stages to run together with what they depend on; all by default")
+    parser.add_argument('--only', dest='with_dependencies', action='store_false', default=None,
+                        help="run just the listed stages, on a database their dependencies already prepared")
+    parser.add_argument('--profile', nargs='*', help="profile every stage, or only the ones listed")
+    parser.add_argument('--profile-dir', dest='profile_dir')
+    parser.add_argument('--report', help="file to write the JSON run report to")
+    options = vars(parser.parse_args(arguments))
+
+    config = dict(DEFAULT_CONFIG)
+    config_file_name = options.pop('config')
+    if config_file_name:
+        with open(config_file_name) as config_file:
+            config.update(json.load(config_file))
+    if options['profile'] is not None:
+        options['profile'] = options['profile'] or True
+    config.update((key, value) for key, value in options.items() if value is not None)
+    if config['password'] is None:
+        config['password'] = os.environ.get('PGPASSWORD')
+    return config
+
+
+if __name__ == '__main__':
+    config = load_config()
+    report = Pipeline(config).run()
+    with open(str(config['report']), 'w') as report_file:
+        json.dump(report, report_file, indent=2, default=str)
+    print("Run report written to " + str(config['report']))
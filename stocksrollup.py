@@ -0,0 +1,294 @@
+import datetime
+import stockscache
+'''
+@author-name:rishab katta
+@author-name: milind kamath
+@author-name: Bikash Roy
+@author-name: Ankit Jain
+'''
+
+'''
+Per-(ticker, month) and per-(ticker, year) rollups of historical_stock_price, and a router answering the per-company
+aggregates of the query workload from them.
+
+A date range is split into whole years, read from rollup_year, whole months, read from rollup_month, and the days at
+its edges, read from historical_stock_price, so a query over decades touches a few thousand summary rows per ticker
+instead of every daily price. The rollups are rebuilt for the months a load touched, never as a whole: statement
+triggers on historical_stock_price record the date range every insert, update, delete or COPY touched in
+rollup_pending, and refresh_pending() recomputes just those months before the rollups are read.
+'''
+
+# ((close - adj close) / close) * 100, the adjusted close gap of query 1 and query 4
+ADJ_RATIO = "(((close_price - adj_close_price) / nullif(close_price, 0)) * 100)"
+
+ROLLUP_COLUMNS = "ticker, period_start, days, min_low, max_low, min_high, max_high, first_open, last_close, " \
+                 "sum_open, count_open, max_spread, total_volume, max_adj_ratio"
+
+MONTH_SELECT = "select ticker, date_trunc('month', stock_date)::date, count(*), min(low_price), max(low_price), " \
+               "min(high_price), max(high_price), (array_agg(open_price order by stock_date))[1], " \
+               "(array_agg(close_price order by stock_date desc))[1], sum(open_price), count(open_price), " \
+               "max(high_price - low_price), sum(volume), max(" + ADJ_RATIO + ") " \
+               "from historical_stock_price where stock_date is not null"
+
+YEAR_SELECT = "select ticker, date_trunc('year', period_start)::date, sum(days), min(min_low), max(max_low), " \
+              "min(min_high), max(max_high), (array_agg(first_open order by period_start))[1], " \
+              "(array_agg(last_close order by period_start desc))[1], sum(sum_open), sum(count_open), " \
+              "max(max_spread), sum(total_volume), max(max_adj_ratio) from rollup_month"
+
+# (exclusive lower bound, exclusive upper bound) of the date filters of the routed queries
+QUERY1_RANGE = (datetime.date(2000, 1, 1), datetime.date(2018, 12, 31))
+QUERY2_RANGE = (datetime.date(1980, 1, 1), datetime.date(2018, 12, 31))
+
+# exclusive bounds around all of the data, leaving whole years between them
+ALL_DATES = (datetime.date(1899, 12, 31), datetime.date(2100, 1, 1))
+
+
+def next_month(date):
+    '''
+    :return: first day of the month after date
+    '''
+    return (date.replace(day=28) + datetime.timedelta(days=4)).replace(day=1)
+
+
+def split_range(start, end):
+    '''
+    Split the dates start <= stock_date < end into whole years, whole months and left over days
+    :return: dictionary of 'year', 'month' and 'day' -> list of (start, end) half open ranges
+    '''
+    pieces = {'year': [], 'month': [], 'day': []}
+    first_year = start if (start.month, start.day) == (1, 1) else datetime.date(start.year + 1, 1, 1)
+    last_year = datetime.date(end.year, 1, 1)
+    if first_year < last_year:
+        pieces['year'].append((first_year, last_year))
+        rest = [(start, first_year), (last_year, end)]
+    else:
+        rest = [(start, end)]
+
+    for low, high in rest:
+        if low >= high:
+            continue
+        first_month = low if low.day == 1 else next_month(low)
+        last_month = high.replace(day=1)
+        if first_month < last_month:
+            pieces['month'].append((first_month, last_month))
+            if low < first_month:
+                pieces['day'].append((low, first_month))
+            if last_month < high:
+                pieces['day'].append((last_month, high))
+        else:
+            pieces['day'].append((low, high))
+    return pieces
+
+
+def range_source(after, before):
+    '''
+    Build a subquery with the ticker, max_adj_ratio, sum_open and count_open of every rollup row or day making up the
+    dates after < stock_date < before
+    :param after: exclusive lower bound
+    :param before: exclusive upper bound
+    :return: (sql, list of parameters)
+    '''
+    pieces = split_range(after + datetime.timedelta(days=1), before)
+    parts = []
+    params = []
+    for table, level in (('rollup_year', 'year'), ('rollup_month', 'month')):
+        for low, high in pieces[level]:
+            parts.append("select ticker, max_adj_ratio, sum_open, count_open from " + table +
+                         " where period_start >= %s and period_start < %s")
+            params += [low, high]
+    for low, high in pieces['day']:
+        parts.append("select ticker, max(" + ADJ_RATIO + "), sum(open_price), count(open_price) "
+                     "from historical_stock_price where stock_date >= %s and stock_date < %s group by ticker")
+        params += [low, high]
+    return "(" + " union all ".join(parts) + ")", params
+
+
+def query1():
+    '''
+    Query 1 answered from the rollups: largest adjusted close gap per company, for companies where it reached 15%
+    :return: (sql, list of parameters)
+    '''
+    source, params = range_source(*QUERY1_RANGE)
+    return "select distinct company_name, max(p.max_adj_ratio) as MaxPercentageChange from company " \
+           "join " + source + " as p(ticker, max_adj_ratio, sum_open, count_open) on p.ticker = company.ticker " \
+           "group by company_name having max(p.max_adj_ratio) >= 15 order by MaxPercentageChange", params
+
+
+def query2():
+    '''
+    Query 2 answered from the rollups, with the same and/or precedence as the SQL version: the date range applies to
+    the '%Limited' companies and the '%inc' companies are averaged over all of their history
+    :return: (sql, list of parameters)
+    '''
+    limited, limited_params = range_source(*QUERY2_RANGE)
+    inc, inc_params = range_source(*ALL_DATES)
+    return "select company_name, sum(sum_open) / nullif(sum(count_open), 0) as AvgOpenPrice from (" \
+           "select company_name, p.sum_open, p.count_open from company join " + limited + \
+           " as p(ticker, max_adj_ratio, sum_open, count_open) on p.ticker = company.ticker " \
+           "where company_name ilike '%%Limited' and not company_name ilike '%%inc' union all " \
+           "select company_name, p.sum_open, p.count_open from company join " + inc + \
+           " as p(ticker, max_adj_ratio, sum_open, count_open) on p.ticker = company.ticker " \
+           "where company_name ilike '%%inc') as companies group by company_name " \
+           "having sum(sum_open) / nullif(sum(count_open), 0) > 30", limited_params + inc_params
+
+
+# queries of stocksphase2.QUERIES the rollups can answer, by name
+ROUTES = {'Query 1': query1, 'Query 2': query2}
+
+
+# trigger function adding the stock_date range of the rows a statement changed to rollup_pending; the transition tables
+# are only referenced in the branches of the operations whose trigger declares them
+PENDING_FUNCTION = "create or replace function rollup_mark_pending() returns trigger as $$ begin " \
+                   "if TG_OP = 'TRUNCATE' then " \
+                   "insert into rollup_pending values (date '1900-01-01', date '2099-12-31'); " \
+                   "elsif TG_OP = 'INSERT' then " \
+                   "insert into rollup_pending select min(stock_date), max(stock_date) from new_rows " \
+                   "having count(stock_date) > 0; " \
+                   "elsif TG_OP = 'DELETE' then " \
+                   "insert into rollup_pending select min(stock_date), max(stock_date) from old_rows " \
+                   "having count(stock_date) > 0; " \
+                   "else " \
+                   "insert into rollup_pending select min(stock_date), max(stock_date) from " \
+                   "(select stock_date from old_rows union all select stock_date from new_rows) changed " \
+                   "having count(stock_date) > 0; " \
+                   "end if; return null; end $$ language plpgsql"
+
+# trigger name -> event and transition tables
+PENDING_TRIGGERS = [('rollup_pending_insert', "after insert on historical_stock_price referencing new table as new_rows"),
+                    ('rollup_pending_update', "after update on historical_stock_price "
+                                              "referencing old table as old_rows new table as new_rows"),
+                    ('rollup_pending_delete', "after delete on historical_stock_price referencing old table as old_rows"),
+                    ('rollup_pending_truncate', "after truncate on historical_stock_price")]
+
+
+def install(cursor):
+    '''
+    Create rollup_pending and the triggers filling it. Needs to run again after historical_stock_price is dropped and
+    created again, see reinstall().
+    :param cursor: psycopg2 cursor
+    :return: None
+    '''
+    cursor.execute("create table if not exists rollup_pending(low date not null, high date not null)")
+    cursor.execute(PENDING_FUNCTION)
+    for name, event in PENDING_TRIGGERS:
+        cursor.execute("drop trigger if exists " + name + " on historical_stock_price")
+        cursor.execute("create trigger " + name + " " + event + " for each statement execute procedure "
+                       "rollup_mark_pending()")
+
+
+def reinstall(cursor):
+    '''
+    Put the triggers back after historical_stock_price was rebuilt, if rollups were ever created in this database
+    :param cursor: psycopg2 cursor
+    :return: None
+    '''
+    cursor.execute("select to_regclass('rollup_pending')")
+    if cursor.fetchone()[0] is not None:
+        install(cursor)
+
+
+def tracked(cursor):
+    '''
+    :return: True if every trigger recording changes of historical_stock_price is in place, so the rollups plus
+    rollup_pending describe the current prices
+    '''
+    cursor.execute("select count(*) from pg_trigger where tgrelid = to_regclass('historical_stock_price') "
+                   "and tgname = any(%s)", ([name for name, event in PENDING_TRIGGERS],))
+    return cursor.fetchone()[0] == len(PENDING_TRIGGERS)
+
+
+def create(cursor):
+    '''
+    Build rollup_month from historical_stock_price and rollup_year from rollup_month, and start recording the dates later
+    statements change
+    :param cursor: psycopg2 cursor of an autocommit connection
+    :return: None
+    '''
+    cursor.execute("BEGIN")
+    try:
+        build(cursor)
+        install(cursor)
+        cursor.execute("delete from rollup_pending")
+        # the result cache must see the new tables, which also drops the triggers the old ones had
+        stockscache.reinstall(cursor)
+        cursor.execute("COMMIT")
+    except Exception:
+        cursor.execute("ROLLBACK")
+        raise
+    for table in ('rollup_month', 'rollup_year'):
+        cursor.execute("ANALYZE " + table)
+
+
+def build(cursor):
+    '''
+    Drop and create rollup_month and rollup_year filled from historical_stock_price
+    :param cursor: psycopg2 cursor
+    :return: None
+    '''
+    cursor.execute("DROP TABLE IF EXISTS rollup_month, rollup_year")
+    for table, select in (('rollup_month', MONTH_SELECT), ('rollup_year', YEAR_SELECT)):
+        cursor.execute("create table " + table + "(ticker varchar, period_start date, days bigint, min_low float, "
+                       "max_low float, min_high float, max_high float, first_open float, last_close float, "
+                       "sum_open float, count_open bigint, max_spread float, total_volume numeric, "
+                       "max_adj_ratio float)")
+        cursor.execute("insert into " + table + "(" + ROLLUP_COLUMNS + ") " + select + " group by 1, 2")
+        cursor.execute("create unique index " + table + "_idx on " + table + " (period_start, ticker)")
+
+
+def refresh(cursor, start_date, end_date):
+    '''
+    Recompute the rollup rows of every month and year holding a date between start_date and end_date, after rows for
+    those dates were loaded, changed or deleted
+    :param cursor: psycopg2 cursor
+    :param start_date: first date affected
+    :param end_date: last date affected
+    :return: None
+    '''
+    cursor.execute("BEGIN")
+    try:
+        recompute(cursor, start_date, end_date)
+        cursor.execute("COMMIT")
+    except Exception:
+        cursor.execute("ROLLBACK")
+        raise
+
+
+def refresh_pending(cursor):
+    '''
+    Recompute the months and years holding every date recorded in rollup_pending since the last refresh, in one
+    transaction with clearing them
+    :param cursor: psycopg2 cursor of an autocommit connection
+    :return: (first date, last date) refreshed, None if nothing was pending
+    '''
+    if not tracked(cursor):
+        raise RuntimeError("historical_stock_price changes aren't recorded for the rollups, which may be out of date; "
+                           "run create_rollups() again")
+    cursor.execute("BEGIN")
+    try:
+        cursor.execute("with claimed as (delete from rollup_pending returning low, high) "
+                       "select min(low), max(high) from claimed")
+        start_date, end_date = cursor.fetchone()
+        if start_date is not None:
+            recompute(cursor, start_date, end_date)
+        cursor.execute("COMMIT")
+    except Exception:
+        cursor.execute("ROLLBACK")
+        raise
+    return None if start_date is None else (start_date, end_date)
+
+
+def recompute(cursor, start_date, end_date):
+    '''
+    Replace the rollup rows of the months and years holding start_date to end_date, inside the caller's transaction
+    '''
+    month_low = start_date.replace(day=1)
+    month_high = next_month(end_date)
+    year_low = datetime.date(start_date.year, 1, 1)
+    year_high = datetime.date(end_date.year + 1, 1, 1)
+
+    cursor.execute("delete from rollup_month where period_start >= %s and period_start < %s", (month_low, month_high))
+    cursor.execute("insert into rollup_month(" + ROLLUP_COLUMNS + ") " + MONTH_SELECT +
+                   " and stock_date >= %s and stock_date < %s group by 1, 2", (month_low, month_high))
+    cursor.execute("delete from rollup_year where period_start >= %s and period_start < %s", (year_low, year_high))
+    cursor.execute("insert into rollup_year(" + ROLLUP_COLUMNS + ") " + YEAR_SELECT +
+                   " where period_start >= %s and period_start < %s group by 1, 2", (year_low, year_high))
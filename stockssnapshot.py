@@ -0,0 +1,268 @@
+import datetime
+import json
+import os
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+import stockscolumns
+'''
+@author-name:rishab katta
+@author-name: milind kamath
+@author-name: Bikash Roy
+@author-name: Ankit Jain
+'''
+
+'''
+Columnar snapshot of historical_stock_price for analytics that don't need the database.
+
+The table is exported once, sorted by ticker and date, into one file per year or decade of stock_date, with the
+exchange, name, sector and industry of every company alongside each row. Those columns and ticker are dictionary
+encoded against dictionaries shared by all files, so they cost an int32 per row. Arrow IPC files are written
+uncompressed and read back through a memory map, which gives column buffers pointing straight into the page cache
+instead of Python tuples; Parquet files are smaller but decoded on read.
+'''
+
+MANIFEST = "_snapshot.json"
+
+DICTIONARY_COLUMNS = ['ticker', 'exchange', 'company_name', 'sector', 'industry']
+
+SCHEMA = pa.schema([('id', pa.int64())] +
+                   [(column, pa.dictionary(pa.int32(), pa.string())) for column in DICTIONARY_COLUMNS] +
+                   [('open_price', pa.float64()), ('close_price', pa.float64()), ('adj_close_price', pa.float64()),
+                    ('low_price', pa.float64()), ('high_price', pa.float64()), ('volume', pa.int64()),
+                    ('stock_date', pa.date32())])
+
+# company columns after change_structure(), with sector and industry resolved to their names
+COMPANY_QUERY = stockscolumns.COMPANY_QUERY
+
+PRICE_QUERY = "select id, ticker, open_price, close_price, adj_close_price, low_price, high_price, volume, stock_date " \
+              "from historical_stock_price"
+
+# sort expression of the partition a row belongs to, None for an unpartitioned export sorting by ticker alone
+PARTITION_KEYS = {None: None, 'year': "date_part('year', stock_date)",
+                  'decade': "floor(date_part('year', stock_date) / 10) * 10"}
+
+FILE_EXTENSIONS = {'arrow': '.arrow', 'parquet': '.parquet'}
+
+
+def partition_of(stock_date, partition):
+    '''
+    :return: directory name of the partition holding stock_date, example- year=1998
+    '''
+    if partition is None:
+        return "all"
+    if stock_date is None:
+        return partition + "=null"
+    year = stock_date.year if partition == 'year' else stock_date.year // 10 * 10
+    return partition + "=" + str(year)
+
+
+class CompanyDictionaries:
+    '''
+    Dictionaries of the dictionary encoded columns, built from the company table, and for every company the position of
+    its values in them
+    '''
+
+    def __init__(self, rows):
+        '''
+        :param rows: (ticker, exchange, company_name, sector, industry) of every company, as read with COMPANY_QUERY
+        '''
+        self.position = dict((row[0], i) for i, row in enumerate(rows))
+        self.dictionaries = {}
+        self.codes = {}
+        for n, column in enumerate(DICTIONARY_COLUMNS):
+            values = sorted(set(row[n] for row in rows if row[n] is not None))
+            index = dict((value, i) for i, value in enumerate(values))
+            self.dictionaries[column] = pa.array(values, pa.string())
+            self.codes[column] = np.array([index.get(row[n], -1) for row in rows] + [-1], dtype=np.int32)
+
+    def encode(self, tickers):
+        '''
+        :param tickers: list of tickers, one per row
+        :return: dictionary of column name -> DictionaryArray for the rows
+        '''
+        companies = np.array([self.position.get(ticker, -1) for ticker in tickers], dtype=np.int64)
+        encoded = {}
+        for column in DICTIONARY_COLUMNS:
+            indices = self.codes[column][companies]
+            encoded[column] = pa.DictionaryArray.from_arrays(pa.array(indices, mask=indices < 0),
+                                                             self.dictionaries[column])
+        return encoded
+
+    def record_batch(self, rows):
+        '''
+        :param rows: historical_stock_price rows as read with PRICE_QUERY
+        :return: RecordBatch with SCHEMA
+        '''
+        columns = list(zip(*rows))
+        encoded = self.encode(columns[1])
+        arrays = [pa.array(columns[0], pa.int64())] + [encoded[column] for column in DICTIONARY_COLUMNS] + \
+                 [pa.array(columns[i], SCHEMA.field(name).type) for i, name in
+                  zip(range(2, 9), ['open_price', 'close_price', 'adj_close_price', 'low_price', 'high_price',
+                                    'volume', 'stock_date'])]
+        return pa.RecordBatch.from_arrays(arrays, schema=SCHEMA)
+
+
+def open_writer(file_name, file_format):
+    '''
+    :return: writer with a write_batch() and a close() method for one snapshot file
+    '''
+    if file_format == 'parquet':
+        return pq.ParquetWriter(file_name, SCHEMA)
+    return pa.ipc.new_file(file_name, SCHEMA)
+
+
+def export(connection, path, partition='year', file_format='arrow', batch_size=100000):
+    '''
+    Write historical_stock_price and the company columns to a snapshot directory. Rows are read through a server-side
+    cursor ordered by partition, ticker and stock_date, so every file is written in one go and sorted.
+    :param connection: psycopg2 connection not in autocommit mode, needed for the named cursor
+    :param path: directory of the snapshot, created if needed
+    :param partition: None for a single file, 'year' or 'decade' for one file per year or decade of stock_date
+    :param file_format: 'arrow' for memory-mappable Arrow IPC files or 'parquet'
+    :param batch_size: number of rows fetched and written at a time
+    :return: dictionary of partition directory -> number of rows
+    '''
+    cursor = connection.cursor()
+    cursor.execute(COMPANY_QUERY)
+    dictionaries = CompanyDictionaries(cursor.fetchall())
+    cursor.close()
+
+    os.makedirs(str(path), exist_ok=True)
+    cursor = connection.cursor(name="snapshot_prices")
+    cursor.itersize = batch_size
+    sort = [PARTITION_KEYS[partition], "ticker", "stock_date"]
+    cursor.execute(PRICE_QUERY + " order by " + ", ".join(key for key in sort if key is not None))
+
+    counts = {}
+    current = None
+    writer = None
+    try:
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            start = 0
+            while start < len(rows):
+                key = partition_of(rows[start][8], partition)
+                end = start
+                while end < len(rows) and partition_of(rows[end][8], partition) == key:
+                    end += 1
+                if key != current:
+                    if writer is not None:
+                        writer.close()
+                    os.makedirs(os.path.join(str(path), key), exist_ok=True)
+                    writer = open_writer(os.path.join(str(path), key, "part-0" + FILE_EXTENSIONS[file_format]),
+                                         file_format)
+                    current = key
+                writer.write_batch(dictionaries.record_batch(rows[start:end]))
+                counts[key] = counts.get(key, 0) + end - start
+                start = end
+    finally:
+        if writer is not None:
+            writer.close()
+        cursor.close()
+        connection.commit()
+
+    with open(os.path.join(str(path), MANIFEST), 'w') as manifest:
+        json.dump({'table': 'historical_stock_price', 'partition': partition, 'format': file_format,
+                   'sorted_by': ['ticker', 'stock_date'], 'partitions': counts,
+                   'exported_at': datetime.datetime.now().isoformat()}, manifest, indent=2)
+    return counts
+
+
+def read_manifest(path):
+    '''
+    :return: manifest dictionary written by export()
+    '''
+    with open(os.path.join(str(path), MANIFEST)) as manifest:
+        return json.load(manifest)
+
+
+def read_table(path, columns=None, partitions=None):
+    '''
+    Open a snapshot. Arrow IPC files are memory-mapped, so the columns of the table share memory with the page cache
+    and nothing is read from disk until it is used.
+    :param path: directory written by export()
+    :param columns: column names to read, None for all of them
+    :param partitions: partition directories to read, example- ['year=2017', 'year=2018'], None for all of them
+    :return: pyarrow Table sorted by ticker and stock_date within every partition
+    '''
+    manifest = read_manifest(path)
+    tables = []
+    for key in sorted(manifest['partitions']):
+        if partitions is not None and key not in partitions:
+            continue
+        file_name = os.path.join(str(path), key, "part-0" + FILE_EXTENSIONS[manifest['format']])
+        if manifest['format'] == 'arrow':
+            table = pa.ipc.open_file(pa.memory_map(file_name, 'r')).read_all()
+            tables.append(table.select(columns) if columns is not None else table)
+        else:
+            tables.append(pq.read_table(file_name, columns=columns, memory_map=True))
+    if not tables:
+        return SCHEMA.empty_table() if columns is None else SCHEMA.empty_table().select(columns)
+    return pa.concat_tables(tables)
+
+
+def to_numpy(column):
+    '''
+    :param column: ChunkedArray of a numeric or date column
+    :return: numpy array, a view on the mapped file when the column is a single chunk without nulls
+    '''
+    if column.num_chunks == 1 and column.null_count == 0:
+        return column.chunk(0).to_numpy(zero_copy_only=False)
+    return column.to_numpy()
+
+
+def codes(column):
+    '''
+    :param column: ChunkedArray of a dictionary encoded column
+    :return: (numpy int32 array of positions in the dictionary with -1 for null, dictionary as a list)
+    '''
+    column = pa.table({'column': column}).unify_dictionaries().column(0)
+    if column.num_chunks == 0:
+        return np.zeros(0, dtype=np.int32), []
+    indices = np.concatenate([chunk.indices.fill_null(-1).to_numpy() for chunk in column.chunks])
+    return indices.astype(np.int32), column.chunk(0).dictionary.to_pylist()
+
+
+def column_codes(table, columns=None):
+    '''
+    Encode columns of a snapshot as integers for stocksfd.discover(). Dictionary columns keep their dictionary
+    positions, null getting the position after the last entry so it is a value of its own like in stocksfd.encode_rows().
+    :param table: pyarrow Table returned by read_table()
+    :param columns: column names, None for all of them
+    :return: (list of column names, list with one numpy int32 array of codes per column)
+    '''
+    columns = columns or table.column_names
+    encoded = []
+    for name in columns:
+        column = table.column(name)
+        if not pa.types.is_dictionary(column.type):
+            column = pc.dictionary_encode(column.combine_chunks(), null_encoding='encode')
+        indices, dictionary = codes(column)
+        encoded.append(np.where(indices < 0, len(dictionary), indices).astype(np.int32))
+    return columns, encoded
+
+
+def surge_transactions(table, threshold=1.2, sectors=('finance', 'technology')):
+    '''
+    Transactions for stocksmining.apriori() straight from a snapshot: the tickers of the given sectors whose close was
+    more than threshold times their open, grouped by day, like popular_fintech_companies
+    :param table: pyarrow Table returned by read_table()
+    :param threshold: close / open ratio a day needs to exceed
+    :param sectors: sector names, compared case-insensitively, None for all sectors
+    :return: dictionary of stock_date -> set of tickers
+    '''
+    mask = pc.greater(table.column('close_price'), pc.multiply(table.column('open_price'), threshold))
+    if sectors is not None:
+        sector = pc.utf8_lower(table.column('sector').cast(pa.string()))
+        mask = pc.and_(mask, pc.is_in(sector, value_set=pa.array([name.lower() for name in sectors])))
+    surges = table.filter(pc.fill_null(mask, False))
+
+    transactions = {}
+    for stock_date, ticker in zip(surges.column('stock_date').to_pylist(),
+                                  surges.column('ticker').cast(pa.string()).to_pylist()):
+        transactions.setdefault(stock_date, set()).add(ticker)
+    return transactions
@@ -0,0 +1,212 @@
+import contextlib
+import csv
+import datetime
+import gzip
+import io
+import multiprocessing
+import time
+import zipfile
+import stockscopy
+import stocksmining
+'''
+@author-name:rishab katta
+@author-name: milind kamath
+@author-name: Bikash Roy
+@author-name: Ankit Jain
+'''
+
+'''
+Surge events straight from the downloaded dataset, without a database.
+
+popular_fintech_companies holds the days a finance or technology company closed more than 20% above its open. Here the
+same rows are found by streaming historical_stock_prices.csv out of the zip line by line against a set of the tickers
+of the wanted sectors read from historical_stocks.csv, so only the surge rows are ever parsed past their ticker. The
+events feed stocksmining.apriori() directly or are kept in a small gzipped csv. Large inputs can be cut into line
+aligned blocks scanned by a pool of processes.
+'''
+
+PRICES_FILE = "historical_stock_prices.csv"
+STOCKS_FILE = "historical_stocks.csv"
+
+# sectors of fin_tech_companies, compared case-insensitively like its ilike filters
+FINTECH_SECTORS = ('FINANCE', 'TECHNOLOGY')
+
+# ticker set and threshold of a worker process, set once by init_worker()
+worker_tickers = None
+worker_threshold = None
+
+
+@contextlib.contextmanager
+def open_member(path, file_name):
+    '''
+    Open a csv of the dataset for reading, either inside a zip archive or as a plain file
+    :param path: path of the zip archive or of the csv itself
+    :param file_name: base name of the csv inside the archive
+    :return: binary file-like object, closed with the archive at the end of the with block
+    '''
+    if str(path).lower().endswith('.zip'):
+        with zipfile.ZipFile(str(path), "r") as zip_ref:
+            with zip_ref.open(stockscopy.find_member(zip_ref, file_name)) as stream:
+                yield stream
+    else:
+        with open(str(path), "rb") as stream:
+            yield stream
+
+
+def sector_tickers(path, sectors=FINTECH_SECTORS):
+    '''
+    Read the tickers of companies in the given sectors
+    :param path: zip archive holding historical_stocks.csv, or historical_stocks.csv itself
+    :param sectors: sector names, None for every company
+    :return: set of tickers
+    '''
+    wanted = None if sectors is None else set(sector.upper() for sector in sectors)
+    with open_member(path, STOCKS_FILE) as stream:
+        reader = csv.reader(io.TextIOWrapper(stream, encoding='utf-8'))
+        header = next(reader)
+        sector = header.index('sector')
+        return set(row[0] for row in reader if row and (wanted is None or row[sector].upper() in wanted))
+
+
+def surge_events(lines, tickers, threshold=1.2):
+    '''
+    Filter price csv lines down to surge events. The ticker is checked before anything else is parsed.
+    :param lines: iterable of str lines of historical_stock_prices.csv without its header
+    :param tickers: set of tickers to keep, None for all
+    :param threshold: close / open ratio a day needs to exceed
+    :return: generator of (ticker, stock_date, open_price, close_price)
+    '''
+    for line in lines:
+        ticker, comma, rest = line.partition(',')
+        if not comma or tickers is not None and ticker not in tickers:
+            continue
+        fields = rest.split(',')
+        if not fields[0] or not fields[1]:
+            continue
+        open_price = float(fields[0])
+        close_price = float(fields[1])
+        if close_price > open_price * threshold:
+            yield ticker, datetime.date.fromisoformat(fields[6].strip()), open_price, close_price
+
+
+def stream_events(prices_path, tickers, threshold=1.2):
+    '''
+    Stream surge events out of historical_stock_prices.csv in one process
+    :param prices_path: zip archive holding historical_stock_prices.csv, or the csv itself
+    :param tickers: set of tickers to keep, None for all
+    :param threshold: close / open ratio a day needs to exceed
+    :return: generator of (ticker, stock_date, open_price, close_price)
+    '''
+    with open_member(prices_path, PRICES_FILE) as stream:
+        lines = io.TextIOWrapper(stream, encoding='utf-8')
+        next(lines)  # header
+        for event in surge_events(lines, tickers, threshold):
+            yield event
+
+
+def init_worker(tickers, threshold):
+    '''
+    Process pool initializer handing every worker the ticker set once instead of with every block
+    '''
+    global worker_tickers, worker_threshold
+    worker_tickers = tickers
+    worker_threshold = threshold
+
+
+def scan_block(block):
+    '''
+    :param block: bytes holding complete csv lines
+    :return: list of surge events in the block
+    '''
+    return list(surge_events(block.decode('utf-8').splitlines(), worker_tickers, worker_threshold))
+
+
+def parallel_events(prices_path, tickers, threshold=1.2, processes=4, chunk_size=stockscopy.CHUNK_SIZE):
+    '''
+    Stream surge events with the csv cut into line aligned blocks of about chunk_size bytes scanned by a pool of
+    processes. Decompression stays in this process; events come back in file order.
+    :param prices_path: zip archive holding historical_stock_prices.csv, or the csv itself
+    :param tickers: set of tickers to keep, None for all
+    :param threshold: close / open ratio a day needs to exceed
+    :param processes: number of worker processes
+    :param chunk_size: size of the blocks
+    :return: generator of (ticker, stock_date, open_price, close_price)
+    '''
+    with open_member(prices_path, PRICES_FILE) as stream:
+        stream.readline()  # header
+        with multiprocessing.Pool(processes, init_worker, (tickers, threshold)) as pool:
+            for events in pool.imap(scan_block, stockscopy.line_blocks(stream, chunk_size)):
+                for event in events:
+                    yield event
+
+
+def extract(path, threshold=1.2, sectors=FINTECH_SECTORS, processes=1, chunk_size=stockscopy.CHUNK_SIZE):
+    '''
+    Surge events of the companies of some sectors, straight from the dataset
+    :param path: the downloaded zip archive holding both csv files, example-
+    C:/users/files/daily-historical-stock-prices-1970-2018.zip
+    :param threshold: close / open ratio a day needs to exceed
+    :param sectors: sector names, None for every company
+    :param processes: 1 to scan in this process, more to use a process pool
+    :param chunk_size: size of the blocks handed to the pool
+    :return: generator of (ticker, stock_date, open_price, close_price)
+    '''
+    tickers = sector_tickers(path, sectors)
+    if processes > 1:
+        return parallel_events(path, tickers, threshold, processes, chunk_size)
+    return stream_events(path, tickers, threshold)
+
+
+def transactions(events):
+    '''
+    :param events: iterable of surge events
+    :return: dictionary of stock_date -> set of tickers, as stocksmining.apriori() takes them
+    '''
+    result = {}
+    for ticker, stock_date, open_price, close_price in events:
+        result.setdefault(stock_date, set()).add(ticker)
+    return result
+
+
+def write_events(events, file):
+    '''
+    Write surge events to a gzipped csv of ticker, stock_date, open_price, close_price
+    :return: number of events written
+    '''
+    count = 0
+    with gzip.open(str(file), 'wt', newline='') as events_file:
+        writer = csv.writer(events_file)
+        for ticker, stock_date, open_price, close_price in events:
+            writer.writerow([ticker, stock_date.isoformat(), repr(open_price), repr(close_price)])
+            count += 1
+    return count
+
+
+def read_events(file):
+    '''
+    Read back the surge events written by write_events()
+    :return: generator of (ticker, stock_date, open_price, close_price)
+    '''
+    with gzip.open(str(file), 'rt', newline='') as events_file:
+        for ticker, stock_date, open_price, close_price in csv.reader(events_file):
+            yield ticker, datetime.date.fromisoformat(stock_date), float(open_price), float(close_price)
+
+
+if __name__ == '__main__':
+    path = str(input("Enter path of daily-historical-stock-prices-1970-2018.zip"))
+    threshold = float(input("Enter close / open ratio of a surge") or 1.2)
+    sectors = input("Enter comma separated sectors or leave empty for finance and technology").strip()
+    processes = int(input("Enter number of processes") or 1)
+    output = input("Enter file to write the events to or leave empty to mine them").strip()
+    min_support = int(input("Enter minimum support in days for the itemsets") or 5)
+
+    sectors = tuple(sector.strip() for sector in sectors.split(',')) if sectors else FINTECH_SECTORS
+    start = time.time()
+    events = extract(path, threshold, sectors, processes)
+    if output:
+        print("Wrote", write_events(events, output), "events to", output)
+    else:
+        levels = stocksmining.apriori(transactions(events), min_support)
+        for k, level in enumerate(levels, 1):
+            print("Total number of itemsets in l" + str(k) + ": " + str(len(level)))
+    print("Time taken for surge events", time.time() - start, "seconds")
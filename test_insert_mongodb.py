@@ -0,0 +1,140 @@
+import datetime
+import pytest
+pytest.importorskip("psycopg2")
+errors = pytest.importorskip("pymongo.errors")
+import stocksphase2
+'''
+@author-name:rishab katta
+@author-name: milind kamath
+@author-name: Bikash Roy
+@author-name: Ankit Jain
+'''
+
+'''
+Checks of the batched insert_many(ordered=False) path of insert_mongodb() against an in-memory collection, without
+Postgres or MongoDB, and one check of re-running it against a real mongod, see conftest.py.
+'''
+
+
+class FakeCollection:
+    '''
+    Collection keeping documents by _id that answers insert_many(ordered=False) like MongoDB: every document is tried,
+    and duplicate _ids are reported in one BulkWriteError at the end
+    '''
+
+    def __init__(self, existing=()):
+        self.documents = dict((document['_id'], document) for document in existing)
+        self.batches = []
+
+    def insert_many(self, documents, ordered=True):
+        assert ordered is False
+        self.batches.append(len(documents))
+        write_errors = []
+        inserted = 0
+        for index, document in enumerate(documents):
+            if document['_id'] in self.documents:
+                write_errors.append({'index': index, 'code': 11000, 'errmsg': "E11000 duplicate key error"})
+            else:
+                self.documents[document['_id']] = document
+                inserted += 1
+        if write_errors:
+            raise errors.BulkWriteError({'writeErrors': write_errors, 'writeConcernErrors': [], 'nInserted': inserted})
+
+
+class FailingCollection(FakeCollection):
+    '''
+    Collection rejecting every batch with an error other than a duplicate key
+    '''
+
+    def insert_many(self, documents, ordered=True):
+        raise errors.BulkWriteError({'writeErrors': [{'index': 0, 'code': 121, 'errmsg': "Document failed validation"}],
+                                     'writeConcernErrors': [], 'nInserted': 0})
+
+
+class FakeCursor:
+    '''
+    Named cursor over a fixed list of rows
+    '''
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.itersize = None
+        self.closed = False
+
+    def execute(self, query, params=None):
+        pass
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def close(self):
+        self.closed = True
+
+
+class FakeConnection:
+    def __init__(self, rows):
+        self.rows = rows
+        self.commits = 0
+
+    def cursor(self, name=None):
+        return FakeCursor(self.rows)
+
+    def commit(self):
+        self.commits += 1
+
+
+def price_rows(ids):
+    return [(i, 'T' + str(i % 3), 1.0, 2.0, 2.0, 0.5, 2.5, 100, datetime.date(2018, 1, 1)) for i in ids]
+
+
+def database_connection(collection):
+    connection = stocksphase2.DatabaseConnection.__new__(stocksphase2.DatabaseConnection)
+    connection.database = {'historical_stock_price': collection}
+    return connection
+
+
+def test_batches_of_batch_size():
+    collection = FakeCollection()
+    count = database_connection(collection).stream_to_mongodb(
+        FakeConnection(price_rows(range(25))), "", stocksphase2.price_document, 'historical_stock_price', batch_size=10)
+    assert count == 25
+    assert collection.batches == [10, 10, 5]
+    assert sorted(collection.documents) == list(range(25))
+
+
+def test_duplicate_keys_are_skipped_and_not_counted():
+    collection = FakeCollection(stocksphase2.price_document(row) for row in price_rows([3, 4, 12, 24]))
+    read_connection = FakeConnection(price_rows(range(25)))
+    count = database_connection(collection).stream_to_mongodb(
+        read_connection, "", stocksphase2.price_document, 'historical_stock_price', batch_size=10)
+    assert count == 21
+    assert sorted(collection.documents) == list(range(25))
+    assert read_connection.commits == 1
+
+
+def test_rerun_inserts_nothing():
+    collection = FakeCollection()
+    connection = database_connection(collection)
+    rows = price_rows(range(7))
+    assert connection.stream_to_mongodb(FakeConnection(rows), "", stocksphase2.price_document,
+                                        'historical_stock_price', batch_size=3) == 7
+    assert connection.stream_to_mongodb(FakeConnection(rows), "", stocksphase2.price_document,
+                                        'historical_stock_price', batch_size=3) == 0
+    assert len(collection.documents) == 7
+
+
+def test_other_write_errors_are_raised():
+    with pytest.raises(errors.BulkWriteError):
+        stocksphase2.insert_idempotent(FailingCollection(), [stocksphase2.price_document(row) for row in price_rows([1])])
+
+
+def test_rerun_against_mongod(mongo_database):
+    connection = database_connection(mongo_database['historical_stock_price'])
+    mongo_database['historical_stock_price'].insert_many(
+        [stocksphase2.price_document(row) for row in price_rows([3, 4, 12, 24])])
+    rows = price_rows(range(25))
+    assert connection.stream_to_mongodb(FakeConnection(rows), "", stocksphase2.price_document,
+                                        'historical_stock_price', batch_size=10) == 21
+    assert connection.stream_to_mongodb(FakeConnection(rows), "", stocksphase2.price_document,
+                                        'historical_stock_price', batch_size=10) == 0
+    assert sorted(mongo_database['historical_stock_price'].distinct('_id')) == list(range(25))
@@ -0,0 +1,67 @@
+import pytest
+pytest.importorskip("psycopg2")
+import stockscache
+'''
+@author-name:rishab katta
+@author-name: milind kamath
+@author-name: Bikash Roy
+@author-name: Ankit Jain
+'''
+
+'''
+Checks that the result cache never serves a result computed before a write, also after a versioned table was dropped
+and created again. Needs Postgres, see conftest.py.
+'''
+
+COUNT_QUERY = "select count(*) from company"
+
+
+def create_company(cursor):
+    cursor.execute("create table company(ticker varchar primary key, company_name varchar)")
+    cursor.execute("insert into company values ('AAA', 'A Inc')")
+
+
+def rebuild_company(cursor, reinstall):
+    # the swap of change_structure_ctas(): a new table takes the place of the old one
+    cursor.execute("BEGIN")
+    cursor.execute("create table company_new as select * from company")
+    cursor.execute("DROP TABLE company CASCADE")
+    cursor.execute("ALTER TABLE company_new RENAME TO company")
+    if reinstall:
+        stockscache.reinstall(cursor)
+    cursor.execute("COMMIT")
+
+
+def test_write_is_a_miss(pg_connection):
+    cursor = pg_connection.cursor()
+    create_company(cursor)
+    stockscache.install(cursor)
+    cache = stockscache.QueryCache()
+
+    assert cache.execute(cursor, COUNT_QUERY) == [(1,)]
+    assert cache.execute(cursor, COUNT_QUERY) == [(1,)]
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    cursor.execute("insert into company values ('BBB', 'B Limited')")
+    assert cache.execute(cursor, COUNT_QUERY) == [(2,)]
+    assert cache.misses == 2
+
+
+@pytest.mark.parametrize("reinstall", [True, False])
+def test_rebuilt_table_stays_tracked(pg_connection, reinstall):
+    cursor = pg_connection.cursor()
+    create_company(cursor)
+    stockscache.install(cursor)
+    cache = stockscache.QueryCache()
+    assert cache.execute(cursor, COUNT_QUERY) == [(1,)]
+
+    # without reinstall() the cache has to notice the missing trigger on its own
+    rebuild_company(cursor, reinstall)
+    assert cache.execute(cursor, COUNT_QUERY) == [(1,)]
+    misses = cache.misses
+
+    for count, ticker in [(2, 'BBB'), (3, 'CCC')]:
+        cursor.execute("insert into company values (%s, 'x')", (ticker,))
+        assert cache.execute(cursor, COUNT_QUERY) == [(count,)]
+        misses += 1
+        assert cache.misses == misses
@@ -0,0 +1,97 @@
+import zipfile
+import pytest
+psycopg2 = pytest.importorskip("psycopg2")
+import conftest
+import stockscopy
+'''
+@author-name:rishab katta
+@author-name: milind kamath
+@author-name: Bikash Roy
+@author-name: Ankit Jain
+'''
+
+'''
+Checks that a parallel COPY publishes all of its rows or none, and gives back every connection it opened. Needs
+Postgres, see conftest.py.
+'''
+
+COLUMNS = ['ticker', 'volume']
+
+
+def write_zip(path, lines):
+    zip_path = path / "prices.csv.zip"
+    with zipfile.ZipFile(str(zip_path), "w") as zip_ref:
+        zip_ref.writestr("data/prices.csv", "ticker,volume\n" + "".join(line + "\n" for line in lines))
+    return zip_path
+
+
+class Connections:
+    '''
+    Opens connections into the test's schema, failing after the first fail_after ones, and records those released
+    '''
+
+    def __init__(self, pg_connection, fail_after=None):
+        self.search_path = pg_connection.cursor()
+        self.search_path.execute("show search_path")
+        self.search_path = self.search_path.fetchone()[0]
+        self.fail_after = fail_after
+        self.opened = []
+        self.released = []
+
+    def connect(self):
+        if self.fail_after is not None and len(self.opened) == self.fail_after:
+            raise psycopg2.OperationalError("too many connections")
+        connection = psycopg2.connect(conftest.PG_DSN, options="-c search_path=" + self.search_path)
+        self.opened.append(connection)
+        return connection
+
+    def release(self, connection):
+        self.released.append(connection)
+        connection.close()
+
+
+def create_prices(pg_connection):
+    cursor = pg_connection.cursor()
+    cursor.execute("create table prices(id bigserial primary key, ticker varchar not null, volume bigint)")
+    return cursor
+
+
+def test_rows_are_published(pg_connection, tmp_path):
+    cursor = create_prices(pg_connection)
+    connections = Connections(pg_connection)
+    zip_path = write_zip(tmp_path, ["T" + str(i) + "," + str(i) for i in range(1000)])
+    results = stockscopy.parallel_copy_from_zip(connections.connect, zip_path, "prices.csv", "prices", COLUMNS, 3,
+                                                chunk_size=256, release=connections.release)
+    assert sum(rows for rows, seconds in results) == 1000
+    cursor.execute("select count(*), sum(volume), count(distinct id) from prices")
+    assert cursor.fetchone() == (1000, sum(range(1000)), 1000)
+    cursor.execute("select to_regclass('prices_staging')")
+    assert cursor.fetchone() == (None,)
+    assert connections.released == connections.opened
+
+
+def test_failed_worker_publishes_nothing(pg_connection, tmp_path):
+    cursor = create_prices(pg_connection)
+    connections = Connections(pg_connection)
+    lines = ["T" + str(i) + "," + str(i) for i in range(1000)]
+    lines[700] = ",1"
+    zip_path = write_zip(tmp_path, lines)
+    with pytest.raises(psycopg2.Error):
+        stockscopy.parallel_copy_from_zip(connections.connect, zip_path, "prices.csv", "prices", COLUMNS, 3,
+                                          chunk_size=256, release=connections.release)
+    cursor.execute("select count(*) from prices")
+    assert cursor.fetchone() == (0,)
+    cursor.execute("select to_regclass('prices_staging')")
+    assert cursor.fetchone() == (None,)
+    assert connections.released == connections.opened
+
+
+def test_failed_connect_releases_the_others(pg_connection, tmp_path):
+    create_prices(pg_connection)
+    connections = Connections(pg_connection, fail_after=2)
+    zip_path = write_zip(tmp_path, ["T1,1"])
+    with pytest.raises(psycopg2.OperationalError):
+        stockscopy.parallel_copy_from_zip(connections.connect, zip_path, "prices.csv", "prices", COLUMNS, 3,
+                                          release=connections.release)
+    assert len(connections.opened) == 2
+    assert connections.released == connections.opened
@@ -0,0 +1,91 @@
+import datetime
+import pytest
+pytest.importorskip("psycopg2")
+import stockscache
+import stocksrollup
+'''
+@author-name:rishab katta
+@author-name: milind kamath
+@author-name: Bikash Roy
+@author-name: Ankit Jain
+'''
+
+'''
+Checks that the rollups follow the prices loaded after create(), and that the result cache notices when they do. Needs
+Postgres, see conftest.py.
+'''
+
+MARCH_QUERY = "select ticker, days, max_high from rollup_month where period_start = date '2010-03-01' order by ticker"
+
+
+def create_prices(cursor):
+    cursor.execute("create table historical_stock_price(id serial primary key, ticker varchar, open_price float, "
+                   "close_price float, adj_close_price float, low_price float, high_price float, volume bigint, "
+                   "stock_date date)")
+    insert_price(cursor, 'AAA', datetime.date(2010, 1, 4), 10.0)
+    insert_price(cursor, 'AAA', datetime.date(2010, 2, 1), 12.0)
+
+
+def insert_price(cursor, ticker, stock_date, high_price):
+    cursor.execute("insert into historical_stock_price(ticker, open_price, close_price, adj_close_price, low_price, "
+                   "high_price, volume, stock_date) values (%s, 1, 2, 2, 0.5, %s, 100, %s)",
+                   (ticker, high_price, stock_date))
+
+
+def test_loaded_months_are_refreshed(pg_connection):
+    cursor = pg_connection.cursor()
+    create_prices(cursor)
+    stocksrollup.create(cursor)
+    assert stocksrollup.refresh_pending(cursor) is None
+
+    insert_price(cursor, 'AAA', datetime.date(2010, 3, 5), 20.0)
+    insert_price(cursor, 'BBB', datetime.date(2010, 3, 8), 30.0)
+    cursor.execute("delete from historical_stock_price where stock_date = date '2010-01-04'")
+    assert stocksrollup.refresh_pending(cursor) == (datetime.date(2010, 1, 4), datetime.date(2010, 3, 8))
+
+    cursor.execute(MARCH_QUERY)
+    assert cursor.fetchall() == [('AAA', 1, 20.0), ('BBB', 1, 30.0)]
+    cursor.execute("select ticker, period_start from rollup_month order by period_start, ticker")
+    assert [row[1].month for row in cursor.fetchall()] == [2, 3, 3]
+    cursor.execute("select ticker, days from rollup_year order by ticker")
+    assert cursor.fetchall() == [('AAA', 2), ('BBB', 1)]
+    cursor.execute("select count(*) from rollup_pending")
+    assert cursor.fetchone() == (0,)
+
+
+def test_cached_rollup_query_sees_refresh(pg_connection):
+    cursor = pg_connection.cursor()
+    create_prices(cursor)
+    stockscache.install(cursor)
+    stocksrollup.create(cursor)
+    cache = stockscache.QueryCache()
+    assert cache.execute(cursor, MARCH_QUERY) == []
+
+    insert_price(cursor, 'AAA', datetime.date(2010, 3, 5), 20.0)
+    stocksrollup.refresh_pending(cursor)
+    assert cache.execute(cursor, MARCH_QUERY) == [('AAA', 1, 20.0)]
+    assert (cache.hits, cache.misses) == (0, 2)
+
+    # create() drops and creates the rollup tables again
+    stocksrollup.create(cursor)
+    insert_price(cursor, 'AAA', datetime.date(2010, 3, 9), 25.0)
+    stocksrollup.refresh_pending(cursor)
+    assert cache.execute(cursor, MARCH_QUERY) == [('AAA', 2, 25.0)]
+
+
+def test_rebuilt_prices_without_triggers_refuse_refresh(pg_connection):
+    cursor = pg_connection.cursor()
+    create_prices(cursor)
+    stocksrollup.create(cursor)
+
+    cursor.execute("BEGIN")
+    cursor.execute("create table historical_stock_price_new as select * from historical_stock_price")
+    cursor.execute("DROP TABLE historical_stock_price CASCADE")
+    cursor.execute("ALTER TABLE historical_stock_price_new RENAME TO historical_stock_price")
+    cursor.execute("COMMIT")
+    with pytest.raises(RuntimeError):
+        stocksrollup.refresh_pending(cursor)
+
+    stocksrollup.reinstall(cursor)
+    insert_price(cursor, 'AAA', datetime.date(2010, 3, 5), 20.0)
+    assert stocksrollup.refresh_pending(cursor) == (datetime.date(2010, 3, 5), datetime.date(2010, 3, 5))
@@ -0,0 +1,81 @@
+import datetime
+import pytest
+psycopg2 = pytest.importorskip("psycopg2")
+import StocksProject3
+'''
+@author-name:rishab katta
+@author-name: milind kamath
+@author-name: Bikash Roy
+@author-name: Ankit Jain
+'''
+
+'''
+Checks that update_lattice() keeps the counts of levels built by generalize_sql(), also with tickers whose order under
+the column collation differs from Python's. Needs Postgres, see conftest.py.
+'''
+
+# 'a1' sorts before 'B1' under linguistic collations and after it bytewise
+TICKERS = ['a1', 'B1', 'c1']
+
+
+def create_tables(cursor, collation):
+    ticker = "varchar" + (' collate "' + collation + '"' if collation else "")
+    cursor.execute("create table company(ticker " + ticker + " primary key, company_name varchar)")
+    cursor.execute("create table historical_stock_price(id serial primary key, ticker " + ticker + ", "
+                   "open_price float, close_price float, stock_date date)")
+    cursor.execute("create table fin_tech_companies(ticker " + ticker + ")")
+    for ticker in TICKERS:
+        cursor.execute("insert into company values (%s, %s)", (ticker, ticker.upper() + " Inc"))
+        cursor.execute("insert into fin_tech_companies values (%s)", (ticker,))
+
+
+def surge(cursor, tickers, stock_date):
+    for ticker in tickers:
+        cursor.execute("insert into historical_stock_price(ticker, open_price, close_price, stock_date) "
+                       "values (%s, 1, 2, %s)", (ticker, stock_date))
+
+
+def linguistic_collation(cursor):
+    # ICU's root collation where the server has it, the database collation otherwise
+    try:
+        cursor.execute("select 'a1' < 'B1' collate \"unicode\"")
+    except psycopg2.Error:
+        return None
+    return "unicode" if cursor.fetchone()[0] else None
+
+
+def build_lattice(cursor):
+    create_tables(cursor, linguistic_collation(cursor))
+    for day in range(6):
+        surge(cursor, TICKERS, datetime.date(2018, 1, 1 + day))
+    connection = StocksProject3.DatabaseConnection.__new__(StocksProject3.DatabaseConnection)
+    connection.cursor = cursor
+    connection.popular_fintech_companies()
+    connection.generalize_sql()
+    return connection
+
+
+def check_update(cursor, connection):
+    surge(cursor, ['a1', 'B1'], datetime.date(2018, 1, 8))
+    connection.update_lattice(datetime.date(2018, 1, 8), datetime.date(2018, 1, 8))
+
+    cursor.execute("select ticker1, ticker2, count from l2")
+    assert sorted((tuple(sorted(row[:2])), row[2]) for row in cursor.fetchall()) == \
+        [(('B1', 'a1'), 7), (('B1', 'c1'), 6), (('a1', 'c1'), 6)]
+    cursor.execute("select ticker1, ticker2, ticker3, count from l3")
+    assert [(tuple(sorted(row[:3])), row[3]) for row in cursor.fetchall()] == [(('B1', 'a1', 'c1'), 6)]
+    assert connection.load_levels()[1] == {('B1', 'a1'): 7, ('B1', 'c1'): 6, ('a1', 'c1'): 6}
+
+
+def test_update_of_sql_levels(pg_connection):
+    cursor = pg_connection.cursor()
+    check_update(cursor, build_lattice(cursor))
+
+
+def test_update_of_levels_in_collation_order(pg_connection):
+    # the rows as an older generalize_sql() left them under a linguistic database collation
+    cursor = pg_connection.cursor()
+    connection = build_lattice(cursor)
+    cursor.execute("update l2 set ticker1 = ticker2, ticker2 = ticker1 where ticker1 = 'B1' and ticker2 = 'a1'")
+    cursor.execute("update l3 set ticker1 = 'a1', ticker2 = 'B1'")
+    check_update(cursor, connection)